@@ -0,0 +1,115 @@
+"""
+Benchmark do cleansed_to_csv.py: exportação em shards com downloads sequenciais e em paralelo.
+
+Gera uma tabela cleansed_data sintética e a exporta com os clientes falsos do
+fake_bigquery.py: o extract grava shards em um bucket local, e cada download é limitado a
+`--stream-mbps` MB/s, para simular a vazão de um único stream de download. Confere que as
+exportações geram o mesmo arquivo, com um único cabeçalho, e que nenhum shard temporário fica
+no bucket, inclusive quando um download falha.
+
+Uso: python benchmark_cleansed_to_csv.py --rows 2000000 --workdir /tmp/prouni_export
+"""
+import argparse
+import datetime
+import filecmp
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import pyarrow as pa
+
+import cleansed_to_csv
+from fake_bigquery import FakeBlob, FakeClient, FakeStorageClient
+from raw_to_cleansed_local import CLEANSED_SCHEMA
+
+
+def generate_table(rows, seed=0):
+    rng = random.Random(seed)
+    tipos = [("BOLSA INTEGRAL", "INTEGRAL"), ("BOLSA PARCIAL 50%", "PARCIAL"), ("BOLSA COMPLEMENTAR 25%", "COMPLEMENTAR")]
+    ufs = [("SUDESTE", "SP", "SÃO PAULO"), ("SUL", "PR", "CURITIBA"), ("NORDESTE", "BA", "SALVADOR")]
+    columns = {name: [] for name in CLEANSED_SCHEMA.names}
+    for _ in range(rows):
+        tipo, categoria = rng.choice(tipos)
+        regiao, uf, municipio = rng.choice(ufs)
+        for name, value in zip(CLEANSED_SCHEMA.names, (
+                rng.randint(2005, 2020), rng.randint(1, 25000), f"UNIVERSIDADE {rng.randint(1, 2000)}", tipo,
+                categoria, rng.choice(["PRESENCIAL", "EAD"]), f"CURSO {rng.randint(1, 300)}",
+                rng.choice(["NOTURNO", "MATUTINO", "EAD"]), f"***.{rng.randint(0, 999):03d}.{rng.randint(0, 999):03d}-**",
+                rng.choice(["M", "F", None]), rng.choice(["BRANCA", "PARDA", "PRETA", None]),
+                datetime.date(rng.randint(1960, 2003), rng.randint(1, 12), rng.randint(1, 28)),
+                rng.choice([True, False, None]), regiao, uf, municipio)):
+            columns[name].append(value)
+    return pa.table(columns, schema=CLEANSED_SCHEMA)
+
+
+def run_export(table, workdir, export_format, download_workers, stream_mbps):
+    storage_client = FakeStorageClient(os.path.join(workdir, "gcs"), stream_bytes_per_second=stream_mbps * 1024 * 1024)
+    client = FakeClient(storage=storage_client)
+    client.add_table(cleansed_to_csv.TABLE_NAME, table)
+    cleansed_to_csv.OUTPUT_DIR = os.path.join(workdir, f"output-{export_format}-{download_workers}")
+    start = time.perf_counter()
+    output_path = cleansed_to_csv.export_table_to_csv(client, storage_client, export_format, download_workers)
+    # O extract falso (CSV e GZIP gerados localmente) não entra na conta: no BigQuery ele roda no servidor
+    elapsed = time.perf_counter() - start - client.extract_seconds
+    bucket = storage_client.bucket(f"{client.project}-temp-exports")
+    return output_path, elapsed, len(bucket.list_blobs())
+
+
+def run_failing_export(table, workdir):
+    """Exportação em que um download falha: os shards temporários devem ser removidos mesmo assim"""
+    original = FakeBlob.download_to_filename
+
+    def failing_download(blob, filename):
+        if blob.name.endswith("000000000002.csv.gz"):
+            raise ConnectionError("falha simulada no download")
+        return original(blob, filename)
+
+    FakeBlob.download_to_filename = failing_download
+    try:
+        run_export(table, workdir, "csv", 4, stream_mbps=0)
+    except ConnectionError:
+        pass
+    finally:
+        FakeBlob.download_to_filename = original
+    bucket = FakeStorageClient(os.path.join(workdir, "gcs")).bucket("fake-project-temp-exports")
+    shards_dir = os.path.join(workdir, "output-csv-4", "prouni_cleansed_data.csv.shards")
+    return len(bucket.list_blobs()), os.path.exists(shards_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--workdir", default=None,
+                        help="Diretório dos arquivos gerados (padrão: um diretório temporário novo)")
+    parser.add_argument("--stream-mbps", type=float, default=5.0, help="Vazão simulada de cada stream de download")
+    parser.add_argument("--download-workers", type=int, default=cleansed_to_csv.DOWNLOAD_WORKERS)
+    args = parser.parse_args()
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="prouni_export_")
+    print(f"Diretório de trabalho: {args.workdir}")
+
+    shutil.rmtree(args.workdir, ignore_errors=True)
+    os.makedirs(args.workdir)
+    table = generate_table(args.rows)
+
+    results = {}
+    for export_format, workers in (("csv", 1), ("csv", args.download_workers), ("parquet", args.download_workers)):
+        results[(export_format, workers)] = run_export(table, args.workdir, export_format, workers, args.stream_mbps)
+    remaining_blobs, shards_left = run_failing_export(table, args.workdir)
+
+    print(f"\nTabela: {args.rows:,} linhas | vazão simulada por stream: {args.stream_mbps} MB/s")
+    for (export_format, workers), (output_path, elapsed, blobs) in results.items():
+        size_mb = os.path.getsize(output_path) / 1024 / 1024
+        print(f"[{export_format}, {workers} downloads] download e concatenação: {elapsed:.1f}s | {size_mb:,.1f} MB | shards restantes: {blobs}")
+    sequential, parallel = results[("csv", 1)][0], results[("csv", args.download_workers)][0]
+    with open(parallel, encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    print(f"CSV idêntico nos dois modos: {'sim' if filecmp.cmp(sequential, parallel, shallow=False) else 'NÃO'} | "
+          f"linhas (com um cabeçalho): {lines:,} de {args.rows + 1:,}")
+    print(f"Após falha no download: shards restantes no bucket: {remaining_blobs} | "
+          f"shards locais restantes: {'sim' if shards_left else 'não'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark do source_to_raw.py: pico de memória e vazão da carga em memória (modo original),
+da carga via staging em Parquet (preparando todos os arquivos) e de uma segunda carga via
+staging, que reaproveita os arquivos já preparados.
+
+Gera arquivos pda-prouni-YYYY.csv sintéticos no layout da fonte (incluindo os anos com os
+nomes de coluna alternativos e o BOM) e executa cada modo em um processo separado, com o
+cliente BigQuery falso do fake_bigquery.py. Também confere que todos os modos carregam as
+mesmas linhas e colunas.
+
+Uso: python benchmark_source_to_raw.py --size-mb 512 --workdir /tmp/prouni_bench
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import source_to_raw
+from fake_bigquery import FakeClient
+
+OLD_COLUMNS = [
+    'ANO_CONCESSAO_BOLSA', 'CODIGO_EMEC_IES_BOLSA', 'NOME_IES_BOLSA', 'TIPO_BOLSA', 'MODALIDADE_ENSINO_BOLSA',
+    'NOME_CURSO_BOLSA', 'NOME_TURNO_CURSO_BOLSA', 'CPF_BENEFICIARIO_BOLSA', 'SEXO_BENEFICIARIO_BOLSA',
+    'RACA_BENEFICIARIO_BOLSA', 'DT_NASCIMENTO_BENEFICIARIO', 'BENEFICIARIO_DEFICIENTE_FISICO',
+    'REGIAO_BENEFICIARIO_BOLSA', 'SIGLA_UF_BENEFICIARIO_BOLSA', 'MUNICIPIO_BENEFICIARIO_BOLSA',
+]
+# A partir de 2016 a fonte usa outros nomes de coluna (e o arquivo começa com BOM)
+NEW_COLUMNS = [
+    'ANO_CONCESSAO_BOLSA', 'CODIGO_EMEC_IES_BOLSA', 'NOME_IES_BOLSA', 'TIPO_BOLSA', 'MODALIDADE_ENSINO_BOLSA',
+    'NOME_CURSO_BOLSA', 'NOME_TURNO_CURSO_BOLSA', 'CPF_BENEFICIARIO', 'SEXO_BENEFICIARIO', 'RACA_BENEFICIARIO',
+    'DATA_NASCIMENTO', 'BENEFICIARIO_DEFICIENTE_FISICO', 'REGIAO_BENEFICIARIO', 'UF_BENEFICIARIO',
+    'MUNICIPIO_BENEFICIARIO',
+]
+TIPOS_BOLSA = ['BOLSA INTEGRAL', 'BOLSA PARCIAL 50%', 'BOLSA COMPLEMENTAR 25%']
+MODALIDADES = ['Presencial', 'EDUCAÇÃO A DISTÂNCIA']
+TURNOS = ['Noturno', 'Matutino', 'Vespertino', 'Integral', 'Curso a distância']
+SEXOS = ['Masculino', 'Feminino', 'M', 'F']
+RACAS = ['Branca', 'Parda', 'Preta', 'Amarela', 'Indígena', 'Não Informada']
+UFS = [('SUDESTE', 'SP', 'SÃO PAULO'), ('SUL', 'PR', 'CURITIBA'), ('NORDESTE', 'BA', 'SALVADOR'),
+       ('NORTE', 'PA', 'BELÉM'), ('CENTRO-OESTE', 'GO', 'GOIÂNIA')]
+
+
+def generate_year(path, year, target_bytes, seed):
+    """Gera um arquivo anual com cerca de `target_bytes` bytes"""
+    rng = random.Random(seed)
+    new_layout = year >= 2016
+    with open(path, mode="wb") as f:
+        if new_layout:
+            f.write(b"\xef\xbb\xbf")
+        f.write((";".join(NEW_COLUMNS if new_layout else OLD_COLUMNS) + "\n").encode("iso-8859-1"))
+        while f.tell() < target_bytes:
+            lines = []
+            for _ in range(10_000):
+                special = rng.random()
+                if special < 0.0005:
+                    # Linhas totalmente vazias são removidas pelo ajuste
+                    lines.append(";" * (len(OLD_COLUMNS) - 1))
+                    continue
+                regiao, uf, municipio = rng.choice(UFS)
+                lines.append(";".join([
+                    str(year), str(rng.randint(1, 25000)), f"UNIVERSIDADE {rng.randint(1, 2000)}",
+                    rng.choice(TIPOS_BOLSA), rng.choice(MODALIDADES), f"CURSO {rng.randint(1, 300)}",
+                    rng.choice(TURNOS), f"***.{rng.randint(0, 999):03d}.{rng.randint(0, 999):03d}-**",
+                    rng.choice(SEXOS), rng.choice(RACAS),
+                    f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1960, 2003)}",
+                    rng.choice(['SIM', 'NÃO', 'S', 'N']), "nan" if special > 0.999 else regiao,
+                    "" if 0.5 < special < 0.501 else uf, municipio,
+                ]))
+            f.write(("\n".join(lines) + "\n").encode("iso-8859-1"))
+
+
+def run_mode(mode, files, chunk_rows, workers, staging_path, results):
+    client = FakeClient()
+    start = time.perf_counter()
+    if mode == "em memória":
+        source_to_raw.load_in_memory(client, files)
+    elif mode == "staging":
+        source_to_raw.stage_and_load(client, files, chunk_rows, workers, staging_path, force=True)
+    else:
+        # Segunda execução sobre os mesmos arquivos: o staging é reaproveitado e só a carga é refeita
+        source_to_raw.stage_and_load(client, files, chunk_rows, workers, staging_path)
+    elapsed = time.perf_counter() - start - client.verify_seconds
+    # ru_maxrss em KB no Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    table = client.tables[source_to_raw.TABLE_NAME]
+    results.put((elapsed, peak_mb, client.load_jobs, tuple(table["columns"]), table["rows"], table["rows_hash"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=512, help="Tamanho total dos arquivos de entrada")
+    parser.add_argument("--years", type=int, nargs="+", default=list(range(2005, 2021)))
+    parser.add_argument("--workdir", default=None,
+                        help="Diretório dos arquivos gerados (padrão: um diretório temporário novo)")
+    parser.add_argument("--chunk-rows", type=int, default=source_to_raw.CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processos que leem os arquivos")
+    args = parser.parse_args()
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="prouni_bench_")
+    print(f"Diretório de trabalho: {args.workdir}")
+
+    os.makedirs(args.workdir, exist_ok=True)
+    per_year = args.size_mb * 1024 * 1024 // len(args.years)
+    files = []
+    for i, year in enumerate(args.years):
+        path = os.path.join(args.workdir, f"pda-prouni-{year}.csv")
+        # Arquivos de execuções anteriores com o tamanho pedido são reaproveitados
+        if not os.path.exists(path) or os.path.getsize(path) < per_year:
+            generate_year(path, year, per_year, seed=i)
+        files.append(path)
+    total_mb = sum(os.path.getsize(path) for path in files) / 1024 / 1024
+
+    # Cada modo roda em um processo novo, para que o pico de memória de um não afete o outro
+    context = multiprocessing.get_context("spawn")
+    measurements = {}
+    staging_path = os.path.join(args.workdir, "staging")
+    for mode in ("em memória", "staging", "staging reaproveitado"):
+        results = context.Queue()
+        process = context.Process(target=run_mode,
+                                  args=(mode, files, args.chunk_rows, args.workers, staging_path, results))
+        process.start()
+        measurements[mode] = results.get()
+        process.join()
+
+    print(f"\nEntrada: {len(files)} arquivos, {total_mb:,.0f} MB")
+    for mode, (elapsed, peak_mb, load_jobs, _, rows, _) in measurements.items():
+        print(f"[{mode}] {elapsed:.1f}s ({total_mb / elapsed:,.1f} MB/s, {rows / elapsed:,.0f} linhas/s) | "
+              f"pico de memória: {peak_mb:,.0f} MB | jobs de carga: {load_jobs}")
+    staged_mb = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(staging_path)
+                    for name in names if name.endswith(".parquet")) / 1024 / 1024
+    # Pico de memória do staging: apenas o processo principal (os workers não entram na conta)
+    print(f"CPUs: {os.cpu_count()} | workers: {args.workers} | staging: {staged_mb:,.0f} MB em Parquet")
+    identical = len({result[3:] for result in measurements.values()}) == 1
+    print(f"Mesmas linhas e colunas nos três modos: {'sim' if identical else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
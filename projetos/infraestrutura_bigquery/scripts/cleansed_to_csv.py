@@ -1,8 +1,20 @@
 from google.cloud import bigquery
 from google.cloud import storage
-from google.oauth2 import service_account
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import gzip
 import os
+import queue
+import shutil
+import threading
 import time
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from gcp_clients import get_bigquery_client, get_credentials, get_storage_client
+from job_monitor import finish_run, stage, start_run, wait_for_job
+from stage_cache import file_fingerprint, run_cached, table_fingerprint
 
 CREDENTIAL_PATH = "key.json"  # Caminho do arquivo de credenciais
 DATASET_NAME = "PROUNI"
@@ -10,16 +22,27 @@ TABLE_NAME = "cleansed_data"
 OUTPUT_DIR = "../output"
 OUTPUT_FILE = "prouni_cleansed_data.csv"
 BUCKET_NAME = None  # Será definido dinamicamente
+EXPORT_FORMATS = ("csv", "parquet")
+EXPORT_PREFIX = "exports"  # Pasta dos shards temporários no bucket
+DOWNLOAD_WORKERS = 8  # Shards baixados ao mesmo tempo
+COPY_BUFFER = 8 * 1024 * 1024
+READ_STREAMS = 4  # Streams da Storage Read API lidos em paralelo na exportação direta
+QUEUE_BATCHES = 8  # Record batches em fila entre os streams e a escrita
+PARTITION_COLUMN = "ANO_CONCESSAO_BOLSA"
+# Tipo Arrow de cada tipo do BigQuery, para o arquivo Parquet vazio quando o extract não gera shards
+ARROW_TYPES = {
+    "STRING": pa.string(), "INTEGER": pa.int64(), "INT64": pa.int64(), "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(), "NUMERIC": pa.decimal128(38, 9), "BOOLEAN": pa.bool_(), "BOOL": pa.bool_(),
+    "DATE": pa.date32(), "DATETIME": pa.timestamp("us"), "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "BYTES": pa.binary(),
+}
 
 def authenticate_gcp(credential_path):
     """Autentica no GCP usando credenciais de service account"""
     print("\n[1/4] Iniciando autenticação no GCP...")
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            credential_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+        # Credenciais e cliente compartilhados: no run_pipeline.py, carregados uma única vez
+        client = get_bigquery_client(credential_path)
         print("✅ Autenticação bem-sucedida!")
         return client
     except Exception as e:
@@ -46,7 +69,7 @@ def ensure_gcs_bucket_exists(storage_client, bucket_name):
         if not bucket.exists():
             print(f"Bucket não encontrado. Criando novo bucket: {bucket_name}")
             bucket.create(location="US")  # Cria o bucket na região US
-            print(f"✅ Bucket criado com sucesso!")
+            print("✅ Bucket criado com sucesso!")
         else:
             print(f"ℹ️ Bucket encontrado: {bucket_name}")
         return bucket
@@ -54,9 +77,89 @@ def ensure_gcs_bucket_exists(storage_client, bucket_name):
         print(f"❌ Falha ao verificar/criar bucket: {str(e)}")
         raise
 
-def export_table_to_csv(client):
-    """Exporta a tabela do BigQuery para um arquivo CSV"""
-    print("\n[4/4] Iniciando exportação para CSV...")
+def download_shards(blobs, shards_dir, download_workers=DOWNLOAD_WORKERS):
+    """Baixa os shards em paralelo, até `download_workers` ao mesmo tempo, e gera os caminhos locais
+    na ordem dos shards, à medida que cada um termina. Um novo download só é iniciado quando um
+    shard é entregue: no disco ficam no máximo `download_workers` shards além do que está sendo
+    concatenado"""
+    os.makedirs(shards_dir, exist_ok=True)
+    pool = ThreadPoolExecutor(max_workers=download_workers)
+    pending = iter(blobs)
+    futures = deque()
+
+    def submit_next():
+        blob = next(pending, None)
+        if blob is not None:
+            path = os.path.join(shards_dir, os.path.basename(blob.name))
+            futures.append(pool.submit(lambda blob, path: blob.download_to_filename(path) or path, blob, path))
+
+    try:
+        for _ in range(download_workers):
+            submit_next()
+        while futures:
+            path = futures.popleft().result()
+            submit_next()
+            yield path
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def stitch_csv(shard_paths, output_path):
+    """Concatena os shards CSV (GZIP) em um único CSV, mantendo apenas o cabeçalho do primeiro"""
+    header = None
+    with open(output_path, mode="wb") as output:
+        for path in shard_paths:
+            with gzip.open(path, mode="rb") as shard:
+                shard_header = shard.readline()
+                if header is None:
+                    header = shard_header
+                    output.write(header)
+                elif shard_header and shard_header != header:
+                    raise ValueError(f"Cabeçalho diferente no shard {os.path.basename(path)}")
+                shutil.copyfileobj(shard, output, COPY_BUFFER)
+            # O shard já copiado é apagado: no disco ficam só os que ainda estão sendo baixados
+            os.remove(path)
+
+def stitch_parquet(shard_paths, output_path, schema):
+    """Concatena os shards Parquet em um único arquivo, um row group por vez. Sem shards, grava um
+    arquivo vazio com o `schema` da tabela"""
+    writer = None
+    try:
+        for path in shard_paths:
+            shard = pq.ParquetFile(path)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, shard.schema_arrow, compression="zstd")
+            for row_group in range(shard.num_row_groups):
+                writer.write_table(shard.read_row_group(row_group))
+            shard.close()
+            os.remove(path)
+        if writer is None:
+            pq.write_table(schema.empty_table(), output_path, compression="zstd")
+    finally:
+        if writer is not None:
+            writer.close()
+
+def arrow_schema_for(fields):
+    """Schema Arrow equivalente ao schema (lista de SchemaField) de uma tabela do BigQuery"""
+    return pa.schema([(field.name, ARROW_TYPES.get(field.field_type, pa.string())) for field in fields])
+
+def delete_blobs(bucket, prefix):
+    deleted = 0
+    for blob in bucket.list_blobs(prefix=prefix):
+        blob.delete()
+        deleted += 1
+    return deleted
+
+def output_path_for(export_format):
+    return os.path.join(OUTPUT_DIR, os.path.splitext(OUTPUT_FILE)[0] + f".{export_format}")
+
+def export_table_to_csv(client, storage_client=None, export_format="csv", download_workers=DOWNLOAD_WORKERS):
+    """Exporta a tabela do BigQuery para um arquivo CSV (ou Parquet).
+    
+    O extract grava a tabela em shards comprimidos (CSV com GZIP ou Parquet) em uma URI com
+    curinga, sem o limite de 1 GB por arquivo. Os shards são baixados em paralelo e concatenados
+    no arquivo final, na ordem, à medida que chegam. Os shards temporários (no bucket e no
+    disco) são apagados mesmo em caso de erro."""
+    print("\n[4/4] Iniciando exportação...")
     
     # Verifica se a tabela existe
     if not check_table_exists(client, DATASET_NAME, TABLE_NAME):
@@ -64,7 +167,7 @@ def export_table_to_csv(client):
     
     # Cria o diretório de output se não existir
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
+    output_path = output_path_for(export_format)
     
     # Configuração da exportação
     dataset_ref = client.dataset(DATASET_NAME)
@@ -75,7 +178,8 @@ def export_table_to_csv(client):
     BUCKET_NAME = f"{client.project}-temp-exports"
     
     # Autentica no GCS e verifica o bucket
-    storage_client = storage.Client.from_service_account_json(CREDENTIAL_PATH)
+    if storage_client is None:
+        storage_client = get_storage_client(CREDENTIAL_PATH)
     bucket = ensure_gcs_bucket_exists(storage_client, BUCKET_NAME)
     
     print(f"\n📤 Exportando dados para {output_path}...")
@@ -83,52 +187,271 @@ def export_table_to_csv(client):
     
     # Configura o job de exportação
     job_config = bigquery.ExtractJobConfig()
-    job_config.destination_format = bigquery.DestinationFormat.CSV
-    job_config.print_header = True
-    
-    # URI temporário no Google Cloud Storage
-    destination_uri = f"gs://{BUCKET_NAME}/temp_export.csv"
-    
-    # Exporta para o GCS
-    extract_job = client.extract_table(
-        table_ref,
-        destination_uri,
-        job_config=job_config,
-        location="US"  # Ajuste conforme a localização do seu dataset
-    )
-    extract_job.result()  # Aguarda a conclusão
+    if export_format == "parquet":
+        job_config.destination_format = bigquery.DestinationFormat.PARQUET
+        extension = "parquet"
+    else:
+        job_config.destination_format = bigquery.DestinationFormat.CSV
+        job_config.compression = bigquery.Compression.GZIP
+        job_config.print_header = True
+        extension = "csv.gz"
     
-    # Baixa do GCS para o sistema local
-    blob = bucket.blob("temp_export.csv")
-    blob.download_to_filename(output_path)
+    # Prefixo único por exportação: exportações simultâneas não se misturam
+    prefix = f"{EXPORT_PREFIX}/{TABLE_NAME}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}/"
+    destination_uri = f"gs://{BUCKET_NAME}/{prefix}shard-*.{extension}"
+    shards_dir = output_path + ".shards"
+    partial_path = output_path + ".partial"
     
-    # Limpa o arquivo temporário
-    blob.delete()
+    try:
+        # Exporta para o GCS
+        with stage("cleansed_to_csv/extract"):
+            extract_job = client.extract_table(
+                table_ref,
+                destination_uri,
+                job_config=job_config,
+                location="US"  # Ajuste conforme a localização do seu dataset
+            )
+            wait_for_job(extract_job, "extract da cleansed_data")
+        extract_time = time.time() - start_time
+        
+        blobs = sorted(bucket.list_blobs(prefix=prefix), key=lambda blob: blob.name)
+        compressed_size = sum(blob.size or 0 for blob in blobs) / (1024 * 1024)
+        print(f"ℹ️ Extract concluído em {extract_time:.2f}s: {len(blobs)} shards, {compressed_size:.2f} MB")
+        
+        # Baixa os shards em paralelo e os concatena no arquivo final
+        shard_paths = download_shards(blobs, shards_dir, download_workers)
+        try:
+            with stage("cleansed_to_csv/download"):
+                if export_format == "parquet":
+                    schema = arrow_schema_for(client.get_table(table_ref).schema)
+                    stitch_parquet(shard_paths, partial_path, schema)
+                else:
+                    stitch_csv(shard_paths, partial_path)
+        finally:
+            # Em caso de erro, aguarda os downloads em andamento antes da limpeza
+            shard_paths.close()
+        os.replace(partial_path, output_path)
+    finally:
+        # Limpa os arquivos temporários, no bucket e no disco
+        deleted = delete_blobs(bucket, prefix)
+        shutil.rmtree(shards_dir, ignore_errors=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        print(f"🧹 {deleted} shards temporários removidos do bucket")
     
     elapsed_time = time.time() - start_time
     file_size = os.path.getsize(output_path) / (1024 * 1024)  # Tamanho em MB
     
-    print(f"\n✅ Exportação concluída com sucesso!")
+    print("\n✅ Exportação concluída com sucesso!")
     print(f"- Arquivo gerado: {output_path}")
     print(f"- Tamanho do arquivo: {file_size:.2f} MB")
+    print(f"- Download e concatenação: {elapsed_time - extract_time:.2f} segundos ({download_workers} downloads em paralelo)")
     print(f"- Tempo total: {elapsed_time:.2f} segundos")
+    return output_path
+
+def create_read_client(credential_path):
+    """Cliente da BigQuery Storage Read API, com as mesmas credenciais"""
+    # Importado aqui para que a exportação via GCS não dependa do google-cloud-bigquery-storage
+    from google.cloud import bigquery_storage
+    return bigquery_storage.BigQueryReadClient(credentials=get_credentials(credential_path))
+
+def create_read_session(read_client, project, columns=None, years=None, max_streams=READ_STREAMS):
+    """Sessão de leitura em Arrow da tabela, apenas com as colunas e os anos pedidos: o filtro no
+    ano (coluna de particionamento) faz a leitura percorrer só as partições selecionadas"""
+    from google.cloud.bigquery_storage import types
+    read_options = types.ReadSession.TableReadOptions(selected_fields=columns or [])
+    if years:
+        read_options.row_restriction = f"{PARTITION_COLUMN} IN ({', '.join(str(int(year)) for year in years)})"
+    session = types.ReadSession(
+        table=f"projects/{project}/datasets/{DATASET_NAME}/tables/{TABLE_NAME}",
+        data_format=types.DataFormat.ARROW,
+        read_options=read_options,
+    )
+    return read_client.create_read_session(parent=f"projects/{project}", read_session=session,
+                                           max_stream_count=max_streams)
+
+def read_stream(read_client, session, stream_name, batches, stop):
+    """Lê um stream da sessão e envia os record batches pela fila. Com a fila cheia, espera; se a
+    escrita for interrompida (`stop`), encerra"""
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    try:
+        for page in read_client.read_rows(stream_name).rows(session).pages:
+            if not put(page.to_arrow()):
+                return
+        put(None)
+    except Exception as error:
+        put(error)
+
+def iter_record_batches(read_client, session, queue_batches=QUEUE_BATCHES):
+    """Lê todos os streams da sessão em paralelo, uma thread por stream, e gera os record batches
+    à medida que chegam. A fila limitada mantém a memória constante: uma escrita mais lenta
+    bloqueia a leitura"""
+    batches = queue.Queue(maxsize=queue_batches)
+    stop = threading.Event()
+    threads = [threading.Thread(target=read_stream, args=(read_client, session, stream.name, batches, stop),
+                                daemon=True)
+               for stream in session.streams]
+    for thread in threads:
+        thread.start()
+    try:
+        finished = 0
+        while finished < len(threads):
+            item = batches.get()
+            if item is None:
+                finished += 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+
+def write_batches(batches, schema, output_path, export_format):
+    """Grava os record batches no arquivo final, incrementalmente (um único cabeçalho no CSV)"""
+    rows = 0
+    partial_path = output_path + ".partial"
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(partial_path, schema, compression="zstd")
+    else:
+        writer = pa_csv.CSVWriter(partial_path, schema)
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(partial_path, output_path)
+    return rows
+
+def export_table_direct(client, read_client, export_format="csv", columns=None, years=None,
+                        max_streams=READ_STREAMS, queue_batches=QUEUE_BATCHES):
+    """Exporta a tabela diretamente para um arquivo local pela Storage Read API, sem bucket nem
+    extract: os streams são lidos em paralelo como record batches do Arrow e gravados à medida
+    que chegam. Apenas as colunas e os anos pedidos são lidos"""
+    print("\n[4/4] Iniciando exportação direta (Storage Read API)...")
+    
+    # Verifica se a tabela existe
+    if not check_table_exists(client, DATASET_NAME, TABLE_NAME):
+        raise Exception(f"Tabela {TABLE_NAME} não encontrada!")
+    
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_path = output_path_for(export_format)
+    print(f"\n📤 Exportando dados para {output_path}...")
+    if columns:
+        print(f"- Colunas: {', '.join(columns)}")
+    if years:
+        print(f"- Anos: {', '.join(map(str, years))}")
+    start_time = time.time()
+    
+    session = create_read_session(read_client, client.project, columns, years, max_streams)
+    # Sem linhas a ler, a sessão não tem streams: o arquivo é gravado apenas com o schema
+    schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+    print(f"ℹ️ Sessão de leitura com {len(session.streams)} streams")
+    batches = iter_record_batches(read_client, session, queue_batches)
+    try:
+        with stage("cleansed_to_csv/leitura direta"):
+            rows = write_batches(batches, schema, output_path, export_format)
+    finally:
+        # Em caso de erro na escrita, interrompe as threads de leitura
+        batches.close()
+        partial_path = output_path + ".partial"
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    
+    elapsed_time = time.time() - start_time
+    file_size = os.path.getsize(output_path) / (1024 * 1024)  # Tamanho em MB
+    
+    print("\n✅ Exportação concluída com sucesso!")
+    print(f"- Arquivo gerado: {output_path}")
+    print(f"- Linhas: {rows:,}")
+    print(f"- Tamanho do arquivo: {file_size:.2f} MB")
+    print(f"- Tempo total: {elapsed_time:.2f} segundos ({rows / max(elapsed_time, 1e-9):,.0f} linhas/s)")
+    return output_path
+
+def export_if_changed(client, run_export, export_format="csv", options=None, force=False):
+    """Executa `run_export` apenas se a cleansed_data (data de modificação e linhas) ou os
+    parâmetros que definem o arquivo (`options`) mudaram desde a última exportação, ou se o
+    arquivo gerado foi alterado ou removido. `force=True` exporta sempre"""
+    output_path = output_path_for(export_format)
+    inputs = {
+        "source": table_fingerprint(client, DATASET_NAME, TABLE_NAME),
+        "format": export_format,
+        "output": os.path.abspath(output_path),
+        "options": options or {},
+    }
+    # Uma entrada por formato: exportar em Parquet não invalida o CSV já exportado
+    return run_cached(f"cleansed_to_csv/{export_format}", inputs, run_export, lambda: file_fingerprint(output_path),
+                      force)
+
+def connect_emulators(bigquery_endpoint, gcs_endpoint, project):
+    """Clientes sem credenciais para emuladores locais do BigQuery e do GCS (ex.: fake-gcs-server)"""
+    from google.api_core.client_options import ClientOptions
+    from google.auth.credentials import AnonymousCredentials
+    print(f"\n[1/4] Usando os emuladores: BigQuery em {bigquery_endpoint}, GCS em {gcs_endpoint}")
+    client = bigquery.Client(project=project, credentials=AnonymousCredentials(),
+                             client_options=ClientOptions(api_endpoint=bigquery_endpoint))
+    storage_client = storage.Client(project=project, credentials=AnonymousCredentials(),
+                                    client_options=ClientOptions(api_endpoint=gcs_endpoint))
+    return client, storage_client
 
 def main():
+    parser = argparse.ArgumentParser(description="Exporta a tabela cleansed_data do BigQuery para um arquivo local")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv",
+                        help="Formato dos shards e do arquivo final (padrão: csv, com shards em GZIP)")
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS, help="Shards baixados em paralelo")
+    parser.add_argument("--emulator-endpoint", help="Endpoint de um emulador do BigQuery (requer --gcs-endpoint)")
+    parser.add_argument("--gcs-endpoint", help="Endpoint de um emulador do GCS (ex.: http://localhost:4443)")
+    parser.add_argument("--project", default="test", help="Projeto usado com os emuladores")
+    parser.add_argument("--direct", action="store_true",
+                        help="Lê a tabela pela Storage Read API, sem bucket nem extract")
+    parser.add_argument("--columns", nargs="+", help="Colunas exportadas (apenas com --direct; padrão: todas)")
+    parser.add_argument("--years", nargs="+", type=int,
+                        help="Anos (ANO_CONCESSAO_BOLSA) exportados (apenas com --direct; padrão: todos)")
+    parser.add_argument("--streams", type=int, default=READ_STREAMS, help="Streams lidos em paralelo com --direct")
+    parser.add_argument("--force", action="store_true",
+                        help="Exporta mesmo sem alterações na cleansed_data desde a última exportação")
+    args = parser.parse_args()
+    if bool(args.emulator_endpoint) != bool(args.gcs_endpoint):
+        parser.error("--emulator-endpoint e --gcs-endpoint devem ser usados juntos")
+    if (args.columns or args.years) and not args.direct:
+        parser.error("--columns e --years requerem --direct")
+    if args.direct and args.emulator_endpoint:
+        parser.error("--direct não é suportado com os emuladores")
+    
     print("\n" + "="*50)
     print(" EXPORTAÇÃO CLEANSED_DATA PARA CSV ")
     print("="*50)
     
+    start_run("cleansed_to_csv")
     try:
-        # Autentica no GCP
-        client = authenticate_gcp(CREDENTIAL_PATH)
+        # Autentica no GCP (ou conecta aos emuladores)
+        if args.emulator_endpoint:
+            client, storage_client = connect_emulators(args.emulator_endpoint, args.gcs_endpoint, args.project)
+        else:
+            client, storage_client = authenticate_gcp(CREDENTIAL_PATH), None
         
-        # Exporta a tabela para CSV
-        export_table_to_csv(client)
+        # Exporta a tabela para CSV (ou Parquet), se ela mudou desde a última exportação
+        if args.direct:
+            export_if_changed(client, lambda: export_table_direct(
+                client, create_read_client(CREDENTIAL_PATH), args.format, args.columns, args.years, args.streams),
+                args.format, {"direct": True, "columns": args.columns, "years": args.years}, args.force)
+        else:
+            export_if_changed(client, lambda: export_table_to_csv(
+                client, storage_client, args.format, args.download_workers),
+                args.format, {"direct": False}, args.force)
+        finish_run("ok")
         
         print("\n" + "="*50)
         print(" PROCESSO CONCLUÍDO COM SUCESSO! ")
         print("="*50)
     except Exception as e:
+        finish_run("falhou")
         print("\n" + "="*50)
         print("❌ ERRO NA EXPORTAÇÃO")
         print(f"Motivo: {str(e)}")
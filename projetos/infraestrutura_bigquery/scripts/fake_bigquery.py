@@ -0,0 +1,215 @@
+"""
+Clientes BigQuery e GCS falsos, para executar e medir a carga do source_to_raw.py e a
+exportação do cleansed_to_csv.py sem acesso ao GCP.
+
+O FakeClient implementa apenas o que os scripts usam (dataset, table, get_dataset,
+create_dataset, get_table, delete_table, copy_table, load_table_from_dataframe,
+load_table_from_file e extract_table). Os jobs de carga leem o Parquet enviado e acumulam, por tabela, as colunas,
+a quantidade de linhas e uma soma dos hashes das linhas, que independe da ordem e da divisão
+em arquivos: duas cargas com o mesmo conteúdo têm o mesmo resultado.
+
+O FakeStorageClient guarda os buckets em um diretório local. Os extracts do FakeClient gravam
+os shards nele (tabelas registradas com `add_table`), e os downloads podem ser limitados a
+uma vazão por stream, para simular a rede.
+"""
+import datetime
+import gzip
+import io
+import os
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+EXTRACT_SHARD_ROWS = 100_000  # Linhas por shard dos extracts
+
+# Tipo do BigQuery de cada tipo Arrow das tabelas registradas com `add_table`
+BIGQUERY_TYPES = {"int64": "INTEGER", "double": "FLOAT", "bool": "BOOLEAN", "date32[day]": "DATE", "string": "STRING"}
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.path, self.name)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def download_to_filename(self, filename):
+        bytes_per_second = self.bucket.client.stream_bytes_per_second
+        with open(self.path, mode="rb") as source, open(filename, mode="wb") as target:
+            while True:
+                data = source.read(1024 * 1024)
+                if not data:
+                    break
+                target.write(data)
+                if bytes_per_second:
+                    time.sleep(len(data) / bytes_per_second)
+
+    def upload_from_file(self, file_obj):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, mode="wb") as target:
+            shutil.copyfileobj(file_obj, target)
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.path = os.path.join(client.root, name)
+
+    def exists(self):
+        return os.path.isdir(self.path)
+
+    def create(self, location=None):
+        os.makedirs(self.path, exist_ok=True)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        names = sorted(os.path.relpath(os.path.join(root, name), self.path).replace(os.sep, "/")
+                       for root, _, files in os.walk(self.path) for name in files)
+        return [FakeBlob(self, name) for name in names if name.startswith(prefix)]
+
+
+class FakeStorageClient:
+    def __init__(self, root, stream_bytes_per_second=None):
+        self.root = root
+        self.stream_bytes_per_second = stream_bytes_per_second
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+
+class FakeJob:
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self
+
+
+class FakeClient:
+    def __init__(self, storage=None, project="fake-project"):
+        self.project = project
+        self.storage = storage
+        self.tables = {}
+        self.data = {}
+        self.load_jobs = 0
+        # Tempo gasto na conferência das linhas e na geração dos extracts, para ser descontado do tempo medido
+        self.verify_seconds = 0.0
+        self.extract_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def dataset(self, name):
+        return self
+
+    def table(self, name):
+        return name
+
+    def get_dataset(self, dataset_ref):
+        return dataset_ref
+
+    def create_dataset(self, dataset):
+        return dataset
+
+    def get_table(self, table_ref):
+        if table_ref not in self.tables:
+            raise NotFound(f"Table {table_ref} not found")
+        table = self.tables[table_ref]
+        return SimpleNamespace(**{**table, "num_rows": table["rows"], "schema": table["schema"]})
+
+    def add_table(self, table_ref, arrow_table):
+        """Registra o conteúdo de uma tabela, usado pelos extracts"""
+        self.data[table_ref] = arrow_table
+        schema = [bigquery.SchemaField(field.name, BIGQUERY_TYPES.get(str(field.type), "STRING"))
+                  for field in arrow_table.schema]
+        self.tables[table_ref] = {"columns": arrow_table.column_names, "schema": schema, "clustering_fields": None,
+                                  "rows": arrow_table.num_rows, "rows_hash": None, "modified": now()}
+
+    def extract_table(self, table_ref, destination_uri, job_config=None, location=None):
+        """Grava a tabela em shards de EXTRACT_SHARD_ROWS linhas no lugar do '*' da URI, como o BigQuery"""
+        start = time.perf_counter()
+        bucket_name, pattern = destination_uri[len("gs://"):].split("/", 1)
+        bucket = self.storage.bucket(bucket_name)
+        table = self.data[table_ref]
+        for shard, offset in enumerate(range(0, max(table.num_rows, 1), EXTRACT_SHARD_ROWS)):
+            rows = table.slice(offset, EXTRACT_SHARD_ROWS)
+            buffer = io.BytesIO()
+            if job_config.destination_format == "PARQUET":
+                pq.write_table(rows, buffer)
+            else:
+                csv_buffer = io.BytesIO()
+                pa_csv.write_csv(rows, csv_buffer, pa_csv.WriteOptions(include_header=job_config.print_header))
+                data = csv_buffer.getvalue()
+                buffer.write(gzip.compress(data) if job_config.compression == "GZIP" else data)
+            buffer.seek(0)
+            name = pattern.replace("*", f"{shard:012d}")
+            bucket.blob(name).upload_from_file(buffer)
+        self.extract_seconds += time.perf_counter() - start
+        return FakeJob(table.num_rows)
+
+    def delete_table(self, table_ref, not_found_ok=False):
+        if table_ref not in self.tables and not not_found_ok:
+            raise NotFound(f"Table {table_ref} not found")
+        self.tables.pop(table_ref, None)
+        self.data.pop(table_ref, None)
+
+    def copy_table(self, source_ref, destination_ref, job_config=None):
+        """Substitui o conteúdo da tabela de destino pelo da origem (WRITE_TRUNCATE)"""
+        with self._lock:
+            source = self.tables[source_ref]
+            self.tables[destination_ref] = {**source, "modified": now()}
+            if source_ref in self.data:
+                self.data[destination_ref] = self.data[source_ref]
+        return FakeJob(source["rows"])
+
+    def load_table_from_dataframe(self, df, table_ref, job_config=None):
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        buffer.seek(0)
+        return self.load_table_from_file(buffer, table_ref, job_config)
+
+    def load_table_from_file(self, file_obj, table_ref, job_config=None):
+        # A conferência é feita sob o lock: com jobs em paralelo, os tempos descontados não se sobrepõem
+        with self._lock:
+            start = time.perf_counter()
+            df = pq.read_table(file_obj).to_pandas()
+            rows_hash = int(pd.util.hash_pandas_object(df, index=False).sum())
+            if job_config.write_disposition == "WRITE_TRUNCATE" or table_ref not in self.tables:
+                self.tables[table_ref] = {"columns": None, "clustering_fields": None, "rows": 0, "rows_hash": 0}
+            table = self.tables[table_ref]
+            table["columns"] = [field.name for field in job_config.schema]
+            table["schema"] = list(job_config.schema)
+            table["clustering_fields"] = job_config.clustering_fields
+            table["rows"] += len(df)
+            table["rows_hash"] = (table["rows_hash"] + rows_hash) % 2 ** 64
+            table["modified"] = now()
+            self.load_jobs += 1
+            self.verify_seconds += time.perf_counter() - start
+        return FakeJob(len(df))
@@ -0,0 +1,54 @@
+"""
+Credenciais e clientes do GCP compartilhados pelos scripts do pipeline.
+
+As credenciais do key.json são carregadas uma única vez por processo, e os clientes do
+BigQuery e do GCS usam a mesma sessão HTTP autenticada, com um pool de conexões dimensionado
+para os jobs de carga e os downloads em paralelo. Executados em sequência no mesmo processo
+(run_pipeline.py), os estágios reaproveitam credenciais, token de acesso e conexões.
+"""
+import os
+import threading
+
+import requests.adapters
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from google.cloud import storage
+from google.oauth2 import service_account
+
+CREDENTIAL_PATH = "key.json"
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+HTTP_POOL_SIZE = 32  # Conexões mantidas por host: cobre os jobs e downloads em paralelo
+
+_cache = {}
+_lock = threading.RLock()
+
+def _cached(kind, credential_path, factory):
+    key = (kind, os.path.abspath(credential_path))
+    with _lock:
+        if key not in _cache:
+            _cache[key] = factory()
+        return _cache[key]
+
+def get_credentials(credential_path=CREDENTIAL_PATH):
+    """Credenciais da service account, carregadas do arquivo apenas na primeira chamada"""
+    return _cached("credentials", credential_path, lambda: service_account.Credentials.from_service_account_file(
+        credential_path, scopes=SCOPES))
+
+def get_http_session(credential_path=CREDENTIAL_PATH):
+    """Sessão HTTP autenticada, com pool de conexões, compartilhada pelos clientes"""
+    def create():
+        session = AuthorizedSession(get_credentials(credential_path))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        return session
+    return _cached("http", credential_path, create)
+
+def get_bigquery_client(credential_path=CREDENTIAL_PATH):
+    credentials = get_credentials(credential_path)
+    return _cached("bigquery", credential_path, lambda: bigquery.Client(
+        project=credentials.project_id, credentials=credentials, _http=get_http_session(credential_path)))
+
+def get_storage_client(credential_path=CREDENTIAL_PATH):
+    credentials = get_credentials(credential_path)
+    return _cached("storage", credential_path, lambda: storage.Client(
+        project=credentials.project_id, credentials=credentials, _http=get_http_session(credential_path)))
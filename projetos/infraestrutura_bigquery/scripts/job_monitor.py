@@ -0,0 +1,273 @@
+"""
+Acompanhamento dos jobs do BigQuery e registro de desempenho das execuções do pipeline.
+
+`wait_for_job` aguarda um job consultando o estado com intervalos crescentes (backoff
+exponencial): jobs curtos terminam sem a espera fixa de 1s, e jobs longos não fazem uma
+requisição por segundo. Ao final, as estatísticas do job (bytes processados e faturados,
+slot-ms, cache, linhas geradas e tempo de cada estágio do plano da query) são registradas na
+execução em andamento.
+
+Cada script inicia uma execução com `start_run` e a encerra com `finish_run`, que acrescenta
+uma linha ao log de desempenho em JSONL (`PERF_LOG_PATH`), com o tempo de cada etapa medida
+com `stage` e as estatísticas de todos os jobs.
+
+Uso (comparação entre execuções):
+    python job_monitor.py runs
+    python job_monitor.py compare
+    python job_monitor.py compare --script raw_to_cleansed --baseline 10 --threshold 0.1
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+PERF_LOG_PATH = "../staging/perf_log.jsonl"
+POLL_INITIAL_SECONDS = 0.5
+POLL_MAX_SECONDS = 10.0
+POLL_MULTIPLIER = 2.0
+BASELINE_RUNS = 5  # Execuções anteriores usadas como referência na comparação
+REGRESSION_THRESHOLD = 0.2  # Aumento relativo sinalizado como regressão
+MIN_SECONDS_DELTA = 1.0  # Diferenças de tempo menores que isso são ruído, não regressão
+COMPARED_METRICS = ("seconds", "total_bytes_processed", "total_bytes_billed", "slot_millis")
+
+_lock = threading.Lock()
+_current_run = None
+
+
+def start_run(script):
+    """Inicia o registro de uma execução. Chamadas aninhadas (um script executado pelo
+    run_pipeline.py) não iniciam outra execução: os registros vão para a que já está em andamento"""
+    global _current_run
+    with _lock:
+        if _current_run is not None:
+            return False
+        _current_run = {"run_id": uuid.uuid4().hex[:12], "script": script,
+                        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "status": None,
+                        "seconds": None, "stages": {}, "jobs": [], "_start": time.perf_counter()}
+        return True
+
+def finish_run(status="ok", path=PERF_LOG_PATH):
+    """Encerra a execução em andamento e acrescenta seu registro ao log de desempenho"""
+    global _current_run
+    with _lock:
+        run, _current_run = _current_run, None
+    if run is None:
+        return None
+    run["status"] = status
+    run["seconds"] = round(time.perf_counter() - run.pop("_start"), 3)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, mode="a", encoding="utf-8") as f:
+        f.write(json.dumps(run, ensure_ascii=False, default=str) + "\n")
+    return run
+
+@contextmanager
+def stage(name):
+    """Mede o tempo de uma etapa e o soma ao da etapa de mesmo nome na execução em andamento"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            if _current_run is not None:
+                stages = _current_run["stages"]
+                stages[name] = round(stages.get(name, 0.0) + elapsed, 3)
+
+def _seconds_between(start, end):
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds(), 3)
+
+def job_stats(job, description):
+    """Estatísticas de um job concluído. Atributos que o tipo do job não tem ficam nulos"""
+    raw_statistics = getattr(job, "_properties", {}).get("statistics", {})
+    slot_millis = getattr(job, "slot_millis", None)
+    if slot_millis is None and "totalSlotMs" in raw_statistics:
+        # Jobs de carga e extract não expõem slot_millis, mas a API o informa
+        slot_millis = int(raw_statistics["totalSlotMs"])
+    output_rows = getattr(job, "output_rows", None)
+    if output_rows is None:
+        output_rows = getattr(job, "num_dml_affected_rows", None)
+    plan = []
+    for entry in getattr(job, "query_plan", None) or []:
+        plan.append({"name": entry.name, "seconds": _seconds_between(entry.start, entry.end),
+                     "slot_ms": entry.slot_ms, "records_read": entry.records_read,
+                     "records_written": entry.records_written})
+    return {
+        "description": description,
+        "job_id": getattr(job, "job_id", None),
+        "job_type": getattr(job, "job_type", None),
+        "seconds": _seconds_between(getattr(job, "started", None), getattr(job, "ended", None)),
+        "queued_seconds": _seconds_between(getattr(job, "created", None), getattr(job, "started", None)),
+        "total_bytes_processed": getattr(job, "total_bytes_processed", None),
+        "total_bytes_billed": getattr(job, "total_bytes_billed", None),
+        "slot_millis": slot_millis,
+        "cache_hit": getattr(job, "cache_hit", None),
+        "output_rows": output_rows,
+        "stages": plan,
+    }
+
+def record_job(job, description, wall_seconds=None):
+    """Registra as estatísticas de um job concluído na execução em andamento"""
+    stats = job_stats(job, description)
+    if stats["seconds"] is None:
+        stats["seconds"] = None if wall_seconds is None else round(wall_seconds, 3)
+    with _lock:
+        if _current_run is not None:
+            _current_run["jobs"].append(stats)
+    return stats
+
+def wait_for_job(job, description, verbose=True, initial=POLL_INITIAL_SECONDS, maximum=POLL_MAX_SECONDS):
+    """Aguarda o job com backoff exponencial, registra suas estatísticas e retorna o job.
+    Com `verbose`, informa o estado a cada consulta e imprime as estatísticas ao final
+    (desligado nos jobs executados em paralelo)"""
+    start = time.perf_counter()
+    interval = initial
+    while not job.done():
+        if verbose:
+            print(f"⏳ {description}: {getattr(job, 'state', None) or 'em execução'} "
+                  f"há {time.perf_counter() - start:.1f}s")
+        time.sleep(interval)
+        interval = min(interval * POLL_MULTIPLIER, maximum)
+    job.result()  # Propaga o erro do job, se houver
+    stats = record_job(job, description, time.perf_counter() - start)
+    if verbose:
+        print_job_stats(stats)
+    return job
+
+def print_job_stats(stats):
+    print(f"📊 Job {stats['job_id'] or '-'} ({stats['description']}):")
+    if stats["seconds"] is not None:
+        print(f"- Duração: {stats['seconds']:.2f}s (fila: {stats['queued_seconds'] or 0:.2f}s)")
+    for key, label in (("total_bytes_processed", "Bytes processados"), ("total_bytes_billed", "Bytes faturados")):
+        if stats[key] is not None:
+            print(f"- {label}: {stats[key] / 1e6:,.2f} MB")
+    if stats["slot_millis"] is not None:
+        print(f"- Slot-ms: {stats['slot_millis']:,}")
+    if stats["cache_hit"] is not None:
+        print(f"- Cache: {'sim' if stats['cache_hit'] else 'não'}")
+    if stats["output_rows"] is not None:
+        print(f"- Linhas geradas: {stats['output_rows']:,}")
+    for entry in sorted(stats["stages"], key=lambda entry: -(entry["slot_ms"] or 0))[:5]:
+        print(f"  · {entry['name']}: {entry['seconds'] or 0:.2f}s | {entry['slot_ms'] or 0:,} slot-ms | "
+              f"{entry['records_read'] or 0:,} → {entry['records_written'] or 0:,} linhas")
+
+
+def read_runs(path=PERF_LOG_PATH):
+    runs = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    runs.append(json.loads(line))
+    except OSError:
+        pass
+    return runs
+
+def run_metrics(run):
+    """Métricas comparáveis de uma execução: tempo total, de cada etapa e, por descrição de job,
+    a soma de duração, bytes e slot-ms dos jobs (cargas em vários jobs viram uma linha)"""
+    metrics = {("execução", "seconds"): run["seconds"]}
+    for name, seconds in run["stages"].items():
+        metrics[(f"etapa {name}", "seconds")] = seconds
+    for job in run["jobs"]:
+        for metric in COMPARED_METRICS:
+            if job.get(metric) is not None:
+                key = (f"job {job['description']}", metric)
+                metrics[key] = metrics.get(key, 0) + job[metric]
+    return metrics
+
+def format_metric(metric, value):
+    if value is None:
+        return "-"
+    if metric == "seconds":
+        return f"{value:,.2f}s"
+    if metric == "slot_millis":
+        return f"{value:,.0f}"
+    return f"{value / 1e6:,.2f} MB"
+
+def compare_runs(runs, script=None, baseline=BASELINE_RUNS, threshold=REGRESSION_THRESHOLD):
+    """Compara a última execução de cada script com a mediana das `baseline` execuções
+    bem-sucedidas anteriores e retorna a quantidade de regressões acima de `threshold`"""
+    scripts = [script] if script else sorted({run["script"] for run in runs})
+    regressions = 0
+    for name in scripts:
+        script_runs = [run for run in runs if run["script"] == name]
+        if not script_runs:
+            print(f"⚠️ Nenhuma execução de {name} no log")
+            continue
+        latest = script_runs[-1]
+        previous = [run for run in script_runs[:-1] if run["status"] == "ok"][-baseline:]
+        print("\n" + "="*60)
+        print(f" {name.upper()}: {latest['started_at']} ({latest['status']}) ")
+        print("="*60)
+        if not previous:
+            print("ℹ️ Sem execuções anteriores para comparar")
+            continue
+        print(f"Referência: mediana de {len(previous)} execuções anteriores bem-sucedidas")
+        current = run_metrics(latest)
+        history = [run_metrics(run) for run in previous]
+        print(f"{'métrica':<44} {'referência':>14} {'atual':>14} {'variação':>9}")
+        for key in sorted(current, key=lambda key: (key[0] != "execução", key)):
+            values = [metrics[key] for metrics in history if key in metrics]
+            label = f"{key[0]} [{key[1]}]"
+            if not values:
+                print(f"{label:<44} {'-':>14} {format_metric(key[1], current[key]):>14} {'novo':>9}")
+                continue
+            reference = statistics.median(values)
+            change = (current[key] - reference) / reference if reference else 0.0
+            flag = ""
+            noise = key[1] == "seconds" and current[key] - reference < MIN_SECONDS_DELTA
+            if change > threshold and not noise:
+                flag = " ⚠️"
+                regressions += 1
+            print(f"{label:<44} {format_metric(key[1], reference):>14} "
+                  f"{format_metric(key[1], current[key]):>14} {change:>+8.0%}{flag}")
+    if regressions:
+        print(f"\n⚠️ {regressions} métricas pioraram mais de {threshold:.0%}")
+    else:
+        print(f"\n✅ Nenhuma métrica piorou mais de {threshold:.0%}")
+    return regressions
+
+def list_runs(runs, limit=20):
+    print(f"{'início':<25} {'script':<18} {'status':<8} {'duração':>10} {'jobs':>5} {'faturado':>12}")
+    for run in runs[-limit:]:
+        billed = sum(job.get("total_bytes_billed") or 0 for job in run["jobs"])
+        print(f"{run['started_at']:<25} {run['script']:<18} {run['status']:<8} {run['seconds']:>9.2f}s "
+              f"{len(run['jobs']):>5} {billed / 1e6:>9,.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=PERF_LOG_PATH, help="Log de desempenho em JSONL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runs_parser = commands.add_parser("runs", help="Lista as últimas execuções registradas")
+    runs_parser.add_argument("--limit", type=int, default=20)
+    compare_parser = commands.add_parser("compare", help="Compara a última execução com as anteriores")
+    compare_parser.add_argument("--script", help="Compara apenas as execuções deste script")
+    compare_parser.add_argument("--baseline", type=int, default=BASELINE_RUNS,
+                                help="Execuções anteriores usadas como referência")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                                help="Aumento relativo sinalizado como regressão (0.2 = 20%%)")
+    compare_parser.add_argument("--fail-on-regression", action="store_true",
+                                help="Termina com código 1 se houver regressões")
+    args = parser.parse_args()
+
+    runs = read_runs(args.log)
+    if not runs:
+        raise SystemExit(f"Nenhuma execução registrada em {args.log}")
+    if args.command == "runs":
+        list_runs(runs, args.limit)
+    else:
+        regressions = compare_runs(runs, args.script, args.baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
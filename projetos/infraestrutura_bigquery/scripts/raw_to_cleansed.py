@@ -1,21 +1,108 @@
 from google.cloud import bigquery
-from google.oauth2 import service_account
+import argparse
+import hashlib
+import json
+import os
 import time
+from gcp_clients import get_bigquery_client
+from job_monitor import finish_run, stage, start_run, wait_for_job
+from stage_cache import run_cached, table_fingerprint
 
 CREDENTIAL_PATH = "key.json"  # Substitua pelo caminho do seu arquivo de credenciais
 DATASET_NAME = "PROUNI"
 SOURCE_TABLE_NAME = "raw_data"
 OUTPUT_TABLE_NAME = "cleansed_data"
+LOAD_STATE_PATH = "../staging/raw_data/_loaded.json"  # Anos carregados na raw_data, gravado pelo source_to_raw.py
+STATE_PATH = "../staging/cleansed_data_state.json"  # Anos da raw_data refletidos na cleansed_data
+DETECTION_MODES = ("load-state", "checksum")
+
+# Colunas da cleansed_data a partir da raw_data (regras da transformação)
+SELECT_COLUMNS = """
+  SAFE_CAST(ANO_CONCESSAO_BOLSA AS INT64) AS ANO_CONCESSAO_BOLSA,
+  SAFE_CAST(CODIGO_EMEC_IES_BOLSA AS INT64) AS CODIGO_EMEC_IES_BOLSA,
+  
+  NOME_IES_BOLSA,
+  TIPO_BOLSA,
+  CASE
+    WHEN TIPO_BOLSA LIKE '%PARCIAL%' THEN 'PARCIAL'
+    WHEN TIPO_BOLSA LIKE '%COMPLEMENTAR%' THEN 'COMPLEMENTAR'
+    WHEN TIPO_BOLSA LIKE '%INTEGRAL%' THEN 'INTEGRAL'
+    ELSE 'OUTROS'
+  END AS TIPO_BOLSA_CATEGORIZADO,
+  CASE
+    WHEN UPPER(MODALIDADE_ENSINO_BOLSA) LIKE '%DISTÂNCIA%' THEN 'EAD'
+    ELSE UPPER(MODALIDADE_ENSINO_BOLSA)
+  END AS MODALIDADE_ENSINO_BOLSA,
+  NOME_CURSO_BOLSA,
+  CASE
+    WHEN UPPER(NOME_TURNO_CURSO_BOLSA) LIKE '%CURSO%' THEN 'EAD'
+    ELSE UPPER(NOME_TURNO_CURSO_BOLSA)
+  END AS NOME_TURNO_CURSO_BOLSA,
+  CPF_BENEFICIARIO_BOLSA,
+  CASE 
+    WHEN UPPER(SEXO_BENEFICIARIO_BOLSA) IN ('MASCULINO', 'M') THEN 'M'
+    WHEN UPPER(SEXO_BENEFICIARIO_BOLSA) IN ('FEMININO', 'F') THEN 'F'
+    ELSE NULL
+  END AS SEXO_BENEFICIARIO_BOLSA,
+  CASE
+    WHEN UPPER(RACA_BENEFICIARIO_BOLSA) LIKE '%INFO%' THEN NULL
+    WHEN UPPER(RACA_BENEFICIARIO_BOLSA) LIKE 'IND%' THEN 'INDÍGENA'
+    ELSE UPPER(RACA_BENEFICIARIO_BOLSA)
+  END AS RACA_BENEFICIARIO_BOLSA,
+  
+  SAFE.PARSE_DATE('%d/%m/%Y', DT_NASCIMENTO_BENEFICIARIO) AS DT_NASCIMENTO_BENEFICIARIO,
+
+  CASE 
+    WHEN UPPER(BENEFICIARIO_DEFICIENTE_FISICO) IN ('SIM', 'S') THEN TRUE
+    WHEN UPPER(BENEFICIARIO_DEFICIENTE_FISICO) IN ('NÃO', 'N') THEN FALSE
+    ELSE NULL
+  END AS BENEFICIARIO_DEFICIENTE_FISICO,
+  NULLIF(UPPER(REGIAO_BENEFICIARIO_BOLSA), 'NAN') AS REGIAO_BENEFICIARIO_BOLSA,
+  NULLIF(SIGLA_UF_BENEFICIARIO_BOLSA, 'nan') AS SIGLA_UF_BENEFICIARIO_BOLSA,
+  NULLIF(MUNICIPIO_BENEFICIARIO_BOLSA, 'nan') AS MUNICIPIO_BENEFICIARIO_BOLSA
+"""
+
+CREATE_QUERY = """
+CREATE OR REPLACE TABLE `{output}`
+PARTITION BY RANGE_BUCKET(ANO_CONCESSAO_BOLSA, GENERATE_ARRAY(2005, 2020, 1))
+CLUSTER BY SIGLA_UF_BENEFICIARIO_BOLSA, MUNICIPIO_BENEFICIARIO_BOLSA, TIPO_BOLSA
+AS
+SELECT{columns}FROM `{source}`
+"""
+
+# Substitui as partições dos anos alterados em uma única instrução: as linhas atuais desses
+# anos são removidas e as novas inseridas (ON FALSE: nenhuma linha é atualizada)
+MERGE_QUERY = """
+MERGE `{output}` AS cleansed
+USING (
+  SELECT{columns}  FROM `{source}`
+  WHERE {source_filter}
+) AS changed
+ON FALSE
+WHEN NOT MATCHED BY SOURCE AND {target_filter} THEN DELETE
+WHEN NOT MATCHED THEN INSERT ROW
+"""
+
+# Linhas e checksum (independente da ordem) de cada ano da raw_data. O checksum é a soma, e não o
+# XOR, das impressões digitais das linhas: com XOR, pares de linhas iguais se anulariam
+CHECKSUM_QUERY = """
+SELECT
+  IFNULL(ANO_CONCESSAO_BOLSA, 'null') AS partition_key,
+  COUNT(*) AS row_count,
+  SUM(CAST(FARM_FINGERPRINT(TO_JSON_STRING(raw)) AS BIGNUMERIC)) AS checksum
+FROM `{source}` AS raw
+GROUP BY partition_key
+"""
+
+# Muda quando as regras ou o particionamento mudam: o estado anterior deixa de valer
+RULES_VERSION = hashlib.sha256((SELECT_COLUMNS + CREATE_QUERY).encode()).hexdigest()[:16]
 
 def authenticate_gcp(credential_path):
     """Autentica no GCP usando credenciais de service account"""
     print("\n[1/4] Iniciando autenticação no GCP...")
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            credential_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+        # Credenciais e cliente compartilhados: no run_pipeline.py, carregados uma única vez
+        client = get_bigquery_client(credential_path)
         print("✅ Autenticação bem-sucedida!")
         return client
     except Exception as e:
@@ -34,14 +121,111 @@ def check_table_exists(client, dataset_name, table_name):
         print(f"⚠️ Tabela não encontrada: {str(e)}")
         return False
 
-def execute_raw_to_cleansed_transformation(client):
-    """Executa a transformação de raw para cleansed usando a query SQL"""
+def format_bytes(num_bytes):
+    return f"{(num_bytes or 0) / 1e6:,.2f} MB"
+
+def run_query(client, query, description):
+    """Executa a query após um dry run, reportando os bytes estimados e as estatísticas do job
+    (bytes processados e faturados, slot-ms, cache), que também vão para o log de desempenho"""
+    dry_run_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, use_legacy_sql=False)
+    dry_run_job = client.query(query, job_config=dry_run_config)
+    print(f"🔎 Dry run ({description}): {format_bytes(dry_run_job.total_bytes_processed)} a processar")
+    
+    query_job = client.query(query, job_config=bigquery.QueryJobConfig(use_legacy_sql=False))
+    return wait_for_job(query_job, description)
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_state(path, detection, partitions):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = {"rules_version": RULES_VERSION, "table": f"{DATASET_NAME}.{OUTPUT_TABLE_NAME}", "detection": detection,
+             "partitions": partitions}
+    with open(path + ".partial", mode="w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".partial", path)
+
+def source_partitions(client, detection, source):
+    """Impressão digital de cada ano da raw_data: do estado gravado pelo source_to_raw.py (sem custo)
+    ou de um checksum calculado no BigQuery (percorre a raw_data inteira). None se não houver estado"""
+    if detection == "load-state":
+        load_state = read_json(LOAD_STATE_PATH)
+        if load_state is None:
+            print(f"⚠️ Estado da carga não encontrado em {LOAD_STATE_PATH}")
+            return None
+        print(f"ℹ️ Estado da carga de {load_state['loaded_at']} com {len(load_state['partitions'])} anos")
+        return {key: partition["fingerprint"] for key, partition in load_state["partitions"].items()}
+    
+    query_job = run_query(client, CHECKSUM_QUERY.format(source=source), "checksum por ano")
+    return {row.partition_key: f"{row.row_count}:{row.checksum}" for row in query_job.result()}
+
+def changed_partitions(current, previous):
+    """Anos novos, alterados ou removidos da raw_data desde a última transformação"""
+    return sorted(key for key in set(current) | set(previous) if current.get(key) != previous.get(key))
+
+def to_year(partition):
+    """Ano da partição na cleansed_data (SAFE_CAST); valores não numéricos vão para a partição nula"""
+    try:
+        return int(partition)
+    except ValueError:
+        return None
+
+def year_filter(column, partitions):
+    """Filtro SQL dos anos das partições, incluindo o ano nulo quando necessário"""
+    years = sorted({to_year(partition) for partition in partitions} - {None})
+    conditions = [f"{column} IN ({', '.join(map(str, years))})"] if years else []
+    if any(to_year(partition) is None for partition in partitions):
+        conditions.append(f"{column} IS NULL")
+    return "(" + " OR ".join(conditions) + ")"
+
+def sql_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def source_key_filter(column, partitions, keys):
+    """Filtro SQL da raw_data pelos valores originais (STRING) do ano, sem CAST, para que a
+    clusterização pela coluna pode os blocos lidos. Inclui todas as chaves em `keys` cujo ano na
+    cleansed_data é um dos anos das partições: as linhas removidas de um ano são todas reinseridas"""
+    years = {to_year(partition) for partition in partitions}
+    selected = sorted(key for key in keys if to_year(key) in years)
+    values = [key for key in selected if key != "null"]
+    conditions = [f"{column} IN ({', '.join(map(sql_string, values))})"] if values else []
+    if "null" in selected:
+        conditions.append(f"{column} IS NULL")
+    return "(" + " OR ".join(conditions) + ")"
+
+def execute_raw_to_cleansed_transformation(client, full=False, detection="load-state"):
+    """Executa a transformação de raw para cleansed. Por padrão, apenas os anos alterados na
+    raw_data desde a última execução são reescritos (MERGE por partição); sem estado anterior,
+    com regras diferentes ou com `full=True`, a tabela é recriada por completo"""
     print("\n[2/4] Preparando transformação de dados...")
     
     # Verifica se a tabela de origem existe
     if not check_table_exists(client, DATASET_NAME, SOURCE_TABLE_NAME):
         raise Exception(f"Tabela de origem {SOURCE_TABLE_NAME} não encontrada!")
     
+    source = f"{client.project}.{DATASET_NAME}.{SOURCE_TABLE_NAME}"
+    output = f"{client.project}.{DATASET_NAME}.{OUTPUT_TABLE_NAME}"
+    current = source_partitions(client, detection, source)
+    previous = read_json(STATE_PATH)
+    if full:
+        reason = "solicitada com --full"
+    elif current is None:
+        reason = "sem estado da carga da raw_data"
+    elif previous is None or previous.get("table") != f"{DATASET_NAME}.{OUTPUT_TABLE_NAME}":
+        reason = "sem estado da última transformação"
+    elif previous.get("rules_version") != RULES_VERSION:
+        reason = "regras da transformação alteradas"
+    elif previous.get("detection") != detection:
+        reason = "modo de detecção diferente da última transformação"
+    elif not check_table_exists(client, DATASET_NAME, OUTPUT_TABLE_NAME):
+        reason = f"tabela {OUTPUT_TABLE_NAME} inexistente"
+    else:
+        reason = None
+    
     print("\n[3/4] Executando transformação...")
     print("🔧 Operações que serão realizadas:")
     print("- Converter tipos de dados (datas, números)")
@@ -51,67 +235,30 @@ def execute_raw_to_cleansed_transformation(client):
     
     start_time = time.time()
     
-    # Query SQL para transformação
-    query = f"""
-    CREATE OR REPLACE TABLE `{client.project}.{DATASET_NAME}.{OUTPUT_TABLE_NAME}`
-    PARTITION BY RANGE_BUCKET(ANO_CONCESSAO_BOLSA, GENERATE_ARRAY(2005, 2020, 1))
-    CLUSTER BY SIGLA_UF_BENEFICIARIO_BOLSA, MUNICIPIO_BENEFICIARIO_BOLSA, TIPO_BOLSA
-    AS
-    SELECT
-      SAFE_CAST(ANO_CONCESSAO_BOLSA AS INT64) AS ANO_CONCESSAO_BOLSA,
-      SAFE_CAST(CODIGO_EMEC_IES_BOLSA AS INT64) AS CODIGO_EMEC_IES_BOLSA,
-      
-      NOME_IES_BOLSA,
-      TIPO_BOLSA,
-      CASE
-        WHEN TIPO_BOLSA LIKE '%PARCIAL%' THEN 'PARCIAL'
-        WHEN TIPO_BOLSA LIKE '%COMPLEMENTAR%' THEN 'COMPLEMENTAR'
-        WHEN TIPO_BOLSA LIKE '%INTEGRAL%' THEN 'INTEGRAL'
-        ELSE 'OUTROS'
-      END AS TIPO_BOLSA_CATEGORIZADO,
-      CASE
-        WHEN UPPER(MODALIDADE_ENSINO_BOLSA) LIKE '%DISTÂNCIA%' THEN 'EAD'
-        ELSE UPPER(MODALIDADE_ENSINO_BOLSA)
-      END AS MODALIDADE_ENSINO_BOLSA,
-      NOME_CURSO_BOLSA,
-      CASE
-        WHEN UPPER(NOME_TURNO_CURSO_BOLSA) LIKE '%CURSO%' THEN 'EAD'
-        ELSE UPPER(NOME_TURNO_CURSO_BOLSA)
-      END AS NOME_TURNO_CURSO_BOLSA,
-      CPF_BENEFICIARIO_BOLSA,
-      CASE 
-        WHEN UPPER(SEXO_BENEFICIARIO_BOLSA) IN ('MASCULINO', 'M') THEN 'M'
-        WHEN UPPER(SEXO_BENEFICIARIO_BOLSA) IN ('FEMININO', 'F') THEN 'F'
-        ELSE NULL
-      END AS SEXO_BENEFICIARIO_BOLSA,
-      CASE
-        WHEN UPPER(RACA_BENEFICIARIO_BOLSA) LIKE '%INFO%' THEN NULL
-        WHEN UPPER(RACA_BENEFICIARIO_BOLSA) LIKE 'IND%' THEN 'INDÍGENA'
-        ELSE UPPER(RACA_BENEFICIARIO_BOLSA)
-      END AS RACA_BENEFICIARIO_BOLSA,
-      
-      SAFE.PARSE_DATE('%d/%m/%Y', DT_NASCIMENTO_BENEFICIARIO) AS DT_NASCIMENTO_BENEFICIARIO,
-
-      CASE 
-        WHEN UPPER(BENEFICIARIO_DEFICIENTE_FISICO) IN ('SIM', 'S') THEN TRUE
-        WHEN UPPER(BENEFICIARIO_DEFICIENTE_FISICO) IN ('NÃO', 'N') THEN FALSE
-        ELSE NULL
-      END AS BENEFICIARIO_DEFICIENTE_FISICO,
-      NULLIF(UPPER(REGIAO_BENEFICIARIO_BOLSA), 'NAN') AS REGIAO_BENEFICIARIO_BOLSA,
-      NULLIF(SIGLA_UF_BENEFICIARIO_BOLSA, 'nan') AS SIGLA_UF_BENEFICIARIO_BOLSA,
-      NULLIF(MUNICIPIO_BENEFICIARIO_BOLSA, 'nan') AS MUNICIPIO_BENEFICIARIO_BOLSA
-    FROM `{client.project}.{DATASET_NAME}.{SOURCE_TABLE_NAME}`
-    """
-    
-    # Configuração do job
-    job_config = bigquery.QueryJobConfig()
-    job_config.use_legacy_sql = False
+    if reason is not None:
+        print(f"\n🚀 Transformação completa ({reason})...")
+        run_query(client, CREATE_QUERY.format(output=output, source=source, columns=SELECT_COLUMNS),
+                  "recriação da tabela")
+    else:
+        changed = changed_partitions(current, previous["partitions"])
+        if not changed:
+            print("\n✅ Nenhum ano alterado desde a última transformação. Nada a fazer.")
+        else:
+            print(f"\n🚀 Reescrevendo {len(changed)} de {len(current)} anos: {', '.join(changed)}")
+            query = MERGE_QUERY.format(
+                output=output, source=source, columns=SELECT_COLUMNS,
+                source_filter=source_key_filter("ANO_CONCESSAO_BOLSA", changed,
+                                                set(current) | set(previous["partitions"])),
+                target_filter=year_filter("cleansed.ANO_CONCESSAO_BOLSA", changed),
+            )
+            query_job = run_query(client, query, "merge dos anos alterados")
+            print(f"- Linhas afetadas: {query_job.num_dml_affected_rows:,}")
     
-    # Executa a query
-    print("\n🚀 Iniciando execução da query no BigQuery...")
-    query_job = client.query(query, job_config=job_config)
-    
-    query_job.result()  # Aguarda a conclusão final
+    if current is not None:
+        save_state(STATE_PATH, detection, current)
+    elif os.path.exists(STATE_PATH):
+        # A cleansed_data foi recriada a partir de uma raw_data de conteúdo desconhecido
+        os.remove(STATE_PATH)
     
     elapsed_time = time.time() - start_time
     print(f"\n✅ Transformação concluída em {elapsed_time:.2f} segundos!")
@@ -129,22 +276,49 @@ def execute_raw_to_cleansed_transformation(client):
     print(f"- Partições: Por ANO_CONCESSAO_BOLSA (2005-2020)")
     print(f"- Clusterização: Por UF, Município e Tipo de Bolsa")
 
+def transform_if_changed(client, full=False, detection="load-state", force=False):
+    """Executa a transformação apenas se a raw_data (data de modificação e linhas) ou as regras
+    mudaram desde a última execução, ou se a cleansed_data foi alterada fora do pipeline.
+    `full` e `force` executam sempre"""
+    inputs = {
+        "source": table_fingerprint(client, DATASET_NAME, SOURCE_TABLE_NAME),
+        "rules_version": RULES_VERSION,
+        "detection": detection,
+    }
+    run_cached("raw_to_cleansed", inputs,
+               lambda: execute_raw_to_cleansed_transformation(client, full, detection),
+               lambda: table_fingerprint(client, DATASET_NAME, OUTPUT_TABLE_NAME),
+               force=force or full)
+
 def main():
+    parser = argparse.ArgumentParser(description="Transforma a raw_data na tabela cleansed_data do BigQuery")
+    parser.add_argument("--full", action="store_true", help="Recria a tabela inteira, mesmo sem anos alterados")
+    parser.add_argument("--detect", choices=DETECTION_MODES, default="load-state",
+                        help="Como detectar os anos alterados: estado gravado pelo source_to_raw.py (padrão) "
+                             "ou checksum calculado na raw_data (percorre a tabela inteira)")
+    parser.add_argument("--force", action="store_true",
+                        help="Executa a transformação mesmo sem alterações na raw_data desde a última execução")
+    args = parser.parse_args()
+    
     print("\n" + "="*50)
     print(" INÍCIO DO PROCESSO RAW_TO_CLEANSED ")
     print("="*50)
     
+    start_run("raw_to_cleansed")
     try:
         # Autentica no GCP
         client = authenticate_gcp(CREDENTIAL_PATH)
         
         # Executa a transformação
-        execute_raw_to_cleansed_transformation(client)
+        with stage("raw_to_cleansed/transformação"):
+            transform_if_changed(client, args.full, args.detect, args.force)
+        finish_run("ok")
         
         print("\n" + "="*50)
         print(" PROCESSO CONCLUÍDO COM SUCESSO! ")
         print("="*50)
     except Exception as e:
+        finish_run("falhou")
         print("\n" + "="*50)
         print("❌ ERRO NO PROCESSAMENTO")
         print(f"Motivo: {str(e)}")
@@ -0,0 +1,339 @@
+"""
+Transformação raw → cleansed executada localmente, sem o BigQuery.
+
+Aplica as mesmas regras do SELECT do raw_to_cleansed.py (tipagem, TIPO_BOLSA_CATEGORIZADO,
+normalização do EAD, mapeamentos de sexo, raça e deficiência e SAFE.PARSE_DATE) aos arquivos
+Parquet preparados pelo source_to_raw.py (`python source_to_raw.py --stage-only`) e grava
+o resultado em Parquet, com o schema da tabela cleansed_data, uma pasta por ano.
+
+As regras são escritas uma a uma como funções sobre um único valor, espelhando cada CASE
+da query, e aplicadas aos valores distintos de cada coluna (dictionary encode): o resultado
+é expandido para todas as linhas com um `take`. As colunas da raw_data têm poucos valores
+distintos, então o custo é o de algumas operações vetorizadas do Arrow por bloco.
+
+Uso:
+    python raw_to_cleansed_local.py                          # todos os anos do staging
+    python raw_to_cleansed_local.py --years 2019 2020        # apenas alguns anos
+    python raw_to_cleansed_local.py --self-check             # casos de borda, sem acesso ao GCP
+    python raw_to_cleansed_local.py --check-parity           # compara com a query no BigQuery
+
+O `--self-check` é a verificação da CI: não precisa de credenciais. O `--check-parity` é manual
+e grava a amostra em um dataset de rascunho (PARITY_DATASET), com expiração, fora do PROUNI.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from source_to_raw import STAGING_MANIFEST, STAGING_PATH, common_columns, partition_dir
+
+OUTPUT_PATH = "../staging/cleansed_data"
+SAMPLE_ROWS = 10_000  # Linhas do staging enviadas na verificação de paridade
+PARITY_DATASET = "PROUNI_PARITY"  # Dataset de rascunho da verificação de paridade, separado do PROUNI
+PARITY_EXPIRATION_MS = 3600 * 1000  # As tabelas de amostra expiram sozinhas se a execução for interrompida
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+INT64_LITERAL = re.compile(r"\s*([+-]?)(?:0[xX]([0-9a-fA-F]+)|([0-9]+))\s*")
+
+# Schema da tabela cleansed_data, na ordem do SELECT do raw_to_cleansed.py
+CLEANSED_SCHEMA = pa.schema([
+    ("ANO_CONCESSAO_BOLSA", pa.int64()),
+    ("CODIGO_EMEC_IES_BOLSA", pa.int64()),
+    ("NOME_IES_BOLSA", pa.string()),
+    ("TIPO_BOLSA", pa.string()),
+    ("TIPO_BOLSA_CATEGORIZADO", pa.string()),
+    ("MODALIDADE_ENSINO_BOLSA", pa.string()),
+    ("NOME_CURSO_BOLSA", pa.string()),
+    ("NOME_TURNO_CURSO_BOLSA", pa.string()),
+    ("CPF_BENEFICIARIO_BOLSA", pa.string()),
+    ("SEXO_BENEFICIARIO_BOLSA", pa.string()),
+    ("RACA_BENEFICIARIO_BOLSA", pa.string()),
+    ("DT_NASCIMENTO_BENEFICIARIO", pa.date32()),
+    ("BENEFICIARIO_DEFICIENTE_FISICO", pa.bool_()),
+    ("REGIAO_BENEFICIARIO_BOLSA", pa.string()),
+    ("SIGLA_UF_BENEFICIARIO_BOLSA", pa.string()),
+    ("MUNICIPIO_BENEFICIARIO_BOLSA", pa.string()),
+])
+
+
+# Regras, valor a valor. None é o NULL do SQL; UPPER e LIKE diferenciam maiúsculas como no BigQuery
+def safe_cast_int64(value):
+    """SAFE_CAST(x AS INT64): inteiro decimal ou hexadecimal; fora do intervalo ou inválido vira NULL"""
+    match = INT64_LITERAL.fullmatch(value) if value is not None else None
+    if match is None:
+        return None
+    sign, hex_digits, digits = match.groups()
+    number = int(hex_digits, 16) if hex_digits else int(digits)
+    number = -number if sign == "-" else number
+    return number if INT64_MIN <= number <= INT64_MAX else None
+
+def tipo_bolsa_categorizado(tipo_bolsa):
+    # NULL LIKE ... é NULL: cai no ELSE
+    if tipo_bolsa is None:
+        return "OUTROS"
+    if "PARCIAL" in tipo_bolsa:
+        return "PARCIAL"
+    if "COMPLEMENTAR" in tipo_bolsa:
+        return "COMPLEMENTAR"
+    if "INTEGRAL" in tipo_bolsa:
+        return "INTEGRAL"
+    return "OUTROS"
+
+def modalidade_ensino(modalidade):
+    if modalidade is None:
+        return None
+    return "EAD" if "DISTÂNCIA" in modalidade.upper() else modalidade.upper()
+
+def turno_curso(turno):
+    if turno is None:
+        return None
+    return "EAD" if "CURSO" in turno.upper() else turno.upper()
+
+def sexo(value):
+    if value is None:
+        return None
+    return {"MASCULINO": "M", "M": "M", "FEMININO": "F", "F": "F"}.get(value.upper())
+
+def raca(value):
+    if value is None or "INFO" in value.upper():
+        return None
+    return "INDÍGENA" if value.upper().startswith("IND") else value.upper()
+
+def parse_date(value):
+    """SAFE.PARSE_DATE('%d/%m/%Y', x)"""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+def deficiente_fisico(value):
+    if value is None:
+        return None
+    return {"SIM": True, "S": True, "NÃO": False, "N": False}.get(value.upper())
+
+def regiao(value):
+    return None if value is None or value.upper() == "NAN" else value.upper()
+
+def null_if_nan(value):
+    return None if value == "nan" else value
+
+
+def map_values(column, rule, type):
+    """Aplica a regra aos valores distintos da coluna (NULL incluído) e expande para todas as linhas"""
+    encoded = pc.dictionary_encode(column.combine_chunks(), null_encoding="encode")
+    mapped = pa.array([rule(value) for value in encoded.dictionary.to_pylist()], type=type)
+    return pc.take(mapped, encoded.indices)
+
+def cleanse_table(raw):
+    """Tabela da raw_data (todas as colunas STRING) → tabela no schema da cleansed_data"""
+    missing = [name for name in common_columns if name not in raw.column_names]
+    if missing:
+        raise ValueError(f"Colunas ausentes na raw_data: {', '.join(missing)}")
+
+    raw = raw.cast(pa.schema([(name, pa.string()) for name in raw.column_names]))
+    column = raw.column
+    columns = [
+        map_values(column("ANO_CONCESSAO_BOLSA"), safe_cast_int64, pa.int64()),
+        map_values(column("CODIGO_EMEC_IES_BOLSA"), safe_cast_int64, pa.int64()),
+        column("NOME_IES_BOLSA").combine_chunks(),
+        column("TIPO_BOLSA").combine_chunks(),
+        map_values(column("TIPO_BOLSA"), tipo_bolsa_categorizado, pa.string()),
+        map_values(column("MODALIDADE_ENSINO_BOLSA"), modalidade_ensino, pa.string()),
+        column("NOME_CURSO_BOLSA").combine_chunks(),
+        map_values(column("NOME_TURNO_CURSO_BOLSA"), turno_curso, pa.string()),
+        column("CPF_BENEFICIARIO_BOLSA").combine_chunks(),
+        map_values(column("SEXO_BENEFICIARIO_BOLSA"), sexo, pa.string()),
+        map_values(column("RACA_BENEFICIARIO_BOLSA"), raca, pa.string()),
+        map_values(column("DT_NASCIMENTO_BENEFICIARIO"), parse_date, pa.date32()),
+        map_values(column("BENEFICIARIO_DEFICIENTE_FISICO"), deficiente_fisico, pa.bool_()),
+        map_values(column("REGIAO_BENEFICIARIO_BOLSA"), regiao, pa.string()),
+        map_values(column("SIGLA_UF_BENEFICIARIO_BOLSA"), null_if_nan, pa.string()),
+        map_values(column("MUNICIPIO_BENEFICIARIO_BOLSA"), null_if_nan, pa.string()),
+    ]
+    return pa.Table.from_arrays(columns, schema=CLEANSED_SCHEMA)
+
+
+def staged_parts(staging_path, years=None):
+    """Partes do staging (na ordem dos anos), opcionalmente apenas dos anos pedidos"""
+    with open(os.path.join(staging_path, STAGING_MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    parts = [part for _, entry in sorted(manifest["files"].items()) for part in entry["parts"]]
+    if years is not None:
+        parts = [part for part in parts if part["partition"] in years]
+    return parts
+
+def transform(staging_path=STAGING_PATH, output_path=OUTPUT_PATH, years=None):
+    """Transforma as partes do staging, uma a uma, gravando um Parquet por parte em `output_path`.
+    As pastas dos anos transformados são recriadas; as dos demais anos não são alteradas"""
+    parts = staged_parts(staging_path, years)
+    for partition in {part["partition"] for part in parts}:
+        shutil.rmtree(os.path.join(output_path, partition_dir(partition)), ignore_errors=True)
+
+    rows = 0
+    for part in parts:
+        start_time = time.time()
+        cleansed = cleanse_table(pq.read_table(os.path.join(staging_path, part["path"])))
+        path = os.path.join(output_path, part["path"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(cleansed, path + ".partial", compression="zstd")
+        os.replace(path + ".partial", path)
+        rows += cleansed.num_rows
+        print(f"✅ {part['path']} transformado em {time.time() - start_time:.2f}s | Linhas: {cleansed.num_rows:,}")
+    return rows
+
+
+# Casos de borda das regras: linha da raw_data (colunas omitidas ficam NULL) e valores esperados
+# da cleansed_data, conforme a semântica do BigQuery
+EDGE_CASES = [
+    ({"ANO_CONCESSAO_BOLSA": "2019", "CODIGO_EMEC_IES_BOLSA": "123", "TIPO_BOLSA": "BOLSA PARCIAL 50%"},
+     {"ANO_CONCESSAO_BOLSA": 2019, "CODIGO_EMEC_IES_BOLSA": 123, "TIPO_BOLSA_CATEGORIZADO": "PARCIAL"}),
+    ({"ANO_CONCESSAO_BOLSA": "2019.0", "CODIGO_EMEC_IES_BOLSA": "abc", "TIPO_BOLSA": "BOLSA COMPLEMENTAR 25%"},
+     {"ANO_CONCESSAO_BOLSA": None, "CODIGO_EMEC_IES_BOLSA": None, "TIPO_BOLSA_CATEGORIZADO": "COMPLEMENTAR"}),
+    ({"CODIGO_EMEC_IES_BOLSA": "99999999999999999999", "TIPO_BOLSA": "bolsa integral"},
+     {"CODIGO_EMEC_IES_BOLSA": None, "TIPO_BOLSA_CATEGORIZADO": "OUTROS"}),
+    ({"TIPO_BOLSA": "BOLSA INTEGRAL"}, {"TIPO_BOLSA_CATEGORIZADO": "INTEGRAL"}),
+    ({}, {"TIPO_BOLSA_CATEGORIZADO": "OUTROS", "MODALIDADE_ENSINO_BOLSA": None, "SEXO_BENEFICIARIO_BOLSA": None,
+          "RACA_BENEFICIARIO_BOLSA": None, "DT_NASCIMENTO_BENEFICIARIO": None,
+          "BENEFICIARIO_DEFICIENTE_FISICO": None, "REGIAO_BENEFICIARIO_BOLSA": None}),
+    ({"MODALIDADE_ENSINO_BOLSA": "EDUCAÇÃO A DISTÂNCIA", "NOME_TURNO_CURSO_BOLSA": "Curso a distância"},
+     {"MODALIDADE_ENSINO_BOLSA": "EAD", "NOME_TURNO_CURSO_BOLSA": "EAD"}),
+    ({"MODALIDADE_ENSINO_BOLSA": "Presencial", "NOME_TURNO_CURSO_BOLSA": "Noturno"},
+     {"MODALIDADE_ENSINO_BOLSA": "PRESENCIAL", "NOME_TURNO_CURSO_BOLSA": "NOTURNO"}),
+    ({"SEXO_BENEFICIARIO_BOLSA": "Masculino", "RACA_BENEFICIARIO_BOLSA": "Indígena"},
+     {"SEXO_BENEFICIARIO_BOLSA": "M", "RACA_BENEFICIARIO_BOLSA": "INDÍGENA"}),
+    ({"SEXO_BENEFICIARIO_BOLSA": "f", "RACA_BENEFICIARIO_BOLSA": "Não Informada"},
+     {"SEXO_BENEFICIARIO_BOLSA": "F", "RACA_BENEFICIARIO_BOLSA": None}),
+    ({"SEXO_BENEFICIARIO_BOLSA": "Outro", "RACA_BENEFICIARIO_BOLSA": "Parda"},
+     {"SEXO_BENEFICIARIO_BOLSA": None, "RACA_BENEFICIARIO_BOLSA": "PARDA"}),
+    ({"DT_NASCIMENTO_BENEFICIARIO": "07/09/1968", "BENEFICIARIO_DEFICIENTE_FISICO": "não"},
+     {"DT_NASCIMENTO_BENEFICIARIO": datetime(1968, 9, 7).date(), "BENEFICIARIO_DEFICIENTE_FISICO": False}),
+    ({"DT_NASCIMENTO_BENEFICIARIO": "30/02/1990", "BENEFICIARIO_DEFICIENTE_FISICO": "S"},
+     {"DT_NASCIMENTO_BENEFICIARIO": None, "BENEFICIARIO_DEFICIENTE_FISICO": True}),
+    ({"DT_NASCIMENTO_BENEFICIARIO": "1990-02-01", "BENEFICIARIO_DEFICIENTE_FISICO": "talvez"},
+     {"DT_NASCIMENTO_BENEFICIARIO": None, "BENEFICIARIO_DEFICIENTE_FISICO": None}),
+    ({"REGIAO_BENEFICIARIO_BOLSA": "nan", "SIGLA_UF_BENEFICIARIO_BOLSA": "nan", "MUNICIPIO_BENEFICIARIO_BOLSA": "NAN"},
+     {"REGIAO_BENEFICIARIO_BOLSA": None, "SIGLA_UF_BENEFICIARIO_BOLSA": None, "MUNICIPIO_BENEFICIARIO_BOLSA": "NAN"}),
+    ({"REGIAO_BENEFICIARIO_BOLSA": "Sudeste", "SIGLA_UF_BENEFICIARIO_BOLSA": "sp", "MUNICIPIO_BENEFICIARIO_BOLSA": "São Paulo"},
+     {"REGIAO_BENEFICIARIO_BOLSA": "SUDESTE", "SIGLA_UF_BENEFICIARIO_BOLSA": "sp", "MUNICIPIO_BENEFICIARIO_BOLSA": "São Paulo"}),
+]
+
+def edge_case_table():
+    raw_schema = pa.schema([(name, pa.string()) for name in common_columns])
+    return pa.Table.from_pylist([raw for raw, _ in EDGE_CASES], schema=raw_schema)
+
+def self_check():
+    """Confere as regras locais com os valores esperados dos casos de borda; retorna as divergências"""
+    cleansed = cleanse_table(edge_case_table()).to_pylist()
+    failures = []
+    for (raw, expected), row in zip(EDGE_CASES, cleansed):
+        for name, value in expected.items():
+            if row[name] != value:
+                failures.append(f"{raw} → {name}: esperado {value!r}, obtido {row[name]!r}")
+    return failures
+
+
+def sorted_rows(table):
+    indices = pc.sort_indices(table, sort_keys=[(name, "ascending") for name in table.column_names])
+    return table.take(indices).to_pylist()
+
+def compare_tables(expected, actual):
+    """Compara as tabelas linha a linha, após ordená-las; retorna as divergências (até 10)"""
+    if expected.num_rows != actual.num_rows:
+        return [f"Quantidade de linhas: BigQuery {expected.num_rows:,}, local {actual.num_rows:,}"]
+    differences = []
+    for expected_row, actual_row in zip(sorted_rows(expected.cast(CLEANSED_SCHEMA)), sorted_rows(actual)):
+        for name in CLEANSED_SCHEMA.names:
+            if expected_row[name] != actual_row[name] and len(differences) < 10:
+                differences.append(f"{name}: BigQuery {expected_row[name]!r}, local {actual_row[name]!r} "
+                                   f"(linha {expected_row})")
+    return differences
+
+def check_parity(client, sample):
+    """Executa o SELECT do raw_to_cleansed.py no BigQuery sobre uma amostra da raw_data enviada a uma
+    tabela temporária e compara o resultado com o da transformação local. A tabela fica no dataset
+    de rascunho PARITY_DATASET, cujas tabelas expiram em PARITY_EXPIRATION_MS"""
+    from google.cloud import bigquery
+    from raw_to_cleansed import SELECT_COLUMNS
+
+    dataset = bigquery.Dataset(f"{client.project}.{PARITY_DATASET}")
+    dataset.location = "US"
+    dataset.default_table_expiration_ms = PARITY_EXPIRATION_MS
+    client.create_dataset(dataset, exists_ok=True)
+    table_id = f"{client.project}.{PARITY_DATASET}.parity_raw_sample_{int(time.time())}"
+    buffer = io.BytesIO()
+    pq.write_table(sample, buffer)
+    buffer.seek(0)
+    job_config = bigquery.LoadJobConfig(
+        schema=[bigquery.SchemaField(name, "STRING") for name in sample.column_names],
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+    )
+    try:
+        client.load_table_from_file(buffer, table_id, job_config=job_config).result()
+        expected = client.query(f"SELECT{SELECT_COLUMNS}FROM `{table_id}`").to_arrow()
+    finally:
+        client.delete_table(table_id, not_found_ok=True)
+    return compare_tables(expected, cleanse_table(sample))
+
+def parity_sample(staging_path, sample_rows):
+    """Primeiras linhas de cada ano do staging, mais os casos de borda"""
+    parts = staged_parts(staging_path)
+    partitions = sorted({part["partition"] for part in parts}, key=str)
+    per_partition = max(sample_rows // max(len(partitions), 1), 1)
+    tables = [edge_case_table()]
+    for partition in partitions:
+        part = next(part for part in parts if part["partition"] == partition)
+        table = pq.read_table(os.path.join(staging_path, part["path"])).slice(0, per_partition)
+        tables.append(table.select(common_columns).cast(tables[0].schema))
+    return pa.concat_tables(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--staging-path", default=STAGING_PATH, help="Arquivos Parquet preparados pelo source_to_raw.py")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Diretório de saída da cleansed_data local")
+    parser.add_argument("--years", nargs="+", help="Anos a transformar (padrão: todos)")
+    parser.add_argument("--self-check", action="store_true", help="Confere as regras com os casos de borda e sai")
+    parser.add_argument("--check-parity", action="store_true",
+                        help="Compara a transformação local com a query do BigQuery em uma amostra")
+    parser.add_argument("--sample-rows", type=int, default=SAMPLE_ROWS, help="Linhas da amostra de paridade")
+    args = parser.parse_args()
+
+    if args.self_check:
+        failures = self_check()
+        for failure in failures:
+            print(f"❌ {failure}")
+        print(f"{len(EDGE_CASES) - len({failure.split(' → ')[0] for failure in failures})}/{len(EDGE_CASES)} "
+              f"casos de borda conferidos")
+        raise SystemExit(1 if failures else 0)
+
+    if args.check_parity:
+        from raw_to_cleansed import CREDENTIAL_PATH, authenticate_gcp
+
+        client = authenticate_gcp(CREDENTIAL_PATH)
+        sample = parity_sample(args.staging_path, args.sample_rows)
+        differences = check_parity(client, sample)
+        for difference in differences:
+            print(f"❌ {difference}")
+        print(f"{'❌ Divergências' if differences else '✅ Mesmo resultado'} em {sample.num_rows:,} linhas")
+        raise SystemExit(1 if differences else 0)
+
+    start_time = time.time()
+    rows = transform(args.staging_path, args.output, args.years)
+    elapsed_time = time.time() - start_time
+    print(f"\n✅ {rows:,} linhas transformadas em {elapsed_time:.2f}s ({rows / max(elapsed_time, 1e-9):,.0f} linhas/s)"
+          f" | saída: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Executa o pipeline do ProUni (source_to_raw → raw_to_cleansed → cleansed_to_csv) em um único
+processo.
+
+Os estágios compartilham as credenciais, o cliente do BigQuery e a sessão HTTP do
+gcp_clients.py: o key.json é lido, o token de acesso obtido e as conexões abertas uma única
+vez. O resultado e o tempo de cada estágio são gravados em `STATE_PATH` após cada estágio;
+`--resume` executa novamente, a partir do estágio que falhou, os estágios da última execução
+que não terminaram. Os tempos e as estatísticas dos jobs também vão para o log de desempenho
+do job_monitor.py, que compara as execuções.
+
+Uso:
+    python run_pipeline.py
+    python run_pipeline.py --stages raw_to_cleansed cleansed_to_csv
+    python run_pipeline.py --from-stage raw_to_cleansed
+    python run_pipeline.py --resume
+"""
+import argparse
+import json
+import os
+import time
+
+import cleansed_to_csv
+import job_monitor
+import raw_to_cleansed
+import source_to_raw
+from gcp_clients import CREDENTIAL_PATH, get_bigquery_client, get_storage_client
+
+STATE_PATH = "../staging/pipeline_state.json"
+STAGES = ("source_to_raw", "raw_to_cleansed", "cleansed_to_csv")
+
+
+def run_source_to_raw(client, args):
+    source_to_raw.create_dataset_if_not_exists(client, source_to_raw.DATASET_NAME)
+    source_to_raw.print_header("3/4 - processamento dos arquivos")
+    existing_files = source_to_raw.find_source_files(source_to_raw.RAW_DATA_PATH)
+    return source_to_raw.stage_and_load(client, existing_files, workers=args.workers)
+
+def run_raw_to_cleansed(client, args):
+    raw_to_cleansed.transform_if_changed(client, args.full_transform, force=args.force)
+
+def run_cleansed_to_csv(client, args):
+    # Mesmos parâmetros do cleansed_to_csv.py: as exportações dos dois se reaproveitam
+    if args.direct_export:
+        run_export = lambda: cleansed_to_csv.export_table_direct(
+            client, cleansed_to_csv.create_read_client(CREDENTIAL_PATH), args.export_format)
+        options = {"direct": True, "columns": None, "years": None}
+    else:
+        run_export = lambda: cleansed_to_csv.export_table_to_csv(
+            client, get_storage_client(CREDENTIAL_PATH), args.export_format)
+        options = {"direct": False}
+    cleansed_to_csv.export_if_changed(client, run_export, args.export_format, options, args.force)
+
+STAGE_FUNCTIONS = {
+    "source_to_raw": run_source_to_raw,
+    "raw_to_cleansed": run_raw_to_cleansed,
+    "cleansed_to_csv": run_cleansed_to_csv,
+}
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".partial", mode="w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".partial", path)
+
+def select_stages(args, previous):
+    """Estágios a executar, sempre na ordem do pipeline"""
+    if args.resume:
+        if previous is None:
+            raise SystemExit(f"Nenhuma execução anterior em {STATE_PATH} para retomar")
+        return [stage for stage in previous["stages"] if previous["results"].get(stage, {}).get("status") != "ok"]
+    if args.from_stage:
+        return list(STAGES[STAGES.index(args.from_stage):])
+    selected = args.stages or STAGES
+    return [stage for stage in STAGES if stage in selected]
+
+def print_summary(state):
+    print("\n" + "="*60)
+    print(" RESUMO DO PIPELINE ")
+    print("="*60)
+    for stage in ["autenticação"] + state["stages"]:
+        result = state["results"].get(stage, {"status": "pendente"})
+        seconds = f"{result['seconds']:8.2f}s" if "seconds" in result else " " * 9
+        print(f"{stage:<18} {result['status']:<8} {seconds}")
+    print(f"{'total':<18} {'':<8} {state['seconds']:8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--stages", nargs="+", choices=STAGES, help="Estágios a executar (padrão: todos)")
+    selection.add_argument("--from-stage", choices=STAGES, help="Executa a partir deste estágio")
+    selection.add_argument("--resume", action="store_true",
+                           help="Retoma a última execução a partir do estágio que falhou")
+    parser.add_argument("--workers", type=int, default=None, help="Processos de leitura do source_to_raw")
+    parser.add_argument("--full-transform", action="store_true", help="Recria a cleansed_data inteira")
+    parser.add_argument("--export-format", choices=cleansed_to_csv.EXPORT_FORMATS, default="csv")
+    parser.add_argument("--direct-export", action="store_true", help="Exporta pela Storage Read API, sem GCS")
+    parser.add_argument("--force", action="store_true",
+                        help="Executa raw_to_cleansed e cleansed_to_csv mesmo sem alterações nas entradas")
+    args = parser.parse_args()
+
+    stages = select_stages(args, load_state())
+    if not stages:
+        print("✅ Nenhum estágio pendente na última execução")
+        return
+
+    start_time = time.time()
+    state = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "stages": stages, "results": {}, "seconds": 0.0}
+    job_monitor.start_run("run_pipeline")
+    try:
+        stage_start = time.time()
+        with job_monitor.stage("autenticação"):
+            client = get_bigquery_client(CREDENTIAL_PATH)
+        state["results"]["autenticação"] = {"status": "ok", "seconds": time.time() - stage_start}
+        for stage in stages:
+            print("\n" + "="*60)
+            print(f" ESTÁGIO {stage.upper()} ")
+            print("="*60)
+            stage_start = time.time()
+            try:
+                with job_monitor.stage(stage):
+                    STAGE_FUNCTIONS[stage](client, args)
+            except Exception as e:
+                state["results"][stage] = {"status": "falhou", "seconds": time.time() - stage_start, "error": repr(e)}
+                print(f"❌ Estágio {stage} falhou: {str(e)}")
+                print("ℹ️ Após corrigir o problema, retome com: python run_pipeline.py --resume")
+                raise
+            state["results"][stage] = {"status": "ok", "seconds": time.time() - stage_start}
+            save_state(state)
+    finally:
+        state["seconds"] = time.time() - start_time
+        save_state(state)
+        ok = all(state["results"].get(stage, {}).get("status") == "ok" for stage in stages)
+        job_monitor.finish_run("ok" if ok else "falhou")
+        print_summary(state)
+    print("\n✅ Pipeline executado com sucesso!")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,30 +9,12 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-# Executa o script source_to_raw.py
-echo "Executando source_to_raw.py..."
-python source_to_raw.py
+# Executa os três estágios (source_to_raw, raw_to_cleansed e cleansed_to_csv) em um único processo
+echo "Executando run_pipeline.py..."
+python run_pipeline.py "$@"
 
 if [ $? -ne 0 ]; then
-    echo "Falha na execução de source_to_raw.py."
-    exit 1
-fi
-
-# Executa o script raw_to_cleansed.py
-echo "Executando raw_to_cleansed.py..."
-python raw_to_cleansed.py
-
-if [ $? -ne 0 ]; then
-    echo "Falha na execução de raw_to_cleansed.py."
-    exit 1
-fi
-
-# Executa o script cleansed_to_csv.py
-echo "Executando cleansed_to_csv.py..."
-python cleansed_to_csv.py
-
-if [ $? -ne 0 ]; then
-    echo "Falha na execução de cleansed_to_csv.py."
+    echo "Falha na execução do pipeline. Após corrigir o problema, retome com: bash run_pipeline.sh --resume"
     exit 1
 fi
 
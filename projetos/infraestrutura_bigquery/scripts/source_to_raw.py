@@ -1,8 +1,18 @@
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
-from google.oauth2 import service_account
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import argparse
+import hashlib
+import json
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import quote
+from gcp_clients import get_bigquery_client
+from job_monitor import finish_run, stage, start_run, wait_for_job
 from tqdm import tqdm  # Para barras de progresso
 
 # Configurações
@@ -10,6 +20,15 @@ CREDENTIAL_PATH = "key.json"
 DATASET_NAME = "PROUNI"
 TABLE_NAME = "raw_data"
 RAW_DATA_PATH = "../raw_data"
+STAGING_PATH = "../staging/raw_data"  # Arquivos Parquet intermediários, particionados por ano
+STAGING_MANIFEST = "_manifest.json"
+LOAD_STATE = "_loaded.json"  # Partições carregadas na raw_data, lidas pelo raw_to_cleansed.py
+STAGING_VERSION = 2  # Incrementar quando os ajustes mudarem, para descartar os arquivos já preparados
+PARTITION_COLUMN = "ANO_CONCESSAO_BOLSA"
+PARQUET_COMPRESSION = "zstd"
+CHUNK_ROWS = 250_000  # Linhas lidas por bloco (um arquivo Parquet por ano do bloco)
+LOAD_WORKERS = 4  # Jobs de carga em execução ao mesmo tempo
+SCRATCH_SUFFIX = "_staging"  # Tabela de trabalho da carga, substitui a raw_data ao final com um único job de cópia
 
 def print_header(title):
     """Imprime cabeçalho formatado"""
@@ -22,11 +41,8 @@ def authenticate_gcp(credential_path):
     print_header("1/4 - autenticação no gcp")
     print("🔑 Iniciando autenticação...")
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            credential_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+        # Credenciais e cliente compartilhados: no run_pipeline.py, carregados uma única vez
+        client = get_bigquery_client(credential_path)
         print("✅ Autenticação bem-sucedida!")
         return client
     except Exception as e:
@@ -48,52 +64,57 @@ def create_dataset_if_not_exists(client, dataset_name):
         client.create_dataset(dataset)
         print(f"✅ Dataset {dataset_name} criado com sucesso")
 
+# Renomeia colunas
+rename_columns = {
+    'ï»¿ANO_CONCESSAO_BOLSA': 'ANO_CONCESSAO_BOLSA',
+    'CPF_BENEFICIARIO': 'CPF_BENEFICIARIO_BOLSA',
+    'SEXO_BENEFICIARIO': 'SEXO_BENEFICIARIO_BOLSA',
+    'RACA_BENEFICIARIO': 'RACA_BENEFICIARIO_BOLSA',
+    'DATA_NASCIMENTO': 'DT_NASCIMENTO_BENEFICIARIO',
+    'REGIAO_BENEFICIARIO': 'REGIAO_BENEFICIARIO_BOLSA',
+    'UF_BENEFICIARIO': 'SIGLA_UF_BENEFICIARIO_BOLSA',
+    'MUNICIPIO_BENEFICIARIO': 'MUNICIPIO_BENEFICIARIO_BOLSA'
+}
+
+# Seleciona colunas comuns
+common_columns = [
+    'ANO_CONCESSAO_BOLSA', 'CODIGO_EMEC_IES_BOLSA', 'NOME_IES_BOLSA',
+    'TIPO_BOLSA', 'MODALIDADE_ENSINO_BOLSA', 'NOME_CURSO_BOLSA',
+    'NOME_TURNO_CURSO_BOLSA', 'CPF_BENEFICIARIO_BOLSA',
+    'SEXO_BENEFICIARIO_BOLSA', 'RACA_BENEFICIARIO_BOLSA',
+    'DT_NASCIMENTO_BENEFICIARIO', 'BENEFICIARIO_DEFICIENTE_FISICO',
+    'REGIAO_BENEFICIARIO_BOLSA', 'SIGLA_UF_BENEFICIARIO_BOLSA',
+    'MUNICIPIO_BENEFICIARIO_BOLSA'
+]
+
+def read_source_csv(file_path, **kwargs):
+    """Lê um arquivo da fonte forçando todas as colunas como strings desde a leitura"""
+    return pd.read_csv(file_path, encoding='iso-8859-1', sep=';', dtype=str, **kwargs)
+
+def adjust_dataframe(df):
+    """Renomeia e seleciona as colunas comuns, substitui 'nan' por nulo e remove linhas vazias.
+    Todas as operações são por linha: o resultado de um bloco é o mesmo do arquivo inteiro"""
+    df = df.rename(columns=rename_columns)
+    # Mantém apenas colunas comuns que existem no DataFrame
+    df = df[[col for col in common_columns if col in df.columns]]
+    df = df.replace('nan', pd.NA)
+    initial_rows = len(df)
+    df = df.dropna(how='all')
+    return df, initial_rows - len(df)
+
 def load_and_adjust(file_path):
     """Carrega e ajusta dados CSV forçando todas as colunas como strings"""
     print(f"\n📂 Processando arquivo: {os.path.basename(file_path)}")
     start_time = time.time()
     
     try:
-        # Força todas as colunas como string desde a leitura
-        df = pd.read_csv(file_path, encoding='iso-8859-1', sep=';', dtype=str)
-        
-        # Renomeia colunas
-        rename_columns = {
-            'ï»¿ANO_CONCESSAO_BOLSA': 'ANO_CONCESSAO_BOLSA',
-            'CPF_BENEFICIARIO': 'CPF_BENEFICIARIO_BOLSA',
-            'SEXO_BENEFICIARIO': 'SEXO_BENEFICIARIO_BOLSA',
-            'RACA_BENEFICIARIO': 'RACA_BENEFICIARIO_BOLSA',
-            'DATA_NASCIMENTO': 'DT_NASCIMENTO_BENEFICIARIO',
-            'REGIAO_BENEFICIARIO': 'REGIAO_BENEFICIARIO_BOLSA',
-            'UF_BENEFICIARIO': 'SIGLA_UF_BENEFICIARIO_BOLSA',
-            'MUNICIPIO_BENEFICIARIO': 'MUNICIPIO_BENEFICIARIO_BOLSA'
-        }
-        
-        df = df.rename(columns=rename_columns)
-        
-        # Seleciona colunas comuns
-        common_columns = [
-            'ANO_CONCESSAO_BOLSA', 'CODIGO_EMEC_IES_BOLSA', 'NOME_IES_BOLSA',
-            'TIPO_BOLSA', 'MODALIDADE_ENSINO_BOLSA', 'NOME_CURSO_BOLSA',
-            'NOME_TURNO_CURSO_BOLSA', 'CPF_BENEFICIARIO_BOLSA',
-            'SEXO_BENEFICIARIO_BOLSA', 'RACA_BENEFICIARIO_BOLSA',
-            'DT_NASCIMENTO_BENEFICIARIO', 'BENEFICIARIO_DEFICIENTE_FISICO',
-            'REGIAO_BENEFICIARIO_BOLSA', 'SIGLA_UF_BENEFICIARIO_BOLSA',
-            'MUNICIPIO_BENEFICIARIO_BOLSA'
-        ]
-        
-        # Mantém apenas colunas comuns que existem no DataFrame
-        df = df[[col for col in common_columns if col in df.columns]]
+        df = read_source_csv(file_path)
         
         # Tratamento de dados
         print("🛠️ Aplicando transformações:")
         print("- Substituindo 'nan' por valores nulos")
-        df = df.replace('nan', pd.NA)
-        
         print("- Removendo linhas completamente vazias")
-        initial_rows = len(df)
-        df = df.dropna(how='all')
-        removed_rows = initial_rows - len(df)
+        df, removed_rows = adjust_dataframe(df)
         
         elapsed_time = time.time() - start_time
         print(f"✅ Arquivo processado em {elapsed_time:.2f}s | Linhas: {len(df):,} | Linhas removidas: {removed_rows:,}")
@@ -103,6 +124,135 @@ def load_and_adjust(file_path):
         print(f"❌ Erro ao processar arquivo {file_path}: {str(e)}")
         raise
 
+def combined_columns(files):
+    """Colunas do DataFrame combinado (como no pd.concat): as de cada arquivo, na ordem em que aparecem"""
+    columns = []
+    for file in files:
+        header = read_source_csv(file, nrows=0).rename(columns=rename_columns)
+        columns += [col for col in common_columns if col in header.columns and col not in columns]
+    return columns
+
+def to_arrow(df, columns):
+    """Bloco ajustado no formato da tabela raw_data: todas as colunas do DataFrame combinado,
+    como strings, em uma tabela Arrow"""
+    # Colunas ausentes no arquivo ficam nulas, como no pd.concat
+    df = df.reindex(columns=columns).astype(str)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def iter_adjusted_chunks(file_path, columns, chunk_rows=CHUNK_ROWS, stats=None):
+    """Lê o arquivo em blocos de `chunk_rows` linhas e gera cada bloco ajustado como tabela Arrow.
+    Linhas e linhas removidas são acumuladas em `stats`"""
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("removed_rows", 0)
+    try:
+        for chunk in read_source_csv(file_path, chunksize=chunk_rows):
+            df, removed = adjust_dataframe(chunk)
+            stats["rows"] += len(df)
+            stats["removed_rows"] += removed
+            if len(df):
+                yield to_arrow(df, columns)
+    except Exception as e:
+        print(f"❌ Erro ao processar arquivo {file_path}: {str(e)}")
+        raise
+
+def partition_dir(value):
+    """Diretório da partição no estilo Hive (ANO_CONCESSAO_BOLSA=2005); nulos vão para a partição padrão"""
+    return f"{PARTITION_COLUMN}={'__HIVE_DEFAULT_PARTITION__' if value is None else quote(value, safe='')}"
+
+def stage_file(file_path, columns, staging_path, chunk_rows=CHUNK_ROWS):
+    """Lê e ajusta um arquivo em blocos e grava cada bloco em Parquet comprimido, um arquivo por
+    ano presente no bloco. Executado nos processos do pool: ao processo principal voltam apenas
+    os caminhos e as contagens"""
+    start_time = time.time()
+    stats = {}
+    schema = pa.schema([(name, pa.string()) for name in columns])
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    parts = []
+    for i, table in enumerate(iter_adjusted_chunks(file_path, columns, chunk_rows, stats)):
+        table = table.cast(schema)
+        years = table.column(PARTITION_COLUMN)
+        for value in pc.unique(years).to_pylist():
+            part = table.filter(pc.is_null(years) if value is None else pc.equal(years, value))
+            relative_path = os.path.join(partition_dir(value), f"{stem}-{i:04d}.parquet")
+            path = os.path.join(staging_path, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pq.write_table(part, path + ".partial", compression=PARQUET_COMPRESSION)
+            os.replace(path + ".partial", path)
+            with open(path, mode="rb") as parquet_file:
+                sha256 = hashlib.sha256(parquet_file.read()).hexdigest()
+            parts.append({"partition": value, "path": relative_path, "rows": part.num_rows, "sha256": sha256})
+    return parts, stats["rows"], stats["removed_rows"], time.time() - start_time
+
+def print_file_stats(file_path, elapsed_time, rows, removed_rows):
+    print(f"✅ {os.path.basename(file_path)} processado em {elapsed_time:.2f}s | "
+          f"Linhas: {rows:,} | Linhas removidas: {removed_rows:,}")
+
+def staging_signature(columns):
+    """Identifica os arquivos preparados: muda com a versão dos ajustes ou com as colunas da tabela"""
+    return {"version": STAGING_VERSION, "columns": columns}
+
+def stage_files(files, columns, staging_path=STAGING_PATH, chunk_rows=CHUNK_ROWS, workers=None, force=False):
+    """Prepara os arquivos Parquet de todos os arquivos da fonte e retorna as partes, na ordem dos anos.
+    
+    Os arquivos são lidos em paralelo por um pool de `workers` processos. O manifesto registra,
+    para cada arquivo da fonte, tamanho, mtime e as partes geradas: arquivos sem alteração
+    são reaproveitados entre execuções (e em uma nova tentativa após falha na carga).
+    `force=True` prepara tudo de novo."""
+    os.makedirs(staging_path, exist_ok=True)
+    manifest_path = os.path.join(staging_path, STAGING_MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    previous = manifest.get("files", {})
+    reusable = previous if not force and manifest.get("signature") == staging_signature(columns) else {}
+    
+    entries = {}
+    to_stage = []
+    for file in files:
+        stat = os.stat(file)
+        entry = reusable.get(os.path.basename(file))
+        if (entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+                and all(os.path.exists(os.path.join(staging_path, part["path"])) for part in entry["parts"])):
+            entries[os.path.basename(file)] = entry
+        else:
+            to_stage.append((file, stat))
+    print(f"\n📦 Arquivos a preparar: {len(to_stage)} | reaproveitados: {len(files) - len(to_stage)}")
+    
+    workers = min(workers or os.cpu_count() or 1, max(len(to_stage), 1))
+    stage_args = ([file for file, _ in to_stage], [columns] * len(to_stage), [staging_path] * len(to_stage),
+                  [chunk_rows] * len(to_stage))
+    if workers == 1:
+        results = map(stage_file, *stage_args)
+    else:
+        print(f"⚙️ Lendo os arquivos com {workers} processos em paralelo")
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(stage_file, *stage_args)
+    try:
+        for (file, stat), (parts, rows, removed_rows, elapsed_time) in zip(to_stage, results):
+            print_file_stats(file, elapsed_time, rows, removed_rows)
+            entries[os.path.basename(file)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "rows": rows,
+                                               "removed_rows": removed_rows, "parts": parts}
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    
+    with open(manifest_path + ".partial", mode="w", encoding="utf-8") as f:
+        json.dump({"signature": staging_signature(columns), "files": entries}, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".partial", manifest_path)
+    
+    # Partes que não pertencem mais a nenhum arquivo (fonte removida, alterada ou outras colunas)
+    current_paths = {part["path"] for entry in entries.values() for part in entry["parts"]}
+    for entry in previous.values():
+        for part in entry["parts"]:
+            path = os.path.join(staging_path, part["path"])
+            if part["path"] not in current_paths and os.path.exists(path):
+                os.remove(path)
+    
+    return [part for file in files for part in entries[os.path.basename(file)]["parts"]]
+
 def create_table_from_dataframe(client, dataset_name, table_name, df):
     """Cria ou substitui uma tabela no BigQuery com todos os campos como STRING"""
     print_header("4/4 - carregamento no bigquery")
@@ -128,14 +278,7 @@ def create_table_from_dataframe(client, dataset_name, table_name, df):
     start_time = time.time()
     
     job = client.load_table_from_dataframe(df, table_ref, job_config=job_config)
-    
-    # Barra de progresso simulada
-    with tqdm(total=100, desc="Progresso") as pbar:
-        while not job.done():
-            time.sleep(1)
-            pbar.update(10)
-    
-    job.result()  # Aguarda a conclusão final
+    wait_for_job(job, "carga do dataframe")
     
     elapsed_time = time.time() - start_time
     print(f"\n✅ Carga concluída em {elapsed_time:.2f}s")
@@ -143,30 +286,119 @@ def create_table_from_dataframe(client, dataset_name, table_name, df):
     print(f"- Linhas carregadas: {job.output_rows:,}")
     print(f"- Tabela: {dataset_name}.{table_name}")
 
-def main():
+def partition_key(value):
+    """Chave da partição no estado da carga; o ano nulo vira 'null'"""
+    return "null" if value is None else value
+
+def clear_load_state(staging_path=STAGING_PATH):
+    """Remove o estado da última carga: até uma nova carga terminar, a raw_data não corresponde a ele"""
+    path = os.path.join(staging_path, LOAD_STATE)
+    if os.path.exists(path):
+        os.remove(path)
+
+def save_load_state(staging_path, parts):
+    """Registra, para cada ano carregado, as linhas e uma impressão digital do conteúdo (hash dos
+    arquivos Parquet). O raw_to_cleansed.py compara esse estado com o da última transformação
+    para reprocessar apenas os anos que mudaram"""
+    partitions = {}
+    for part in parts:
+        partition = partitions.setdefault(partition_key(part["partition"]), {"rows": 0, "hashes": []})
+        partition["rows"] += part["rows"]
+        partition["hashes"].append(part["sha256"])
+    state = {
+        "table": f"{DATASET_NAME}.{TABLE_NAME}",
+        "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "partitions": {key: {"rows": partition["rows"],
+                             "fingerprint": hashlib.sha256("".join(sorted(partition["hashes"])).encode()).hexdigest()}
+                       for key, partition in partitions.items()},
+    }
+    path = os.path.join(staging_path, LOAD_STATE)
+    with open(path + ".partial", mode="w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".partial", path)
+
+def load_staged_files(client, dataset_name, table_name, columns, parts, staging_path=STAGING_PATH,
+                      load_workers=LOAD_WORKERS):
+    """Cria ou substitui a tabela a partir dos arquivos Parquet preparados, um job de carga por arquivo.
+    
+    Os arquivos são carregados em uma tabela de trabalho (o primeiro job a substitui; os demais
+    acrescentam linhas, até `load_workers` em paralelo), que então substitui a tabela final com
+    um único job de cópia: quem lê a tabela nunca vê uma carga parcial, e uma falha em qualquer
+    job mantém a tabela anterior. A tabela é clusterizada pelo ano, para que a leitura de alguns
+    anos não percorra a tabela inteira"""
+    dataset_ref = client.dataset(dataset_name)
+    table_ref = dataset_ref.table(table_name)
+    scratch_ref = dataset_ref.table(table_name + SCRATCH_SUFFIX)
+    schema = [bigquery.SchemaField(name, "STRING") for name in columns]
+    
     try:
-        print_header("início do processo source_to_raw")
-        start_time = time.time()
-        
-        # Autentica no GCP
-        client = authenticate_gcp(CREDENTIAL_PATH)
-        
-        # Cria o dataset se não existir
-        create_dataset_if_not_exists(client, DATASET_NAME)
-        
-        # Carrega e processa dados de todos os arquivos CSV
-        print_header("3/4 - processamento dos arquivos")
-        files = [os.path.join(RAW_DATA_PATH, f'pda-prouni-{year}.csv') for year in range(2005, 2020 + 1)]
-        
-        # Filtra apenas arquivos que realmente existem
-        existing_files = [file for file in files if os.path.exists(file)]
-        if not existing_files:
-            raise FileNotFoundError(f"Nenhum arquivo CSV encontrado em {RAW_DATA_PATH}")
-        
-        print(f"🔍 Encontrados {len(existing_files)} arquivos para processar:")
-        for file in existing_files:
-            print(f"- {os.path.basename(file)}")
+        table = client.get_table(table_ref)
+    except NotFound:
+        table = None
+        print(f"ℹ️ Criando nova tabela {table_name}")
+    else:
+        print(f"ℹ️ Tabela {table_name} já existente. Será sobrescrita.")
+    if not parts:
+        print("⚠️ Nenhuma linha a carregar")
+        return 0
+    
+    def load_part(part, write_disposition):
+        job_config = bigquery.LoadJobConfig(
+            schema=schema,
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=write_disposition,
+            clustering_fields=[PARTITION_COLUMN],
+            autodetect=False
+        )
+        with open(os.path.join(staging_path, part["path"]), mode="rb") as parquet_file:
+            job = client.load_table_from_file(parquet_file, scratch_ref, job_config=job_config)
+        return wait_for_job(job, "carga dos arquivos parquet", verbose=False).output_rows
+    
+    print(f"🚀 Enviando {sum(part['rows'] for part in parts):,} linhas em {len(parts)} arquivos Parquet...")
+    start_time = time.time()
+    try:
+        # Os appends só podem começar depois que o truncate terminar
+        loaded_rows = load_part(parts[0], bigquery.WriteDisposition.WRITE_TRUNCATE)
+        with ThreadPoolExecutor(max_workers=load_workers) as pool:
+            loaded_rows += sum(pool.map(lambda part: load_part(part, bigquery.WriteDisposition.WRITE_APPEND),
+                                        parts[1:]))
         
+        # A partir daqui a raw_data muda: o estado da carga anterior deixa de valer
+        clear_load_state(staging_path)
+        if table is not None and table.clustering_fields != [PARTITION_COLUMN]:
+            # Tabelas criadas sem a clusterização (versões anteriores) são recriadas: a cópia
+            # não altera a clusterização de uma tabela existente
+            client.delete_table(table_ref)
+        copy_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        wait_for_job(client.copy_table(scratch_ref, table_ref, job_config=copy_config),
+                     f"substituição da {table_name}")
+    finally:
+        client.delete_table(scratch_ref, not_found_ok=True)
+    
+    elapsed_time = time.time() - start_time
+    print(f"\n✅ Carga concluída em {elapsed_time:.2f}s")
+    print(f"📊 Estatísticas finais:")
+    print(f"- Linhas carregadas: {loaded_rows:,}")
+    print(f"- Jobs de carga: {len(parts)}")
+    print(f"- Tabela: {dataset_name}.{table_name}")
+    return loaded_rows
+
+def find_source_files(raw_data_path):
+    files = [os.path.join(raw_data_path, f'pda-prouni-{year}.csv') for year in range(2005, 2020 + 1)]
+    
+    # Filtra apenas arquivos que realmente existem
+    existing_files = [file for file in files if os.path.exists(file)]
+    if not existing_files:
+        raise FileNotFoundError(f"Nenhum arquivo CSV encontrado em {raw_data_path}")
+    
+    print(f"🔍 Encontrados {len(existing_files)} arquivos para processar:")
+    for file in existing_files:
+        print(f"- {os.path.basename(file)}")
+    return existing_files
+
+def load_in_memory(client, existing_files):
+    """Carga original: todos os arquivos em memória, combinados em um único DataFrame"""
+    with stage("source_to_raw/leitura"):
         # Processa arquivos com barra de progresso
         dfs = []
         for file in tqdm(existing_files, desc="Processando arquivos"):
@@ -178,19 +410,98 @@ def main():
         
         # Garante que todos os dados sejam strings
         combined_df = combined_df.astype(str)
-        
-        # Cria/atualiza a tabela no BigQuery
+    
+    # Cria/atualiza a tabela no BigQuery
+    with stage("source_to_raw/carga"):
         create_table_from_dataframe(client, DATASET_NAME, TABLE_NAME, combined_df)
+    return len(combined_df)
+
+def stage_and_load(client, existing_files, chunk_rows=CHUNK_ROWS, workers=None, staging_path=STAGING_PATH,
+                   force=False, load_workers=LOAD_WORKERS):
+    """Carga via staging: os arquivos são convertidos em Parquet particionado por ano (em paralelo
+    e reaproveitando o que não mudou) e carregados com jobs de carga de arquivo.
+    Sem `client`, apenas prepara os arquivos"""
+    with stage("source_to_raw/staging"):
+        columns = combined_columns(existing_files)
+        parts = stage_files(existing_files, columns, staging_path, chunk_rows, workers, force)
+    if client is None:
+        return sum(part["rows"] for part in parts)
+    print_header("4/4 - carga dos arquivos parquet no bigquery")
+    # O estado da carga é removido por load_staged_files só quando a raw_data é substituída
+    with stage("source_to_raw/carga"):
+        loaded_rows = load_staged_files(client, DATASET_NAME, TABLE_NAME, columns, parts, staging_path,
+                                        load_workers)
+    save_load_state(staging_path, parts)
+    return loaded_rows
+
+def connect_emulator(endpoint, project):
+    """Cliente sem credenciais para um emulador local do BigQuery (ex.: bigquery-emulator)"""
+    from google.api_core.client_options import ClientOptions
+    from google.auth.credentials import AnonymousCredentials
+    print_header("1/4 - conexão com o emulador")
+    print(f"🧪 Usando o emulador em {endpoint} (projeto {project})")
+    return bigquery.Client(project=project, credentials=AnonymousCredentials(),
+                           client_options=ClientOptions(api_endpoint=endpoint))
+
+def main():
+    parser = argparse.ArgumentParser(description="Carrega os arquivos do ProUni na tabela raw_data do BigQuery")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Linhas por bloco lido")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processos que leem os arquivos em paralelo (padrão: número de CPUs)")
+    parser.add_argument("--staging-path", default=STAGING_PATH, help="Diretório dos arquivos Parquet preparados")
+    parser.add_argument("--force-staging", action="store_true",
+                        help="Prepara novamente todos os arquivos, mesmo os que não mudaram")
+    parser.add_argument("--stage-only", action="store_true",
+                        help="Apenas prepara os arquivos Parquet, sem acessar o BigQuery")
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS, help="Jobs de carga em paralelo")
+    parser.add_argument("--emulator-endpoint", help="Endpoint de um emulador do BigQuery (ex.: http://localhost:9050)")
+    parser.add_argument("--project", default="test", help="Projeto usado com o emulador")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Carrega todos os arquivos em memória e envia um único DataFrame (modo original)")
+    args = parser.parse_args()
+    if args.stage_only and args.in_memory:
+        parser.error("--stage-only não se aplica ao modo --in-memory")
+    
+    start_run("source_to_raw")
+    try:
+        print_header("início do processo source_to_raw")
+        start_time = time.time()
+        
+        if args.stage_only:
+            client = None
+        else:
+            # Autentica no GCP (ou conecta ao emulador)
+            if args.emulator_endpoint:
+                client = connect_emulator(args.emulator_endpoint, args.project)
+            else:
+                client = authenticate_gcp(CREDENTIAL_PATH)
+            
+            # Cria o dataset se não existir
+            create_dataset_if_not_exists(client, DATASET_NAME)
+        
+        # Carrega e processa dados de todos os arquivos CSV
+        print_header("3/4 - processamento dos arquivos")
+        existing_files = find_source_files(RAW_DATA_PATH)
+        
+        if args.in_memory:
+            # A carga em memória não registra o estado por ano: o raw_to_cleansed.py fará a transformação completa
+            clear_load_state(args.staging_path)
+            total_rows = load_in_memory(client, existing_files)
+        else:
+            total_rows = stage_and_load(client, existing_files, args.chunk_rows, args.workers, args.staging_path,
+                                        args.force_staging, args.load_workers)
         
         elapsed_time = time.time() - start_time
         print_header("processo concluído com sucesso")
         print(f"⏱ Tempo total: {elapsed_time:.2f} segundos")
-        print(f"📈 Total de linhas processadas: {len(combined_df):,}")
+        print(f"📈 Total de linhas processadas: {total_rows:,}")
+        finish_run("ok")
         
     except Exception as e:
+        finish_run("falhou")
         print_header("erro no processamento")
         print(f"❌ Ocorreu um erro: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,93 @@
+"""
+Cache dos estágios do pipeline: pula um estágio quando nada mudou desde a última execução.
+
+Cada estágio descreve suas entradas (a tabela de origem, pela data de modificação e pela
+quantidade de linhas, e a versão das regras ou os parâmetros da exportação) e seus artefatos
+(a tabela ou o arquivo gerado). `run_cached` compara a impressão digital das entradas com a
+gravada em `STAGE_CACHE_PATH` na última execução e confere que os artefatos continuam como
+foram deixados: se nada mudou, o estágio retorna o resultado anterior sem executar query,
+extract ou download, apenas com uma consulta aos metadados da tabela.
+
+Entradas sem impressão digital confiável (tabela inexistente, sem data de modificação ou com
+linhas no streaming buffer, que não alteram a data de modificação) desativam o cache.
+"""
+import hashlib
+import json
+import os
+import time
+
+STAGE_CACHE_PATH = "../staging/stage_cache.json"
+
+
+def table_fingerprint(client, dataset_name, table_name):
+    """Data de modificação e linhas da tabela, ou None se ela não existir ou não puder ser
+    identificada apenas pelos metadados"""
+    try:
+        table = client.get_table(client.dataset(dataset_name).table(table_name))
+    except Exception:
+        return None
+    modified = getattr(table, "modified", None)
+    if modified is None or getattr(table, "streaming_buffer", None) is not None:
+        return None
+    return {"table": f"{dataset_name}.{table_name}", "modified": modified.isoformat(), "num_rows": table.num_rows}
+
+def file_fingerprint(path):
+    """Tamanho e mtime do arquivo gerado, ou None se ele não existir"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def fingerprint(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+def read_cache(path=STAGE_CACHE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(cache, path=STAGE_CACHE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".partial", mode="w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(path + ".partial", path)
+
+def run_cached(name, inputs, run, artifacts, force=False, path=STAGE_CACHE_PATH):
+    """Executa `run` apenas se as entradas mudaram desde a última execução do estágio `name` ou
+    se os artefatos (descritos por `artifacts()`) não estão mais como foram deixados.
+    `force=True` executa sempre. Retorna o resultado de `run`, ou o gravado no cache"""
+    cache = read_cache(path)
+    entry = cache.get(name)
+    cacheable = all(value is not None for value in inputs.values())
+    key = fingerprint(inputs) if cacheable else None
+    if force:
+        reason = "execução forçada"
+    elif not cacheable:
+        reason = "entradas sem impressão digital confiável"
+    elif entry is None:
+        reason = "sem execução anterior registrada"
+    elif entry["fingerprint"] != key:
+        changed = sorted(item for item in inputs if entry["inputs"].get(item) != inputs[item])
+        reason = f"entradas alteradas: {', '.join(changed)}"
+    elif artifacts() != entry["artifacts"]:
+        reason = "artefatos alterados ou removidos desde a última execução"
+    else:
+        print(f"⏭️ {name}: nenhuma alteração desde a execução de {entry['stored_at']}. Nada a fazer.")
+        return entry["result"]
+    print(f"ℹ️ {name}: executando ({reason})")
+
+    # Até o estágio terminar, os artefatos não correspondem a nenhuma entrada conhecida
+    if entry is not None:
+        del cache[name]
+        write_cache(cache, path)
+    result = run()
+    produced = artifacts()
+    if cacheable and produced is not None:
+        cache = read_cache(path)
+        cache[name] = {"fingerprint": key, "inputs": inputs, "artifacts": produced, "result": result,
+                       "stored_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+        write_cache(cache, path)
+    return result
@@ -0,0 +1,124 @@
+"""
+Benchmark do transform_to_ingest.py.
+
+Gera arquivos datatran_YYYY.csv sintéticos, no layout dos arquivos da PRF (30 colunas,
+ISO-8859-1), com o tamanho total pedido. Em seguida, executa a transformação sequencial
+linha a linha (como era antes) e a transformação em blocos e em paralelo, reportando o
+tempo de cada uma e conferindo que os arquivos consolidados são idênticos byte a byte.
+
+Uso: python benchmark_transform.py --size-mb 2048 --workdir /tmp/datatran_bench
+"""
+import argparse
+import csv
+import filecmp
+import glob
+import os
+import random
+import tempfile
+import time
+
+from transform_to_ingest import columns_to_use, extract_year, output_columns, to_int, transform
+
+PRF_COLUMNS = [
+    "id", "data_inversa", "dia_semana", "horario", "uf", "br", "km", "municipio", "causa_acidente",
+    "tipo_acidente", "classificacao_acidente", "fase_dia", "sentido_via", "condicao_metereologica",
+    "tipo_pista", "tracado_via", "uso_solo", "pessoas", "mortos", "feridos_leves", "feridos_graves",
+    "ilesos", "ignorados", "feridos", "veiculos", "latitude", "longitude", "regional", "delegacia", "uop",
+]
+DIAS_SEMANA = ["domingo", "segunda-feira", "terça-feira", "quarta-feira", "quinta-feira", "sexta-feira", "sábado"]
+CLASSIFICACOES = ["Com Vítimas Feridas", "Sem Vítimas", "Com Vítimas Fatais", "Ignorado"]
+FASES_DIA = ["Pleno dia", "Plena Noite", "Anoitecer", "Amanhecer"]
+CONDICOES = ["Céu Claro", "Nublado", "Chuva", "Sol", "Garoa/Chuvisco", "Nevoeiro/Neblina", "Ignorado", "Granizo"]
+MUNICIPIOS = ["SÃO JOSÉ", "GUARAPUAVA", "BRASÍLIA", "CURITIBA", "PALHOÇA", "JUIZ DE FORA", "SERRA; ES"]
+
+
+def generate_year(path, year, target_bytes, first_id, seed):
+    """Gera um arquivo anual com cerca de `target_bytes` bytes"""
+    rng = random.Random(seed)
+    row_id = first_id
+    with open(path, mode="w", newline="", encoding="iso-8859-1") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(PRF_COLUMNS)
+        while f.tell() < target_bytes:
+            rows = []
+            for _ in range(10_000):
+                row_id += 1
+                month, day = rng.randint(1, 12), rng.randint(1, 28)
+                # Casos que a transformação precisa tratar: ids em notação científica,
+                # mortos com casas decimais ou vazios e datas inválidas (descartadas)
+                special = rng.random()
+                id_value = f"{row_id:.6e}" if special < 0.001 else str(row_id)
+                mortos = "1.0" if special > 0.999 else ("" if 0.5 < special < 0.501 else str(rng.choice([0, 0, 0, 1, 2])))
+                date = f"{year}-02-30" if 0.3 < special < 0.3005 else f"{year}-{month:02d}-{day:02d}"
+                rows.append([
+                    id_value, date, rng.choice(DIAS_SEMANA), f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+                    "SC", str(rng.randint(101, 470)), f"{rng.uniform(0, 800):.1f}".replace(".", ","),
+                    rng.choice(MUNICIPIOS), "Reação tardia ou ineficiente do condutor", "Colisão traseira",
+                    rng.choice(CLASSIFICACOES), rng.choice(FASES_DIA), "Crescente",
+                    rng.choice(CONDICOES), "Dupla", "Reta", "Não", str(rng.randint(1, 6)), mortos, "0", "1", "2",
+                    "0", "1", str(rng.randint(1, 3)), f"-27,{rng.randint(0, 999999):06d}",
+                    f"-48,{rng.randint(0, 999999):06d}", "SPRF-SC", "DEL01-SC", "UOP01-DEL01-SC",
+                ])
+            writer.writerows(rows)
+
+
+def legacy_transform(input_pattern, output_path):
+    """Transformação como era antes: csv.DictReader, strptime e float() linha a linha"""
+    with open(output_path, mode="w", newline="", encoding="utf-8") as out_csv:
+        writer = csv.writer(out_csv, delimiter=";")
+        writer.writerow(output_columns)
+        for file in glob.glob(input_pattern):
+            with open(file, mode="r", encoding="iso-8859-1") as in_csv:
+                reader = csv.DictReader(in_csv, delimiter=";")
+                if not all(col in reader.fieldnames for col in columns_to_use):
+                    continue
+                for row in reader:
+                    ano = extract_year(row["data_inversa"])
+                    if ano is not None:
+                        writer.writerow([
+                            to_int(row["id"]), ano, row["data_inversa"], row["dia_semana"],
+                            row["classificacao_acidente"], row["fase_dia"], row["condicao_metereologica"],
+                            to_int(row["mortos"]),
+                        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=2048, help="Tamanho total dos arquivos de entrada")
+    parser.add_argument("--years", type=int, nargs="+", default=list(range(2017, 2025)))
+    parser.add_argument("--workdir", default=None,
+                        help="Diretório dos arquivos gerados (padrão: um diretório temporário novo)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="datatran_bench_")
+    print(f"Diretório de trabalho: {args.workdir}")
+
+    raw_dir = os.path.join(args.workdir, "raw_data")
+    os.makedirs(raw_dir, exist_ok=True)
+    input_pattern = os.path.join(raw_dir, "datatran_*.csv")
+    per_year = args.size_mb * 1024 * 1024 // len(args.years)
+    for i, year in enumerate(args.years):
+        path = os.path.join(raw_dir, f"datatran_{year}.csv")
+        # Arquivos de execuções anteriores com o tamanho pedido são reaproveitados
+        if not os.path.exists(path) or os.path.getsize(path) < per_year:
+            generate_year(path, year, per_year, first_id=i * 100_000_000, seed=i)
+    total_mb = sum(os.path.getsize(path) for path in glob.glob(input_pattern)) / 1024 / 1024
+    print(f"Entrada: {len(args.years)} arquivos, {total_mb:,.0f} MB")
+
+    legacy_output = os.path.join(args.workdir, "legacy.csv")
+    start = time.perf_counter()
+    legacy_transform(input_pattern, legacy_output)
+    legacy_elapsed = time.perf_counter() - start
+    print(f"[antes]  {legacy_elapsed:.1f}s ({total_mb / legacy_elapsed:,.1f} MB/s)")
+
+    output = os.path.join(args.workdir, "clean_data", "datatran_2017_2024.csv")
+    start = time.perf_counter()
+    transform(input_pattern, output, workers=args.workers, full=True)
+    elapsed = time.perf_counter() - start
+    identical = filecmp.cmp(legacy_output, output, shallow=False)
+    print(f"[depois] {elapsed:.1f}s ({total_mb / elapsed:,.1f} MB/s) | {os.cpu_count()} CPUs | "
+          f"speedup: {legacy_elapsed / elapsed:.1f}x | saída idêntica: {'sim' if identical else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Carga dos dados transformados na tabela `datatran.acidentes`, substituindo o `COPY` do cqlsh.
+
+Lê o arquivo consolidado ou os arquivos por partição (`--layout partitioned` do
+transform_to_ingest.py) e grava as linhas com um prepared statement. As linhas são
+agrupadas em batches UNLOGGED de uma única partição (ano, classificacao_acidente), que
+o driver envia diretamente a uma réplica da partição (TokenAwarePolicy). A quantidade de
+requisições em voo é limitada; requisições que falham são repetidas com backoff
+exponencial. Ao final, são reportadas a vazão (linhas/s) e os percentis de latência.
+
+Uso:
+    python load_to_cassandra.py --create-schema
+    python load_to_cassandra.py --input ./clean_data/partitions --concurrency 128
+    python load_to_cassandra.py --create-schema --replication-factor 1   # nó único
+"""
+import argparse
+import csv
+import os
+import random
+import threading
+import time
+
+from cassandra import ConsistencyLevel, InvalidRequest
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+from cassandra.query import BatchStatement, BatchType
+
+from transform_to_ingest import PARTITIONS_INDEX, output_columns, output_file, parse_date
+
+CONTACT_POINTS = ["127.0.0.1"]
+PORT = 9042
+KEYSPACE = "datatran"
+TABLE = "acidentes"
+
+# Requisições (batches) em voo ao mesmo tempo
+CONCURRENCY = 64
+# Linhas por batch; o Cassandra alerta a partir de 5 KB por batch (batch_size_warn_threshold)
+BATCH_ROWS = 32
+# Tentativas por batch e backoff exponencial (em segundos) entre elas
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 10.0
+# Intervalo (em segundos) do progresso impresso durante a carga
+PROGRESS_INTERVAL = 5.0
+
+CREATE_KEYSPACE = ("CREATE KEYSPACE IF NOT EXISTS {keyspace} "
+                   "WITH replication = {{'class': 'SimpleStrategy', 'replication_factor': {replication_factor}}}")
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS {keyspace}.{table} (
+    id int,
+    ano int,
+    data date,
+    dia_semana text,
+    classificacao_acidente text,
+    fase_dia text,
+    condicao_metereologica text,
+    mortos int,
+    PRIMARY KEY ((ano, classificacao_acidente), id)
+)
+"""
+INSERT = "INSERT INTO {keyspace}.{table} ({columns}) VALUES ({placeholders})"
+
+
+# Converte uma linha já tipada pela transformação (id e mortos inteiros) para os tipos da tabela;
+# valores vazios viram null, como no COPY
+def to_table_row(row):
+    id_, ano, data, dia_semana, classificacao, fase_dia, condicao, mortos = row
+    return (
+        id_,
+        ano,
+        parse_date(data),
+        dia_semana or None,
+        # Parte da chave de partição: null não é aceito, mas o texto vazio é
+        classificacao,
+        fase_dia or None,
+        condicao or None,
+        mortos,
+    )
+
+
+# Converte uma linha do CSV transformado para os tipos da tabela
+def parse_row(row):
+    id_, ano, data, dia_semana, classificacao, fase_dia, condicao, mortos = row
+    return to_table_row((int(id_) if id_ else None, int(ano), data, dia_semana, classificacao, fase_dia, condicao,
+                         int(mortos) if mortos else None))
+
+
+def input_files(path):
+    """Arquivos a carregar: o próprio arquivo ou, para um diretório de partições, os listados no índice"""
+    if not os.path.isdir(path):
+        return [path]
+    with open(os.path.join(path, PARTITIONS_INDEX), newline="", encoding="utf-8") as index_csv:
+        return [os.path.join(path, entry["arquivo"]) for entry in csv.DictReader(index_csv, delimiter=";")]
+
+
+def read_rows(files):
+    for file in files:
+        with open(file, newline="", encoding="utf-8") as in_csv:
+            reader = csv.reader(in_csv, delimiter=";")
+            header = next(reader, None)
+            if header != output_columns:
+                raise ValueError(f"Cabeçalho inesperado em {file}: {header}")
+            for row in reader:
+                yield parse_row(row)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class BulkLoader:
+    """Envia batches de uma partição com execute_async, limitando as requisições em voo"""
+
+    def __init__(self, session, insert, concurrency=CONCURRENCY, consistency=ConsistencyLevel.LOCAL_ONE,
+                 max_attempts=MAX_ATTEMPTS):
+        self.session = session
+        self.insert = insert
+        self.concurrency = concurrency
+        self.consistency = consistency
+        self.max_attempts = max_attempts
+        self._slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self.rows_loaded = 0
+        self.rows_failed = 0
+        self.retries = 0
+        self.latencies = []
+        self.errors = []
+
+    def submit(self, rows):
+        """Envia as linhas (todas da mesma partição) em um batch; bloqueia se o limite de requisições em voo foi atingido"""
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED, consistency_level=self.consistency)
+        for row in rows:
+            batch.add(self.insert, row)
+        self._slots.acquire()
+        self._execute(batch, len(rows), attempt=1)
+
+    def _execute(self, batch, size, attempt):
+        start = time.perf_counter()
+        future = self.session.execute_async(batch)
+        future.add_callbacks(self._on_success, self._on_error,
+                             callback_args=(size, start), errback_args=(batch, size, attempt))
+
+    def _on_success(self, _result, size, start):
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.rows_loaded += size
+            self.latencies.append(latency)
+        self._slots.release()
+
+    def _on_error(self, error, batch, size, attempt):
+        # Erros de requisição inválida (schema, tipos) não se resolvem com nova tentativa
+        if attempt < self.max_attempts and not isinstance(error, InvalidRequest):
+            with self._lock:
+                self.retries += 1
+            # Backoff exponencial com jitter; o slot continua ocupado até o fim das tentativas
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+            timer = threading.Timer(delay, self._execute, args=(batch, size, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+        with self._lock:
+            self.rows_failed += size
+            if len(self.errors) < 10:
+                self.errors.append(repr(error))
+        self._slots.release()
+
+    def wait(self):
+        """Aguarda todas as requisições em voo"""
+        for _ in range(self.concurrency):
+            self._slots.acquire()
+        for _ in range(self.concurrency):
+            self._slots.release()
+
+
+def load(loader, rows, batch_rows=BATCH_ROWS, progress_interval=PROGRESS_INTERVAL):
+    """
+    Agrupa as linhas por partição e envia um batch sempre que uma partição acumula
+    `batch_rows` linhas. Com os arquivos por partição, as linhas já chegam agrupadas e
+    apenas uma partição fica pendente por vez.
+    """
+    pending = {}
+    skipped = 0
+    start = last_report = time.perf_counter()
+    for row in rows:
+        # O id faz parte da chave primária: linhas sem id seriam rejeitadas junto com o batch inteiro
+        if row[0] is None:
+            skipped += 1
+            continue
+        key = (row[1], row[4])
+        partition_rows = pending.get(key)
+        if partition_rows is None:
+            partition_rows = pending[key] = []
+        partition_rows.append(row)
+        if len(partition_rows) >= batch_rows:
+            loader.submit(partition_rows)
+            del pending[key]
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                print(f"{loader.rows_loaded:,} linhas carregadas ({loader.rows_loaded / (now - start):,.0f} linhas/s)")
+                last_report = now
+    for partition_rows in pending.values():
+        loader.submit(partition_rows)
+    loader.wait()
+    if skipped:
+        print(f"{skipped:,} linhas sem id ignoradas")
+    return time.perf_counter() - start
+
+
+def connect(contact_points, port):
+    # Token-aware: cada batch (de uma única partição) vai direto para uma réplica dela
+    profile = ExecutionProfile(load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy()))
+    cluster = Cluster(contact_points, port=port, execution_profiles={EXEC_PROFILE_DEFAULT: profile})
+    return cluster, cluster.connect()
+
+
+def add_connection_arguments(parser):
+    parser.add_argument("--contact-points", nargs="+", default=CONTACT_POINTS)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--keyspace", default=KEYSPACE)
+    parser.add_argument("--table", default=TABLE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requisições em voo")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="Linhas por batch (de uma partição)")
+    parser.add_argument("--consistency", default="LOCAL_ONE", choices=["ONE", "LOCAL_ONE", "QUORUM", "LOCAL_QUORUM", "ALL"])
+    parser.add_argument("--create-schema", action="store_true", help="Cria o keyspace e a tabela, se não existirem")
+    parser.add_argument("--replication-factor", type=int, default=2,
+                        help="Fator de replicação do keyspace criado (2 no cluster do docker-compose, 1 em nó único)")
+
+
+def load_rows(rows, args) -> BulkLoader:
+    """Conecta ao cluster (argumentos de add_connection_arguments), carrega as linhas e reporta o resultado"""
+    cluster, session = connect(args.contact_points, args.port)
+    try:
+        if args.create_schema:
+            session.execute(CREATE_KEYSPACE.format(keyspace=args.keyspace, replication_factor=args.replication_factor))
+            session.execute(CREATE_TABLE.format(keyspace=args.keyspace, table=args.table))
+        insert = session.prepare(INSERT.format(keyspace=args.keyspace, table=args.table, columns=", ".join(output_columns),
+                                               placeholders=", ".join("?" * len(output_columns))))
+        loader = BulkLoader(session, insert, args.concurrency, getattr(ConsistencyLevel, args.consistency))
+        elapsed = load(loader, rows, args.batch_rows)
+    finally:
+        cluster.shutdown()
+
+    latencies = sorted(loader.latencies)
+    print(f"{loader.rows_loaded:,} linhas carregadas em {elapsed:.1f}s ({loader.rows_loaded / elapsed:,.0f} linhas/s) | "
+          f"retentativas: {loader.retries} | falhas: {loader.rows_failed:,} linhas")
+    print("Latência por batch: " + " | ".join(f"p{int(q * 100)}={percentile(latencies, q) * 1e3:.1f}ms"
+                                              for q in (0.5, 0.95, 0.99)))
+    for error in loader.errors:
+        print(f"Erro: {error}")
+    return loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=output_file,
+                        help=f"Arquivo consolidado ou diretório de partições (padrão: {output_file})")
+    add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    loader = load_rows(read_rows(input_files(args.input)), args)
+    if loader.rows_failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Ingestão em streaming dos arquivos da PRF, sem o arquivo consolidado intermediário.
+
+Os arquivos datatran_*.csv são transformados (com as mesmas regras do transform_to_ingest.py)
+e as linhas tipadas seguem direto para o destino: a tabela `acidentes` no Cassandra, um
+arquivo Parquet ou um arquivo CSV. O pipeline tem três estágios:
+
+- leitura e transformação: um processo por arquivo, com no máximo `--workers` ativos;
+- filas limitadas (`--queue-chunks` blocos por arquivo) entre os processos e o destino:
+  um destino mais lento bloqueia a leitura, e a memória fica limitada;
+- escrita no destino, no processo principal, na ordem dos arquivos.
+
+Uso:
+    python stream_ingest.py --sink cassandra --create-schema
+    python stream_ingest.py --sink parquet --output ./clean_data/datatran_2017_2024.parquet
+    python stream_ingest.py --sink csv --output ./clean_data/datatran_2017_2024.csv
+"""
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from transform_to_ingest import file_path, output_columns, output_dir, parse_date, select_columns, transform_chunks
+
+SINKS = ("cassandra", "parquet", "csv")
+
+# Linhas por bloco transformado e blocos em fila por arquivo
+STREAM_CHUNK_SIZE = 10_000
+QUEUE_CHUNKS = 4
+# Linhas por row group do Parquet
+PARQUET_ROW_GROUP = 100_000
+
+# Marcadores enviados pelos processos de transformação no lugar de um bloco
+END_OF_FILE = None
+MISSING_COLUMNS = "colunas ausentes"
+
+
+def transform_worker(file, queue, chunk_size):
+    """Transforma um arquivo e envia os blocos pela fila; `put` bloqueia enquanto a fila estiver cheia"""
+    try:
+        with open(file, mode="r", encoding="iso-8859-1") as in_csv:
+            selected = select_columns(csv.reader(in_csv, delimiter=";"))
+            if selected is None:
+                queue.put(MISSING_COLUMNS)
+                return
+            for chunk in transform_chunks(selected, chunk_size):
+                queue.put(chunk)
+        queue.put(END_OF_FILE)
+    except Exception as error:
+        queue.put(RuntimeError(f"Erro ao transformar {file}: {error!r}"))
+
+
+def stream_chunks(files, workers=None, chunk_size=STREAM_CHUNK_SIZE, queue_chunks=QUEUE_CHUNKS):
+    """
+    Gera os blocos transformados de todos os arquivos, na ordem dos arquivos. Enquanto um
+    arquivo é consumido, os próximos (até `workers` no total) já são transformados, cada um
+    com até `queue_chunks` blocos em fila.
+    """
+    workers = workers or os.cpu_count() or 1
+    queues = [multiprocessing.Queue(queue_chunks) for _ in files]
+    processes = [multiprocessing.Process(target=transform_worker, args=(file, queue, chunk_size), daemon=True)
+                 for file, queue in zip(files, queues)]
+    started = 0
+    try:
+        for i, file in enumerate(files):
+            while started < min(len(files), i + workers):
+                processes[started].start()
+                started += 1
+            while True:
+                item = queues[i].get()
+                if item is END_OF_FILE:
+                    break
+                if isinstance(item, str):
+                    print(f"Arquivo {file} não possui as colunas necessárias. Pulando...")
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            processes[i].join()
+    finally:
+        # Em caso de erro (ou de o consumidor parar antes), os processos restantes são encerrados
+        for process in processes[:started]:
+            if process.is_alive():
+                process.terminate()
+
+
+def write_csv(chunks, output_path):
+    """Mesmo conteúdo do arquivo consolidado do transform_to_ingest.py"""
+    rows = 0
+    partial_path = output_path + ".partial"
+    with open(partial_path, mode="w", newline="", encoding="utf-8") as out_csv:
+        writer = csv.writer(out_csv, delimiter=";")
+        writer.writerow(output_columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    os.replace(partial_path, output_path)
+    return rows
+
+
+def parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()), ("ano", pa.int16()), ("data", pa.date32()), ("dia_semana", pa.string()),
+        ("classificacao_acidente", pa.string()), ("fase_dia", pa.string()), ("condicao_metereologica", pa.string()),
+        ("mortos", pa.int64()),
+    ])
+
+
+def chunks_to_table(chunks, schema):
+    ids, anos, datas, dias_semana, classificacoes, fases_dia, condicoes, mortos = zip(
+        *(row for chunk in chunks for row in chunk))
+    columns = [ids, anos, list(map(parse_date, datas)), dias_semana, classificacoes, fases_dia, condicoes, mortos]
+    return pa.Table.from_arrays([pa.array(column, field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def write_parquet(chunks, output_path, row_group=PARQUET_ROW_GROUP):
+    """Grava um arquivo Parquet (snappy), acumulando blocos até `row_group` linhas por row group"""
+    if pq is None:
+        raise SystemExit("O destino parquet requer o pyarrow: pip install pyarrow")
+    schema = parquet_schema()
+    rows = 0
+    partial_path = output_path + ".partial"
+    with pq.ParquetWriter(partial_path, schema, compression="snappy") as writer:
+        pending, pending_rows = [], 0
+        for chunk in chunks:
+            if chunk:
+                pending.append(chunk)
+                pending_rows += len(chunk)
+            if pending_rows >= row_group:
+                writer.write_table(chunks_to_table(pending, schema))
+                rows += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(chunks_to_table(pending, schema))
+            rows += pending_rows
+    os.replace(partial_path, output_path)
+    return rows
+
+
+def write_cassandra(chunks, args):
+    # Importado aqui para que os destinos parquet e csv não dependam do cassandra-driver
+    from load_to_cassandra import load_rows, to_table_row
+
+    loader = load_rows((to_table_row(row) for chunk in chunks for row in chunk), args)
+    if loader.rows_failed:
+        raise SystemExit(1)
+    return loader.rows_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=file_path, help=f"Padrão dos arquivos de entrada (padrão: {file_path})")
+    parser.add_argument("--sink", choices=SINKS, default="cassandra")
+    parser.add_argument("--output", help="Arquivo de saída dos destinos parquet e csv")
+    parser.add_argument("--workers", type=int, default=None, help="Arquivos transformados em paralelo")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE, help="Linhas por bloco")
+    parser.add_argument("--queue-chunks", type=int, default=QUEUE_CHUNKS, help="Blocos em fila por arquivo")
+    args, _ = parser.parse_known_args()
+    if args.sink == "cassandra":
+        from load_to_cassandra import add_connection_arguments
+        add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.join(output_dir, f"datatran_2017_2024.{args.sink}")
+    if args.sink != "cassandra":
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    start = time.perf_counter()
+    chunks = stream_chunks(glob.glob(args.input), args.workers, args.chunk_size, args.queue_chunks)
+    if args.sink == "cassandra":
+        rows = write_cassandra(chunks, args)
+    elif args.sink == "parquet":
+        rows = write_parquet(chunks, output_path)
+    else:
+        rows = write_csv(chunks, output_path)
+    elapsed = time.perf_counter() - start
+    destination = "Cassandra" if args.sink == "cassandra" else output_path
+    print(f"{rows:,} linhas gravadas em {destination} em {elapsed:.1f}s ({rows / elapsed:,.0f} linhas/s)")
+
+
+if __name__ == "__main__":
+    main()
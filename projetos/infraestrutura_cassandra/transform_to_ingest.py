@@ -1,7 +1,19 @@
+import argparse
 import csv
 import glob
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from typing import Optional
 
 # Diretório onde os arquivos estão localizados
 file_path = './raw_data/datatran_*.csv'
@@ -10,16 +22,29 @@ file_path = './raw_data/datatran_*.csv'
 output_dir = "./clean_data"
 output_file = os.path.join(output_dir, "datatran_2017_2024.csv")
 
-# Cria o diretório se não existir
-os.makedirs(output_dir, exist_ok=True)
-
 # Colunas para manter no arquivo de saída
 columns_to_use = [
-    "id", "data_inversa", "dia_semana", "classificacao_acidente", 
+    "id", "data_inversa", "dia_semana", "classificacao_acidente",
     "fase_dia", "condicao_metereologica", "mortos"
 ]
 output_columns = ["id", "ano", "data", "dia_semana", "classificacao_acidente", "fase_dia", "condicao_metereologica", "mortos"]
 
+# Quantidade de linhas transformadas por bloco dentro de cada arquivo
+CHUNK_SIZE = 100_000
+
+# Segmentos por arquivo de entrada e manifesto da transformação incremental (dentro de output_dir)
+SEGMENTS_DIR = "segments"
+MANIFEST_FILE = "manifest.json"
+# Incrementar sempre que a transformação mudar, para invalidar os segmentos existentes
+TRANSFORM_VERSION = 1
+
+# Layout particionado: um arquivo por partição (ano, classificacao_acidente) da tabela
+# `acidentes`, ordenado por id, e um índice com a quantidade de linhas de cada partição
+PARTITIONS_DIR = "partitions"
+PARTITIONS_INDEX = "index.csv"
+index_columns = ["ano", "classificacao_acidente", "arquivo", "linhas", "id_min", "id_max"]
+LAYOUTS = ("consolidated", "partitioned", "both")
+
 # Função para extrair o ano da data
 def extract_year(date_str):
     try:
@@ -27,6 +52,11 @@ def extract_year(date_str):
     except ValueError:
         return None
 
+# Data (datetime.date) de um valor no mesmo formato aceito por extract_year; cada valor distinto é convertido uma vez
+@lru_cache(maxsize=None)
+def parse_date(date_str):
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
 # Função para converter valores para inteiro, incluindo notação científica
 def to_int(value):
     try:
@@ -34,42 +64,292 @@ def to_int(value):
     except (ValueError, TypeError):
         return None
 
-# Abre o arquivo de saída para escrita
-with open(output_file, mode="w", newline="", encoding="utf-8") as out_csv:
-    writer = csv.writer(out_csv, delimiter=";")
-    
-    # Escreve o cabeçalho no arquivo de saída
-    writer.writerow(output_columns)
-    
-    # Loop pelos arquivos de entrada
-    for file in glob.glob(file_path):
-        # Abre cada arquivo CSV para leitura
-        with open(file, mode="r", encoding="iso-8859-1") as in_csv:
-            reader = csv.DictReader(in_csv, delimiter=";")
-            
-            # Verifica se todas as colunas necessárias estão presentes
-            if not all(col in reader.fieldnames for col in columns_to_use):
-                print(f"Arquivo {file} não possui as colunas necessárias. Pulando...")
-                continue
-            
-            # Processa cada linha do arquivo
-            for row in reader:
-                # Extração do ano e substituição do nome da coluna
-                ano = extract_year(row["data_inversa"])
-                
-                if ano is not None:
-                    # Cria uma nova linha com o schema final, convertendo 'id' e 'mortos' para inteiros
-                    output_row = [
-                        to_int(row["id"]),
-                        ano,
-                        row["data_inversa"],
-                        row["dia_semana"],
-                        row["classificacao_acidente"],
-                        row["fase_dia"],
-                        row["condicao_metereologica"],
-                        to_int(row["mortos"])
-                    ]
-                    
-                    writer.writerow(output_row)
-
-print(f"Arquivo consolidado gerado com sucesso: {output_file}")
+# Ano de cada data distinta do bloco: o strptime roda uma vez por valor, e não por linha
+def years_by_date(dates):
+    return {date: extract_year(date) for date in set(dates)}
+
+# Converte uma coluna para inteiros; valores só com dígitos (o caso comum) dispensam o float().
+# Acima de 15 dígitos o float() perde precisão, então esses valores seguem pelo to_int
+def column_to_int(values):
+    return [int(value) if value and len(value) < 16 and value.isascii() and value.isdigit() else to_int(value)
+            for value in values]
+
+# Transforma um bloco de linhas coluna a coluna, com o mesmo resultado da versão linha a linha
+def transform_chunk(rows):
+    ids, dates, dias_semana, classificacoes, fases_dia, condicoes, mortos = zip(*rows)
+    years = years_by_date(dates)
+    output_rows = zip(column_to_int(ids), map(years.__getitem__, dates), dates, dias_semana, classificacoes,
+                      fases_dia, condicoes, column_to_int(mortos))
+    # Linhas com data inválida são descartadas
+    return [row for row in output_rows if row[1] is not None]
+
+# Colunas usadas de cada linha do arquivo, na ordem de columns_to_use, ou None se o arquivo
+# não possui as colunas necessárias
+def select_columns(reader):
+    fieldnames = next(reader, None)
+    if fieldnames is None or not all(col in fieldnames for col in columns_to_use):
+        return None
+
+    # Assim como no csv.DictReader, vale a última coluna com o mesmo nome
+    positions = {name: i for i, name in enumerate(fieldnames)}
+    getter = itemgetter(*(positions[col] for col in columns_to_use))
+    width = max(positions[col] for col in columns_to_use) + 1
+
+    def select(row):
+        # O csv.DictReader completa linhas curtas com None
+        return getter(row) if len(row) >= width else getter(row + [None] * (width - len(row)))
+
+    # Apenas as colunas usadas são mantidas; linhas em branco são ignoradas, como no csv.DictReader
+    return map(select, filter(None, reader))
+
+# Gera os blocos transformados (listas de tuplas no formato de output_columns) das linhas selecionadas
+def transform_chunks(selected, chunk_size=CHUNK_SIZE):
+    while True:
+        rows = list(islice(selected, chunk_size))
+        if not rows:
+            return
+        yield transform_chunk(rows)
+
+# Transforma um arquivo de entrada em blocos, gravando as linhas (sem cabeçalho) em `segment_path`.
+# Retorna a quantidade de linhas gravadas, ou None se o arquivo não possui as colunas necessárias
+def transform_file(file, segment_path, chunk_size=CHUNK_SIZE) -> Optional[int]:
+    with open(file, mode="r", encoding="iso-8859-1") as in_csv, \
+            open(segment_path, mode="w", newline="", encoding="utf-8") as out_csv:
+        selected = select_columns(csv.reader(in_csv, delimiter=";"))
+        if selected is None:
+            return None
+        writer = csv.writer(out_csv, delimiter=";")
+        written = 0
+        for output_rows in transform_chunks(selected, chunk_size):
+            writer.writerows(output_rows)
+            written += len(output_rows)
+        return written
+
+# Fingerprint do conteúdo de um arquivo de entrada (SHA-256), lido em blocos
+def file_sha256(file):
+    digest = hashlib.sha256()
+    with open(file, mode="rb") as f:
+        for block in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Transforma um arquivo em um segmento temporário e só então o move para `segment_path`,
+# para que uma execução interrompida nunca deixe um segmento pela metade no manifesto
+def transform_segment(file, segment_path, chunk_size=CHUNK_SIZE) -> Optional[int]:
+    partial_path = segment_path + ".partial"
+    written = transform_file(file, partial_path, chunk_size)
+    os.replace(partial_path, segment_path)
+    return written
+
+# Nome do segmento de um arquivo de entrada; o hash do caminho evita colisões entre
+# arquivos de mesmo nome em diretórios diferentes
+def segment_name(file):
+    path_hash = hashlib.sha1(os.path.abspath(file).encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(file))[0]}_{path_hash}.csv"
+
+# Identifica a transformação que gerou os segmentos: muda junto com a versão ou as colunas
+def transform_signature():
+    return {"version": TRANSFORM_VERSION, "columns_to_use": columns_to_use, "output_columns": output_columns}
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Segmentos gerados por outra versão da transformação não são reaproveitados
+    if manifest.get("signature") != transform_signature():
+        return {}
+    return manifest.get("files", {})
+
+def save_manifest(manifest_path, files):
+    partial_path = manifest_path + ".partial"
+    with open(partial_path, mode="w", encoding="utf-8") as f:
+        json.dump({"signature": transform_signature(), "files": files}, f, indent=2, sort_keys=True)
+    os.replace(partial_path, manifest_path)
+
+def transform(input_pattern=file_path, output_path=output_file, workers=None, chunk_size=CHUNK_SIZE, full=False,
+              layout="consolidated"):
+    """
+    Transforma os arquivos de entrada em paralelo (um processo por arquivo) e consolida o
+    resultado em `output_path`, na mesma ordem de arquivos do glob e com o mesmo conteúdo,
+    byte a byte, da transformação sequencial.
+
+    Cada arquivo gera um segmento em `segments/`, ao lado do arquivo consolidado, registrado
+    em `segments/manifest.json` com tamanho, mtime e SHA-256 da entrada. Em uma nova execução,
+    só são transformados os arquivos novos ou cujo conteúdo mudou: tamanho e mtime iguais
+    dispensam até o hash. `full=True` ignora o manifesto e transforma tudo de novo.
+
+    `layout` define a saída: o arquivo consolidado ("consolidated"), um arquivo por partição
+    da tabela `acidentes` em `partitions/` ("partitioned") ou ambos ("both").
+    """
+    files = glob.glob(input_pattern)
+    output_path_dir = os.path.dirname(output_path) or "."
+    segments_dir = os.path.join(output_path_dir, SEGMENTS_DIR)
+    manifest_path = os.path.join(segments_dir, MANIFEST_FILE)
+    # Cria os diretórios se não existirem
+    os.makedirs(segments_dir, exist_ok=True)
+
+    previous = {} if full else load_manifest(manifest_path)
+    entries = {}
+    to_check = []
+    for file in files:
+        stat = os.stat(file)
+        entry = previous.get(file)
+        if entry is not None and not os.path.exists(os.path.join(segments_dir, entry["segment"])):
+            entry = None
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            entries[file] = entry
+        else:
+            to_check.append((file, stat, entry))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Arquivos com tamanho ou mtime diferentes só são transformados se o conteúdo mudou
+        hashes = list(pool.map(file_sha256, [file for file, _, _ in to_check]))
+        to_transform = []
+        for (file, stat, entry), sha256 in zip(to_check, hashes):
+            if entry is not None and entry["sha256"] == sha256:
+                entries[file] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            else:
+                entries[file] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256,
+                                 "segment": segment_name(file), "rows": None}
+                to_transform.append(file)
+
+        segments = [os.path.join(segments_dir, entries[file]["segment"]) for file in to_transform]
+        results = pool.map(transform_segment, to_transform, segments, [chunk_size] * len(to_transform))
+        for file, written in zip(to_transform, results):
+            entries[file]["rows"] = written
+    print(f"Arquivos transformados: {len(to_transform)} | reaproveitados: {len(files) - len(to_transform)}")
+
+    save_manifest(manifest_path, entries)
+    # Segmentos de arquivos que não existem mais (ou de outra versão) são removidos
+    valid_segments = {entry["segment"] for entry in entries.values()} | {MANIFEST_FILE}
+    for name in os.listdir(segments_dir):
+        if name not in valid_segments:
+            os.remove(os.path.join(segments_dir, name))
+
+    segments = []
+    for file in files:
+        entry = entries[file]
+        if entry["rows"] is None:
+            print(f"Arquivo {file} não possui as colunas necessárias. Pulando...")
+            continue
+        segments.append(os.path.join(segments_dir, entry["segment"]))
+
+    if layout in ("consolidated", "both"):
+        concatenate_segments(segments, output_path)
+    if layout in ("partitioned", "both"):
+        partitions_dir = os.path.join(output_path_dir, PARTITIONS_DIR)
+        partitions = write_partitions(segments, partitions_dir, workers)
+        print(f"Partições geradas: {len(partitions)} em {partitions_dir}")
+
+# Remonta o arquivo consolidado a partir dos segmentos, na ordem recebida
+def concatenate_segments(segments, output_path):
+    partial_output = output_path + ".partial"
+    with open(partial_output, mode="wb") as out_csv:
+        out_csv.write(csv_header(output_columns))
+        for segment in segments:
+            with open(segment, mode="rb") as segment_csv:
+                shutil.copyfileobj(segment_csv, out_csv, 16 * 1024 * 1024)
+    os.replace(partial_output, output_path)
+
+def csv_header(columns):
+    header = io.StringIO()
+    csv.writer(header, delimiter=";").writerow(columns)
+    return header.getvalue().encode("utf-8")
+
+# Nome do arquivo de uma partição, sem acentos nem espaços: "Com Vítimas Fatais" -> "com_vitimas_fatais.csv"
+def partition_file_name(classificacao):
+    ascii_name = unicodedata.normalize("NFKD", classificacao).encode("ascii", "ignore").decode("ascii")
+    return (re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_") or "sem_classificacao") + ".csv"
+
+# Chave de ordenação das linhas de uma partição; linhas sem id ficam no início
+def row_id(row):
+    return int(row[0]) if row[0] else -1
+
+# Ordena por id as linhas de uma partição e as grava, com cabeçalho, em `partition_path`.
+# Retorna a quantidade de linhas e o menor e o maior id
+def sort_partition(unsorted_path, partition_path):
+    with open(unsorted_path, mode="r", newline="", encoding="utf-8") as in_csv:
+        rows = list(csv.reader(in_csv, delimiter=";"))
+    # A ordenação é estável: ids repetidos mantêm a ordem dos arquivos de entrada
+    rows.sort(key=row_id)
+    os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+    with open(partition_path, mode="w", newline="", encoding="utf-8") as out_csv:
+        writer = csv.writer(out_csv, delimiter=";")
+        writer.writerow(output_columns)
+        writer.writerows(rows)
+    os.remove(unsorted_path)
+    return len(rows), rows[0][0], rows[-1][0]
+
+def write_partitions(segments, partitions_dir, workers=None):
+    """
+    Distribui as linhas dos segmentos em um arquivo por partição (ano, classificacao_acidente),
+    em `partitions_dir/<ano>/<classificacao>.csv`, cada um ordenado por id, e grava o índice
+    `partitions_dir/index.csv`. As partições são ordenadas em paralelo; a memória usada é a
+    da maior partição. Retorna as linhas do índice.
+    """
+    partial_dir = partitions_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    unsorted_dir = os.path.join(partial_dir, "unsorted")
+    os.makedirs(unsorted_dir)
+
+    # Primeira passada: cada linha é anexada ao arquivo (ainda desordenado) da sua partição
+    buckets = {}
+    try:
+        for segment in segments:
+            with open(segment, mode="r", newline="", encoding="utf-8") as segment_csv:
+                for row in csv.reader(segment_csv, delimiter=";"):
+                    key = (row[1], row[4])
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        handle = open(os.path.join(unsorted_dir, f"{len(buckets):04d}.csv"),
+                                      mode="w", newline="", encoding="utf-8")
+                        bucket = buckets[key] = (handle, csv.writer(handle, delimiter=";"))
+                    bucket[1].writerow(row)
+    finally:
+        for handle, _ in buckets.values():
+            handle.close()
+
+    # Segunda passada: ordenação por id, uma partição por processo
+    keys = sorted(buckets, key=lambda key: (int(key[0]), key[1]))
+    files = []
+    for ano, classificacao in keys:
+        file = os.path.join(ano, partition_file_name(classificacao))
+        # Classificações que diferem só em acentos ou caixa ganham um sufixo
+        suffix = 1
+        while file in files:
+            suffix += 1
+            file = os.path.join(ano, partition_file_name(classificacao)[:-4] + f"_{suffix}.csv")
+        files.append(file)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(sort_partition, [buckets[key][0].name for key in keys],
+                                [os.path.join(partial_dir, file) for file in files]))
+    os.rmdir(unsorted_dir)
+
+    index = [[int(ano), classificacao, file, rows, id_min, id_max]
+             for (ano, classificacao), file, (rows, id_min, id_max) in zip(keys, files, results)]
+    with open(os.path.join(partial_dir, PARTITIONS_INDEX), mode="w", newline="", encoding="utf-8") as index_csv:
+        writer = csv.writer(index_csv, delimiter=";")
+        writer.writerow(index_columns)
+        writer.writerows(index)
+
+    # O layout anterior só é substituído quando o novo está completo
+    shutil.rmtree(partitions_dir, ignore_errors=True)
+    os.replace(partial_dir, partitions_dir)
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consolida os arquivos datatran_*.csv da PRF para ingestão no Cassandra")
+    parser.add_argument("--input", default=file_path, help=f"Padrão dos arquivos de entrada (padrão: {file_path})")
+    parser.add_argument("--output", default=output_file, help=f"Arquivo consolidado (padrão: {output_file})")
+    parser.add_argument("--workers", type=int, default=None, help="Processos em paralelo (padrão: número de CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Linhas por bloco")
+    parser.add_argument("--full", action="store_true", help="Ignora o manifesto e transforma todos os arquivos")
+    parser.add_argument("--layout", choices=LAYOUTS, default="consolidated",
+                        help="Arquivo consolidado, um arquivo por partição (ano, classificacao_acidente) ou ambos")
+    args = parser.parse_args()
+
+    transform(args.input, args.output, args.workers, args.chunk_size, args.full, args.layout)
+    if args.layout != "partitioned":
+        print(f"Arquivo consolidado gerado com sucesso: {args.output}")
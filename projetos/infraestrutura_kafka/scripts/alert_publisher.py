@@ -0,0 +1,124 @@
+import threading
+import time
+from functools import partial
+from typing import Optional
+
+from confluent_kafka import KafkaError, Producer
+
+from pipeline_metrics import PipelineMetrics
+from serializers import serializer_for_topic
+
+# Tempo máximo (em segundos) aguardando entregas pendentes em cada checkpoint, rebalanceamento ou encerramento
+DEFAULT_FLUSH_TIMEOUT = 10.0
+
+
+class AlertPublisher:
+    """
+    Publica alertas de fraude de forma assíncrona.
+
+    `publish` apenas enfileira a mensagem no buffer do librdkafka e retorna; uma thread em
+    segundo plano chama `poll()` para atender os callbacks de entrega. O `flush` (limitado
+    por `flush_timeout`) acontece a cada checkpoint do `FraudWorker`, antes do commit dos
+    offsets, quando partições são revogadas e no encerramento.
+    Falhas de entrega são contabilizadas em `failed`, nunca descartadas em silêncio.
+
+    Com `metrics`, registra a latência de entrega de cada alerta (informada pelo librdkafka)
+    e a latência ponta a ponta, do `timestamp` da transação até a entrega do alerta.
+    """
+
+    def __init__(self, producer: Producer, topic: str, flush_timeout: float = DEFAULT_FLUSH_TIMEOUT,
+                 poll_interval: float = 0.1, metrics: Optional[PipelineMetrics] = None):
+        self._producer = producer
+        self._topic = topic
+        self._serializer = serializer_for_topic(topic)
+        self._flush_timeout = flush_timeout
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.buffer_full = 0
+        self._metrics = metrics
+        if metrics is not None:
+            self._delivery_histogram = metrics.histogram("alert_delivery_latency_seconds")
+            self._event_histogram = metrics.histogram("event_to_alert_latency_seconds")
+
+    def start(self) -> "AlertPublisher":
+        self._poll_thread.start()
+        return self
+
+    def _poll_loop(self) -> None:
+        while not self._stop.is_set():
+            self._producer.poll(self._poll_interval)
+
+    def _on_delivery(self, err: KafkaError, msg) -> None:
+        with self._lock:
+            if err is not None:
+                self.failed += 1
+                print(f"Falha na entrega do alerta (chave {msg.key()}): {err}")
+            else:
+                self.delivered += 1
+
+    def _on_delivery_measured(self, event_timestamp: float, err: KafkaError, msg) -> None:
+        self._on_delivery(err, msg)
+        if err is not None:
+            self._metrics.inc("alerts_failed_total")
+        else:
+            self._metrics.inc("alerts_delivered_total")
+            latency = msg.latency()
+            if latency is not None:
+                self._delivery_histogram.observe(latency)
+            self._event_histogram.observe(time.time() - event_timestamp)
+
+    def publish(self, fraud_alert: dict) -> None:
+        """Enfileira o alerta sem bloquear o loop de consumo"""
+        key = str(fraud_alert['user_id'])
+        value = self._serializer.encode(fraud_alert)
+        on_delivery = self._on_delivery
+        if self._metrics is not None:
+            self._metrics.inc("alerts_published_total")
+            on_delivery = partial(self._on_delivery_measured, fraud_alert['timestamp'])
+        while True:
+            try:
+                self._producer.produce(self._topic, key=key, value=value, on_delivery=on_delivery)
+                break
+            except BufferError:
+                # Fila local cheia: atende callbacks para liberar espaço e tenta novamente
+                with self._lock:
+                    self.buffer_full += 1
+                self._producer.poll(self._poll_interval)
+        with self._lock:
+            self.enqueued += 1
+
+    def flush(self) -> int:
+        """Aguarda as entregas pendentes por até `flush_timeout` segundos; retorna quantas restaram"""
+        remaining = self._producer.flush(self._flush_timeout)
+        if remaining:
+            print(f"⚠️ {remaining} alertas ainda pendentes após {self._flush_timeout}s de flush")
+        return remaining
+
+    def pending(self) -> int:
+        return len(self._producer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enqueued": self.enqueued,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "buffer_full": self.buffer_full,
+                "pending": self.pending(),
+            }
+
+    def close(self) -> dict:
+        """Interrompe a thread de poll, faz o flush final e retorna os contadores"""
+        self._stop.set()
+        if self._poll_thread.is_alive():
+            self._poll_thread.join()
+        remaining = self.flush()
+        with self._lock:
+            # Mensagens que não foram entregues até aqui se perdem com o encerramento do producer
+            self.failed += remaining
+        return self.stats()
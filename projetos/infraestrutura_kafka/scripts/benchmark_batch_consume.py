@@ -0,0 +1,53 @@
+"""
+Benchmark do modo em lote do consumidor.
+
+Decodifica e avalia mensagens sintéticas (já serializadas, como chegam do Kafka) no modo
+streaming e no modo em lote com diferentes tamanhos de lote, reportando a vazão e
+conferindo que as decisões são idênticas às do modo streaming.
+
+Uso: python benchmark_batch_consume.py --transactions 500000 --batch-sizes 1 10 100 500 1000
+"""
+import argparse
+import json
+import time
+
+from benchmark_fraud_state import synthetic_transactions
+from fraud_detection import FraudStateStore, check_fraud, check_fraud_batch, decode_transactions
+
+
+def run_streaming(values):
+    store = FraudStateStore()
+    start = time.perf_counter()
+    alerts = [check_fraud(store, json.loads(value), verbose=False) for value in values]
+    return time.perf_counter() - start, alerts
+
+
+def run_batches(values, batch_size):
+    store = FraudStateStore()
+    alerts = []
+    start = time.perf_counter()
+    for i in range(0, len(values), batch_size):
+        transactions = decode_transactions(values[i:i + batch_size])
+        alerts.extend(check_fraud_batch(store, transactions, verbose=False))
+    return time.perf_counter() - start, alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 500, 1000, 5000])
+    args = parser.parse_args()
+
+    values = [json.dumps(tx).encode() for tx in synthetic_transactions(args.transactions)]
+
+    elapsed, expected = run_streaming(values)
+    print(f"[streaming] {len(values) / elapsed:,.0f} msgs/s")
+
+    for batch_size in args.batch_sizes:
+        elapsed, alerts = run_batches(values, batch_size)
+        status = "ok" if alerts == expected else "DIVERGENTE"
+        print(f"[lote {batch_size:>5}] {len(values) / elapsed:,.0f} msgs/s | decisões: {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark do estado de detecção de fraude.
+
+Reproduz milhões de transações sintéticas contra a implementação anterior (lista de
+transações por usuário) e contra o FraudStateStore, reportando mensagens/s e pico de RSS.
+Cada implementação roda em um processo separado para que o pico de memória seja isolado.
+
+Uso: python benchmark_fraud_state.py --transactions 2000000
+"""
+import argparse
+import multiprocessing
+import random
+import resource
+import time
+from collections import defaultdict
+
+from fraud_detection import FraudStateStore, check_fraud
+
+COUNTRIES = ["USA", "Canada", "Germany", "France", "UK", "Brazil", "Australia"]
+
+
+def synthetic_transactions(n, seed=42):
+    """Gera transações no mesmo formato do producer.py, com timestamps crescentes"""
+    rng = random.Random(seed)
+    ts = 1_700_000_000
+    for i in range(n):
+        user_id = rng.randint(11000, 19999)
+        ts += rng.randint(0, 2)
+        yield {
+            "timestamp": ts,
+            "transaction_id": i,
+            "user_id": user_id,
+            "card_id": rng.randint(100000, 999999),
+            "site_id": rng.randint(1000, 9999),
+            "value": round(rng.uniform(1.0, 1000.0), 2),
+            "location_id": rng.randint(1, 100),
+            "country": COUNTRIES[user_id % len(COUNTRIES)],
+        }
+
+
+def legacy_check_fraud(user_transactions, user_last_transaction, transaction):
+    """Regras como eram antes: histórico completo e max() recalculado a cada mensagem"""
+    user_id = transaction['user_id']
+    timestamp = transaction['timestamp']
+    value = transaction['value']
+    country = transaction['country']
+    fraud_type = None
+
+    if user_id in user_last_transaction:
+        last_trans = user_last_transaction[user_id]
+        if timestamp - last_trans['timestamp'] < 300 and value != last_trans['value']:
+            fraud_type = "Alta Frequência"
+    if user_id in user_transactions:
+        max_value = max([t['value'] for t in user_transactions[user_id]], default=0)
+        if value > 2 * max_value:
+            fraud_type = "Alto Valor"
+    if user_id in user_last_transaction:
+        last_trans = user_last_transaction[user_id]
+        if country != last_trans['country'] and (timestamp - last_trans['timestamp']) < 7200:
+            fraud_type = "Outro País"
+
+    user_transactions[user_id].append(transaction)
+    user_last_transaction[user_id] = transaction
+    return fraud_type
+
+
+def run_legacy(n):
+    user_transactions = defaultdict(list)
+    user_last_transaction = {}
+    alerts = 0
+    start = time.perf_counter()
+    for tx in synthetic_transactions(n):
+        if legacy_check_fraud(user_transactions, user_last_transaction, tx):
+            alerts += 1
+    return time.perf_counter() - start, alerts
+
+
+def run_state_store(n):
+    store = FraudStateStore()
+    alerts = 0
+    start = time.perf_counter()
+    for tx in synthetic_transactions(n):
+        if check_fraud(store, tx, verbose=False):
+            alerts += 1
+    return time.perf_counter() - start, alerts
+
+
+def _worker(name, n, results):
+    runner = run_legacy if name == "antes" else run_state_store
+    elapsed, alerts = runner(n)
+    # ru_maxrss é informado em KB no Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((name, elapsed, alerts, peak_rss_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    for name in ("antes", "depois"):
+        process = multiprocessing.Process(target=_worker, args=(name, args.transactions, results))
+        process.start()
+        process.join()
+        name, elapsed, alerts, peak_rss_mb = results.get()
+        print(f"[{name}] {args.transactions:,} transações em {elapsed:.2f}s | "
+              f"{args.transactions / elapsed:,.0f} msgs/s | alertas: {alerts:,} | "
+              f"pico de RSS: {peak_rss_mb:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
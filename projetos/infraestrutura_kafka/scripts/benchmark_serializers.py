@@ -0,0 +1,51 @@
+"""
+Micro-benchmark dos formatos de serialização de transações.
+
+Compara o JSON da biblioteca padrão, o JSON rápido (orjson, quando instalado) e o
+registro binário de largura fixa, reportando bytes por mensagem e µs por
+codificação/decodificação.
+
+Uso: python benchmark_serializers.py --transactions 200000
+"""
+import argparse
+import time
+
+from benchmark_fraud_state import synthetic_transactions
+from serializers import BinaryTransactionSerializer, JsonSerializer
+
+
+def measure(serializer, transactions):
+    start = time.perf_counter()
+    encoded = [serializer.encode(tx) for tx in transactions]
+    encode_us = (time.perf_counter() - start) / len(transactions) * 1e6
+
+    start = time.perf_counter()
+    decoded = [serializer.decode(value) for value in encoded]
+    decode_us = (time.perf_counter() - start) / len(transactions) * 1e6
+
+    start = time.perf_counter()
+    serializer.decode_many(encoded)
+    decode_many_us = (time.perf_counter() - start) / len(transactions) * 1e6
+
+    assert decoded == transactions, f"{serializer.backend}: decodificação divergente"
+    size = sum(len(value) for value in encoded) / len(encoded)
+    return size, encode_us, decode_us, decode_many_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    args = parser.parse_args()
+
+    transactions = list(synthetic_transactions(args.transactions))
+    serializers = [JsonSerializer(use_orjson=False), JsonSerializer(), BinaryTransactionSerializer()]
+
+    print(f"{'formato':<24}{'bytes/msg':>10}{'encode µs':>12}{'decode µs':>12}{'decode lote µs':>16}")
+    for serializer in serializers:
+        size, encode_us, decode_us, decode_many_us = measure(serializer, transactions)
+        label = f"{serializer.name} ({serializer.backend})"
+        print(f"{label:<24}{size:>10.1f}{encode_us:>12.2f}{decode_us:>12.2f}{decode_many_us:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,38 @@
-from collections import defaultdict
 from confluent_kafka import Consumer, Producer
-from confluent_kafka.cimpl import TopicPartition
-import json
+import argparse
+from typing import Optional
+
+from alert_publisher import AlertPublisher
+from fraud_detection import DEFAULT_ALLOWED_LATENESS
+from fraud_worker import DEFAULT_CHECKPOINT_INTERVAL, FraudWorker
+from pipeline_metrics import KAFKA_STATS_INTERVAL_MS, PipelineMetrics
 
 BROKERS = "kafka-broker-1:9092,kafka-broker-2:9092,kafka-broker-3:9092"
 INPUT_TOPIC = "transaction"
 OUTPUT_TOPIC = "fraudulent-transaction"
 
 
+# Modo em lote: quantidade máxima de mensagens por chamada a consume() e espera máxima (s)
+BATCH_SIZE = 500
+BATCH_TIMEOUT = 1.0
+
+# Diretório dos checkpoints do estado por partição
+CHECKPOINT_DIR = "./fraud_state"
+
+# Intervalo (em segundos) do resumo das métricas no log
+STATS_INTERVAL = 60.0
+
 # Configuração do Consumer Kafka
-consumer = Consumer({
+consumer_config = {
     'bootstrap.servers': BROKERS,
     'group.id': 'consumers',
     'auto.offset.reset': 'earliest',  # Começar a consumir do início
-    'enable.auto.commit': True,  # Habilitar auto-commit
-    'auto.commit.interval.ms': 2000,  # Commit a cada 2 segundos
+    'enable.auto.commit': False,  # Commit manual, somente após o checkpoint do estado
+    'enable.auto.offset.store': False,  # Offsets armazenados somente após o processamento
     'session.timeout.ms': 10000,  # Timeout de sessão de 10 segundos
     'heartbeat.interval.ms': 3000,  # Intervalo de heartbeat de 3 segundos
     'max.poll.interval.ms': 300_000,    # Tempo máximo entre chamadas sucessivas ao método poll()
-})
+}
 
 # Configuração do Producer Kafka
 producer_config = {
@@ -30,104 +44,63 @@ producer_config = {
     'compression.type': 'gzip',
 }
 
-# Criar o Producer Kafka com a configuração fornecida
-producer = Producer(producer_config)
-
-def on_rebalance(consumer: Consumer, assignment: list[TopicPartition]):
-    topics = ", ".join({str(tp.topic) for tp in assignment})
-    partitions = ", ".join([str(tp.partition) for tp in assignment])
-    print(f"Partitions assignment: Topic {topics}, partitions: {partitions}")
-
-# Estrutura para armazenar transações por usuário
-user_transactions = defaultdict(list)
-user_last_transaction = {}
-
-# Função para verificar as regras de fraude
-def check_fraud(transaction):
-    user_id = transaction['user_id']
-    timestamp = transaction['timestamp']
-    value = transaction['value']
-    country = transaction['country']
-    card_id = transaction['card_id']
-
-    fraud_alert = None
-
-    # 1. Alta Frequência: Verificar transações dentro de 5 minutos
-    if user_id in user_last_transaction:
-        last_trans = user_last_transaction[user_id]
-        if timestamp - last_trans['timestamp'] < 300:  # 5 minutos
-            if value != last_trans['value']:
-                fraud_alert = {
-                    "timestamp": timestamp,
-                    "fraud_type": "Alta Frequência",
-                    "user_id": user_id,
-                    "card_id": card_id,
-                    "details": {
-                        "last_transaction_timestamp": last_trans['timestamp'],
-                        "current_transaction_timestamp": timestamp,
-                        "value_difference": value - last_trans['value']
-                    }
-                }
-                print(f"[FRAUDE - Alta Frequência] Usuário {user_id} fez transações diferentes em menos de 5 minutos.")
-
-    # 2. Alto Valor: Verificar se o valor da transação excede o dobro do maior valor anterior
-    if user_id in user_transactions:
-        max_value = max([t['value'] for t in user_transactions[user_id]], default=0)
-        if value > 2 * max_value:
-            fraud_alert = {
-                "timestamp": timestamp,
-                "fraud_type": "Alto Valor",
-                "user_id": user_id,
-                "card_id": card_id,
-                "details": {
-                    "max_previous_value": max_value,
-                    "current_value": value
-                }
-            }
-            print(f"[FRAUDE - Alto Valor] Usuário {user_id} fez uma transação de valor {value}, superior ao dobro do maior valor anterior {max_value}.")
-
-    # 3. Outro País: Verificar transações em países diferentes em um intervalo inferior a 2 horas
-    if user_id in user_last_transaction:
-        last_country = user_last_transaction[user_id]['country']
-        last_timestamp = user_last_transaction[user_id]['timestamp']
-        if country != last_country and (timestamp - last_timestamp) < 7200:  # 2 horas
-            fraud_alert = {
-                "timestamp": timestamp,
-                "fraud_type": "Outro País",
-                "user_id": user_id,
-                "card_id": card_id,
-                "details": {
-                    "last_country": last_country,
-                    "current_country": country,
-                    "time_difference": timestamp - last_timestamp
-                }
-            }
-            print(f"[FRAUDE - Outro País] Usuário {user_id} fez transações em países diferentes em menos de 2 horas. País atual: {country}, País anterior: {last_country}")
-
-    # Se houver uma fraude, publicar no Kafka
-    if fraud_alert:
-        # Publicando a fraude com o card_id incluído
-        producer.produce(OUTPUT_TOPIC, key=str(user_id), value=json.dumps(fraud_alert))
-        producer.flush()  # Garante que a mensagem seja enviada imediatamente
-
-    # Adiciona a transação à lista de transações do usuário
-    user_transactions[user_id].append(transaction)
-    user_last_transaction[user_id] = transaction
-
-try:
-    consumer.subscribe([INPUT_TOPIC], on_assign=on_rebalance)
-    print(f"Consuming messages from {INPUT_TOPIC}")
-    while True:
-        msg = consumer.poll(1.0)
-        if msg is None:
-            continue
-        elif msg.error():
-            print(str(msg.error()))
-        transaction = json.loads(msg.value())
-        if 'user_id' in transaction and 'value' in transaction and 'country' in transaction:
-            check_fraud(transaction)
-
-except KeyboardInterrupt:
-    print('Encerrando consumidor...')
-finally:
-    consumer.close()
+def metrics_config(metrics: PipelineMetrics) -> dict:
+    """Configuração que faz o librdkafka publicar suas estatísticas (lag por partição) nas métricas"""
+    return {
+        'statistics.interval.ms': KAFKA_STATS_INTERVAL_MS,
+        'stats_cb': metrics.on_kafka_stats,
+    }
+
+def start_metrics(metrics: PipelineMetrics, port: Optional[int], stats_interval: float) -> None:
+    if port:
+        metrics.serve(port)
+    if stats_interval > 0:
+        metrics.start_reporter(stats_interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector de fraudes do tópico transaction")
+    parser.add_argument("--batch", action="store_true",
+                        help="Consome e avalia as mensagens em lotes em vez de uma a uma")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Máximo de mensagens por lote (padrão: {BATCH_SIZE})")
+    parser.add_argument("--batch-timeout", type=float, default=BATCH_TIMEOUT,
+                        help=f"Espera máxima, em segundos, para completar um lote (padrão: {BATCH_TIMEOUT})")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR,
+                        help=f"Diretório dos checkpoints do estado (padrão: {CHECKPOINT_DIR})")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f"Intervalo, em segundos, entre checkpoints e commits (padrão: {DEFAULT_CHECKPOINT_INTERVAL})")
+    parser.add_argument("--allowed-lateness", type=int, default=DEFAULT_ALLOWED_LATENESS,
+                        help=f"Atraso máximo, em segundos, aceito para um evento (padrão: {DEFAULT_ALLOWED_LATENESS})")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Expõe as métricas em http://127.0.0.1:PORTA/metrics (formato Prometheus)")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help=f"Intervalo, em segundos, do resumo das métricas no log; 0 desativa (padrão: {STATS_INTERVAL})")
+    args = parser.parse_args()
+
+    # Métricas: lag por partição (estatísticas do librdkafka), vazão, tempo das regras e latências
+    metrics = PipelineMetrics("consumer")
+    consumer = Consumer({**consumer_config, **metrics_config(metrics)})
+    # Criar o Producer Kafka com a configuração fornecida
+    producer = Producer(producer_config)
+
+    # Publicação assíncrona dos alertas: sem flush por mensagem, com callbacks de entrega
+    alert_publisher = AlertPublisher(producer, OUTPUT_TOPIC, metrics=metrics).start()
+    start_metrics(metrics, args.metrics_port, args.stats_interval)
+
+    # Estado compacto por partição e usuário (janela curta de eventos ordenada pelo timestamp)
+    worker = FraudWorker(consumer, alert_publisher, INPUT_TOPIC,
+                         checkpoint_dir=args.checkpoint_dir,
+                         checkpoint_interval=args.checkpoint_interval,
+                         batch_size=args.batch_size if args.batch else None,
+                         batch_timeout=args.batch_timeout,
+                         allowed_lateness=args.allowed_lateness,
+                         metrics=metrics)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        print('Encerrando consumidor...')
+    finally:
+        worker.close()
+
+if __name__ == "__main__":
+    main()
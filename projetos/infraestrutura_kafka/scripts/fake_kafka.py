@@ -0,0 +1,278 @@
+"""
+Implementação em memória de parte da interface `Consumer`/`Producer` do confluent_kafka.
+
+Permite exercitar o detector de fraudes (workers, rebalanceamentos, commits) localmente,
+sem brokers. O `FakeBroker` mantém os tópicos particionados, os offsets commitados e a
+distribuição das partições entre os membros de cada consumer group: uma partição só é
+entregue ao novo dono depois que o dono anterior a revogou.
+"""
+import threading
+import time
+import zlib
+from typing import Callable, Optional
+
+OFFSET_INVALID = -1001
+
+
+class TopicPartition:
+    def __init__(self, topic: str, partition: int, offset: int = OFFSET_INVALID):
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"TopicPartition({self.topic!r}, {self.partition}, {self.offset})"
+
+
+class FakeMessage:
+    def __init__(self, topic: str, partition: int, offset: int, key, value):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+    def latency(self):
+        # Sem brokers não há latência de entrega a medir
+        return None
+
+
+class FakeBroker:
+    def __init__(self, num_partitions: int = 6):
+        self.num_partitions = num_partitions
+        self.lock = threading.RLock()
+        self.topics: dict[str, list[list[FakeMessage]]] = {}
+        # Estado dos consumer groups
+        self.committed: dict[tuple[str, str, int], int] = {}
+        self.members: dict[str, list["FakeConsumer"]] = {}
+        self.owners: dict[tuple[str, str, int], Optional["FakeConsumer"]] = {}
+
+    def _partitions(self, topic: str) -> list[list[FakeMessage]]:
+        if topic not in self.topics:
+            self.topics[topic] = [[] for _ in range(self.num_partitions)]
+        return self.topics[topic]
+
+    def append(self, topic: str, key, value, partition: Optional[int] = None) -> FakeMessage:
+        with self.lock:
+            partitions = self._partitions(topic)
+            if partition is None:
+                raw_key = key.encode() if isinstance(key, str) else (key or b"")
+                partition = zlib.crc32(raw_key) % len(partitions)
+            if isinstance(value, str):
+                value = value.encode()
+            msg = FakeMessage(topic, partition, len(partitions[partition]), key, value)
+            partitions[partition].append(msg)
+            return msg
+
+    def messages(self, topic: str) -> list[FakeMessage]:
+        with self.lock:
+            return [msg for partition in self._partitions(topic) for msg in partition]
+
+    def join(self, consumer: "FakeConsumer") -> None:
+        with self.lock:
+            self.members.setdefault(consumer.group_id, []).append(consumer)
+
+    def leave(self, consumer: "FakeConsumer") -> None:
+        with self.lock:
+            self.members[consumer.group_id].remove(consumer)
+            for key, owner in self.owners.items():
+                if owner is consumer:
+                    self.owners[key] = None
+
+    def target_assignment(self, consumer: "FakeConsumer") -> list[tuple[str, int]]:
+        """Distribuição round-robin das partições entre os membros ativos do grupo"""
+        with self.lock:
+            members = self.members.get(consumer.group_id, [])
+            if consumer not in members:
+                return []
+            index = members.index(consumer)
+            all_partitions = [(topic, p) for topic in sorted(consumer.topics)
+                              for p in range(len(self._partitions(topic)))]
+            return all_partitions[index::len(members)]
+
+
+class FakeConsumer:
+    def __init__(self, broker: FakeBroker, config: dict):
+        self._broker = broker
+        self.group_id = config['group.id']
+        self.topics: list[str] = []
+        self._on_assign: Optional[Callable] = None
+        self._on_revoke: Optional[Callable] = None
+        self._owned: set[tuple[str, int]] = set()
+        self._positions: dict[tuple[str, int], int] = {}
+        self._stored: dict[tuple[str, int], int] = {}
+        self._auto_commit = config.get('enable.auto.commit', True)
+        self._closed = False
+
+    def subscribe(self, topics: list[str], on_assign: Optional[Callable] = None,
+                  on_revoke: Optional[Callable] = None) -> None:
+        self.topics = list(topics)
+        self._on_assign = on_assign
+        self._on_revoke = on_revoke
+        self._broker.join(self)
+
+    def _rebalance(self) -> None:
+        # Os callbacks rodam fora do lock do broker; as partições só são liberadas depois deles
+        broker = self._broker
+        with broker.lock:
+            target = set(broker.target_assignment(self))
+            lost = sorted(self._owned - target)
+        if lost:
+            if self._on_revoke:
+                self._on_revoke(self, [TopicPartition(t, p) for t, p in lost])
+            with broker.lock:
+                for key in lost:
+                    self._owned.discard(key)
+                    self._positions.pop(key, None)
+                    self._stored.pop(key, None)
+                    broker.owners[(self.group_id, *key)] = None
+
+        with broker.lock:
+            gained = sorted(key for key in target - self._owned
+                            if broker.owners.get((self.group_id, *key)) is None)
+            for key in gained:
+                broker.owners[(self.group_id, *key)] = self
+                self._owned.add(key)
+                committed = broker.committed.get((self.group_id, *key), OFFSET_INVALID)
+                # auto.offset.reset=earliest
+                self._positions[key] = max(committed, 0)
+        if gained and self._on_assign:
+            self._on_assign(self, [TopicPartition(t, p) for t, p in gained])
+
+    def assign(self, partitions: list[TopicPartition]) -> None:
+        """Ajusta a posição de leitura das partições já atribuídas (usado dentro do on_assign)"""
+        with self._broker.lock:
+            for tp in partitions:
+                key = (tp.topic, tp.partition)
+                if key in self._owned and tp.offset >= 0:
+                    self._positions[key] = tp.offset
+
+    def seek(self, partition: TopicPartition) -> None:
+        """Move a posição de leitura de uma partição atribuída (OFFSET_BEGINNING = -2)"""
+        with self._broker.lock:
+            key = (partition.topic, partition.partition)
+            if key in self._owned:
+                self._positions[key] = max(partition.offset, 0)
+
+    def assignment(self) -> list[TopicPartition]:
+        return [TopicPartition(t, p) for t, p in sorted(self._owned)]
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list[FakeMessage]:
+        self._rebalance()
+        if self._auto_commit:
+            # Simplificação do auto.commit.interval.ms: confirma a cada chamada
+            self.commit()
+        messages = []
+        with self._broker.lock:
+            for key in sorted(self._owned):
+                partition = self._broker._partitions(key[0])[key[1]]
+                position = self._positions[key]
+                batch = partition[position:position + num_messages - len(messages)]
+                messages.extend(batch)
+                self._positions[key] = position + len(batch)
+                if len(messages) >= num_messages:
+                    break
+        if not messages and timeout:
+            time.sleep(min(timeout, 0.01) if timeout > 0 else 0.01)
+        return messages
+
+    def poll(self, timeout: float = -1) -> Optional[FakeMessage]:
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def store_offsets(self, message: Optional[FakeMessage] = None, offsets: Optional[list] = None) -> None:
+        if message is not None:
+            self._stored[(message.topic(), message.partition())] = message.offset() + 1
+        for tp in offsets or []:
+            self._stored[(tp.topic, tp.partition)] = tp.offset
+
+    def commit(self, message: Optional[FakeMessage] = None, offsets: Optional[list] = None,
+               asynchronous: bool = True) -> None:
+        if message is not None or offsets:
+            self.store_offsets(message, offsets)
+        with self._broker.lock:
+            for key, offset in self._stored.items():
+                if key in self._owned:
+                    self._broker.committed[(self.group_id, *key)] = offset
+
+    def committed(self, partitions: list[TopicPartition], timeout: float = -1) -> list[TopicPartition]:
+        with self._broker.lock:
+            return [TopicPartition(tp.topic, tp.partition,
+                                   self._broker.committed.get((self.group_id, tp.topic, tp.partition),
+                                                              OFFSET_INVALID))
+                    for tp in partitions]
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._owned and self._on_revoke:
+            self._on_revoke(self, [TopicPartition(t, p) for t, p in sorted(self._owned)])
+        if self._auto_commit:
+            self.commit()
+        with self._broker.lock:
+            self._owned.clear()
+            self._broker.leave(self)
+
+
+class FakeProducer:
+    def __init__(self, broker: FakeBroker, config: Optional[dict] = None):
+        self._broker = broker
+        self._pending: list[tuple] = []
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def produce(self, topic: str, value=None, key=None, partition: Optional[int] = None,
+                on_delivery: Optional[Callable] = None, **kwargs) -> None:
+        with self._cond:
+            self._pending.append((topic, key, value, partition, on_delivery))
+            self._cond.notify_all()
+
+    def poll(self, timeout: float = -1) -> int:
+        with self._cond:
+            if not self._pending and timeout:
+                self._cond.wait(timeout if timeout > 0 else None)
+            pending, self._pending = self._pending, []
+            self._in_flight += len(pending)
+        for topic, key, value, partition, on_delivery in pending:
+            msg = self._broker.append(topic, key, value, partition)
+            if on_delivery:
+                on_delivery(None, msg)
+        with self._cond:
+            self._in_flight -= len(pending)
+            self._cond.notify_all()
+        return len(pending)
+
+    def flush(self, timeout: float = -1) -> int:
+        """Entrega as mensagens pendentes e aguarda as que estão em trânsito em outra thread"""
+        self.poll(0)
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return len(self)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._in_flight
@@ -0,0 +1,81 @@
+import math
+import os
+import struct
+import zlib
+from typing import Optional
+
+from fraud_detection import DEFAULT_ALLOWED_LATENESS, FraudStateStore, UserState
+
+# Formato binário do checkpoint de uma partição:
+#   cabeçalho: magic, versão, próximo offset a processar, relógio dos eventos, qtde. de usuários
+#   registros: user_id, maior valor já removido da janela (NaN se nenhum), touched_at, qtde. de eventos
+#   eventos do usuário, em ordem de timestamp: timestamp, valor, país (tamanho + bytes)
+#   rodapé: CRC32 de todo o conteúdo anterior
+MAGIC = b"FRDS"
+VERSION = 1
+HEADER = struct.Struct("<4sHqqI")
+RECORD = struct.Struct("<qdqH")
+EVENT = struct.Struct("<qdB")
+FOOTER = struct.Struct("<I")
+
+
+def checkpoint_path(checkpoint_dir: str, topic: str, partition: int) -> str:
+    return os.path.join(checkpoint_dir, f"{topic}-{partition}.state")
+
+
+def write_checkpoint(path: str, store: FraudStateStore, offset: int) -> None:
+    """Grava o estado da partição de forma atômica (arquivo temporário + fsync + rename)"""
+    buffer = bytearray(HEADER.pack(MAGIC, VERSION, offset, store.clock, len(store)))
+    for user_id, state in store.items():
+        evicted_max = math.nan if state.evicted_max is None else state.evicted_max
+        buffer += RECORD.pack(user_id, evicted_max, state.touched_at, len(state))
+        for timestamp, value, country in zip(state.timestamps, state.values, state.countries):
+            country = country.encode("utf-8")
+            buffer += EVENT.pack(timestamp, value, len(country))
+            buffer += country
+    buffer += FOOTER.pack(zlib.crc32(buffer))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str, ttl: int, max_users: Optional[int] = None,
+                    allowed_lateness: int = DEFAULT_ALLOWED_LATENESS) -> Optional[tuple[FraudStateStore, int]]:
+    """Lê um checkpoint; retorna (store, próximo offset) ou None se o arquivo não existir ou estiver corrompido"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size + FOOTER.size:
+        print(f"Checkpoint {path} truncado; ignorando")
+        return None
+    (crc,) = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    if zlib.crc32(data[:-FOOTER.size]) != crc:
+        print(f"Checkpoint {path} corrompido; ignorando")
+        return None
+    magic, version, offset, clock, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        print(f"Checkpoint {path} em formato desconhecido; ignorando")
+        return None
+
+    users = []
+    position = HEADER.size
+    for _ in range(count):
+        user_id, evicted_max, touched_at, event_count = RECORD.unpack_from(data, position)
+        position += RECORD.size
+        state = UserState(touched_at, evicted_max=None if math.isnan(evicted_max) else evicted_max)
+        for i in range(event_count):
+            timestamp, value, country_len = EVENT.unpack_from(data, position)
+            position += EVENT.size
+            state.insert(i, timestamp, value, data[position:position + country_len].decode("utf-8"))
+            position += country_len
+        users.append((user_id, state))
+
+    store = FraudStateStore(ttl=ttl, max_users=max_users, allowed_lateness=allowed_lateness)
+    store.restore(users, clock)
+    return store, offset
@@ -0,0 +1,396 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from serializers import JsonSerializer
+
+# Janelas das regras de fraude (em segundos)
+HIGH_FREQUENCY_WINDOW = 300  # 5 minutos
+OTHER_COUNTRY_WINDOW = 7200  # 2 horas
+
+# Tempo sem transações (no relógio dos eventos) até o estado do usuário ser descartado
+DEFAULT_STATE_TTL = 24 * 3600  # 24 horas
+
+# Atraso máximo aceito de um evento em relação ao maior timestamp já observado. O producer
+# intercala transações com timestamps defasados em mais de 1 hora (padrões de alto valor);
+# eventos anteriores à marca d'água (relógio - atraso permitido) são descartados e
+# contados em `late_events`
+DEFAULT_ALLOWED_LATENESS = 7200  # 2 horas
+
+# Máximo de eventos mantidos na janela de cada usuário
+MAX_EVENTS_PER_USER = 32
+
+
+class UserState:
+    """
+    Janela de eventos de um usuário, ordenada pelo timestamp do evento.
+
+    Guarda apenas os eventos que ainda podem ser comparados com um evento aceito pela marca
+    d'água (até `OTHER_COUNTRY_WINDOW` antes dela), em listas paralelas. `max_values[i]` é
+    o maior valor até a posição i, incluindo os eventos já removidos da janela (`evicted_max`),
+    então o maior valor anterior a qualquer posição é obtido em O(1).
+    """
+    __slots__ = ("timestamps", "values", "countries", "max_values", "evicted_max", "touched_at")
+
+    def __init__(self, touched_at: int, evicted_max: Optional[float] = None):
+        self.timestamps: list[int] = []
+        self.values: list[float] = []
+        self.countries: list[str] = []
+        self.max_values: list[float] = []
+        self.evicted_max = evicted_max
+        self.touched_at = touched_at
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def position(self, timestamp: int) -> int:
+        """Posição de um novo evento na janela (após os eventos com o mesmo timestamp)"""
+        timestamps = self.timestamps
+        if not timestamps or timestamp >= timestamps[-1]:
+            return len(timestamps)
+        return bisect_right(timestamps, timestamp)
+
+    def max_before(self, position: int) -> Optional[float]:
+        """Maior valor entre os eventos anteriores à posição, ou None se não houver nenhum"""
+        return self.max_values[position - 1] if position else self.evicted_max
+
+    def insert(self, position: int, timestamp: int, value: float, country: str) -> None:
+        previous_max = self.max_values[position - 1] if position else self.evicted_max
+        new_max = value if previous_max is None or value > previous_max else previous_max
+        if position == len(self.timestamps):
+            # Caso comum: evento em ordem, inserido no fim da janela
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+            self.countries.append(country)
+            self.max_values.append(new_max)
+            return
+        self.timestamps.insert(position, timestamp)
+        self.values.insert(position, value)
+        self.countries.insert(position, country)
+        self.max_values.insert(position, new_max)
+        # Evento atrasado: os máximos dos eventos posteriores passam a incluí-lo
+        max_values = self.max_values
+        for i in range(position + 1, len(max_values)):
+            if max_values[i] < value:
+                max_values[i] = value
+
+    def trim(self, cutoff: int, max_events: int) -> None:
+        """Remove do início da janela os eventos anteriores a `cutoff` e os que excedem `max_events`"""
+        timestamps = self.timestamps
+        if timestamps[0] >= cutoff and len(timestamps) <= max_events:
+            return
+        count = 0
+        while count < len(timestamps) - 1 and (timestamps[count] < cutoff or len(timestamps) - count > max_events):
+            count += 1
+        if count:
+            self.evicted_max = self.max_values[count - 1]
+            del self.timestamps[:count], self.values[:count], self.countries[:count], self.max_values[:count]
+
+
+class FraudStateStore:
+    """
+    Armazena o estado por usuário com memória limitada.
+
+    Em vez de guardar todas as transações de cada usuário, mantém uma janela curta de
+    eventos ordenada pelo timestamp (ver `UserState`), limitada pela marca d'água e por
+    `max_events`. Usuários sem atividade por mais de `ttl` segundos (medidos pelo maior
+    timestamp de evento já recebido) são descartados, assim como os menos recentes quando
+    `max_users` é excedido.
+    """
+
+    def __init__(self, ttl: int = DEFAULT_STATE_TTL, max_users: Optional[int] = None,
+                 allowed_lateness: int = DEFAULT_ALLOWED_LATENESS, max_events: int = MAX_EVENTS_PER_USER):
+        self._ttl = ttl
+        self._max_users = max_users
+        self._allowed_lateness = allowed_lateness
+        self._max_events = max_events
+        self.late_events = 0
+        # Ordenado pelo último acesso: o primeiro item é sempre o mais antigo
+        self._users: "OrderedDict[int, UserState]" = OrderedDict()
+        self._clock = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    @property
+    def clock(self) -> int:
+        """Maior timestamp de evento observado até agora"""
+        return self._clock
+
+    @property
+    def ttl(self) -> int:
+        return self._ttl
+
+    @property
+    def max_users(self) -> Optional[int]:
+        return self._max_users
+
+    @property
+    def watermark(self) -> int:
+        """Eventos com timestamp anterior à marca d'água chegaram tarde demais"""
+        return self._clock - self._allowed_lateness
+
+    def is_late(self, timestamp: int, clock: Optional[int] = None) -> bool:
+        return timestamp < (self._clock if clock is None else clock) - self._allowed_lateness
+
+    def items(self) -> Iterable[tuple[int, UserState]]:
+        """Usuários na ordem de acesso (do mais antigo ao mais recente)"""
+        return self._users.items()
+
+    def restore(self, users: Iterable[tuple[int, UserState]], clock: int) -> None:
+        """Recarrega o estado a partir de um checkpoint, preservando a ordem de acesso"""
+        self._users = OrderedDict(users)
+        self._clock = clock
+        self.evict_expired()
+
+    def get(self, user_id: int, as_of: Optional[int] = None) -> Optional[UserState]:
+        """
+        Retorna o estado do usuário, ou None se ele não existir ou já estiver expirado
+        no instante `as_of` (por padrão, o relógio atual do store).
+        """
+        state = self._users.get(user_id)
+        if state is None:
+            return None
+        clock = self._clock if as_of is None else as_of
+        if state.touched_at < clock - self._ttl:
+            return None
+        return state
+
+    def update(self, user_id: int, timestamp: int, value: float, country: str,
+               clock: Optional[int] = None, evict: bool = True) -> None:
+        """
+        Insere a transação na janela do usuário, na posição do seu timestamp.
+
+        No modo em lote, `clock` informa o relógio dos eventos naquela posição do lote e
+        `evict=False` adia o descarte para o fim do lote (ver `finish_batch`).
+        """
+        if clock is None:
+            if timestamp > self._clock:
+                self._clock = timestamp
+            clock = self._clock
+
+        state = self._users.get(user_id)
+        if state is None or state.touched_at < clock - self._ttl:
+            state = self._users[user_id] = UserState(clock)
+        else:
+            state.touched_at = clock
+        state.insert(state.position(timestamp), timestamp, value, country)
+        # Eventos anteriores a este limite não podem mais ser comparados com um evento aceito
+        state.trim(clock - self._allowed_lateness - OTHER_COUNTRY_WINDOW, self._max_events)
+        self._users.move_to_end(user_id)
+
+        if evict:
+            self.evict_expired()
+
+    def finish_batch(self, clock: int, touched_in_order: Iterable[int]) -> None:
+        """
+        Conclui um lote: avança o relógio, restaura a ordem de acesso dos usuários
+        (pela última transação de cada um no lote) e descarta os expirados.
+        """
+        if clock > self._clock:
+            self._clock = clock
+        for user_id in touched_in_order:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+        self.evict_expired()
+
+    def evict_expired(self) -> int:
+        """Remove usuários inativos; custo amortizado O(1) por transação"""
+        users = self._users
+        cutoff = self._clock - self._ttl
+        removed = 0
+        # `touched_at` é não decrescente na ordem do dicionário, então basta olhar o início
+        while users:
+            user_id, state = next(iter(users.items()))
+            expired = state.touched_at < cutoff
+            over_capacity = self._max_users is not None and len(users) > self._max_users
+            if not (expired or over_capacity):
+                break
+            users.popitem(last=False)
+            removed += 1
+        self.evicted += removed
+        return removed
+
+
+def high_frequency_rule(state: UserState, transaction: dict, position: int,
+                        verbose: bool = True) -> Optional[dict]:
+    """1. Alta Frequência: transações com valores diferentes em menos de 5 minutos"""
+    timestamp = transaction['timestamp']
+    value = transaction['value']
+    count = len(state.timestamps)
+    # Eventos vizinhos no tempo: o anterior e, para eventos atrasados, o posterior
+    for i in (position - 1, position):
+        if i < 0 or i == count:
+            continue
+        other_timestamp = state.timestamps[i]
+        other_value = state.values[i]
+        if abs(timestamp - other_timestamp) < HIGH_FREQUENCY_WINDOW and value != other_value:
+            user_id = transaction['user_id']
+            if verbose:
+                print(f"[FRAUDE - Alta Frequência] Usuário {user_id} fez transações diferentes em menos de 5 minutos.")
+            return {
+                "timestamp": timestamp,
+                "fraud_type": "Alta Frequência",
+                "user_id": user_id,
+                "card_id": transaction['card_id'],
+                "details": {
+                    "last_transaction_timestamp": other_timestamp,
+                    "current_transaction_timestamp": timestamp,
+                    "value_difference": value - other_value
+                }
+            }
+    return None
+
+
+def high_value_rule(state: UserState, transaction: dict, position: int,
+                    verbose: bool = True) -> Optional[dict]:
+    """2. Alto Valor: valor da transação acima do dobro do maior valor anterior"""
+    value = transaction['value']
+    max_value = state.max_before(position)
+    if max_value is not None and value > 2 * max_value:
+        user_id = transaction['user_id']
+        if verbose:
+            print(f"[FRAUDE - Alto Valor] Usuário {user_id} fez uma transação de valor {value}, superior ao dobro do maior valor anterior {max_value}.")
+        return {
+            "timestamp": transaction['timestamp'],
+            "fraud_type": "Alto Valor",
+            "user_id": user_id,
+            "card_id": transaction['card_id'],
+            "details": {
+                "max_previous_value": max_value,
+                "current_value": value
+            }
+        }
+    return None
+
+
+def other_country_rule(state: UserState, transaction: dict, position: int,
+                       verbose: bool = True) -> Optional[dict]:
+    """3. Outro País: transações em países diferentes em um intervalo inferior a 2 horas"""
+    timestamp = transaction['timestamp']
+    country = transaction['country']
+    count = len(state.timestamps)
+    for i in (position - 1, position):
+        if i < 0 or i == count:
+            continue
+        other_country = state.countries[i]
+        other_timestamp = state.timestamps[i]
+        if country != other_country and abs(timestamp - other_timestamp) < OTHER_COUNTRY_WINDOW:
+            user_id = transaction['user_id']
+            if verbose:
+                print(f"[FRAUDE - Outro País] Usuário {user_id} fez transações em países diferentes em menos de 2 horas. País atual: {country}, País anterior: {other_country}")
+            return {
+                "timestamp": timestamp,
+                "fraud_type": "Outro País",
+                "user_id": user_id,
+                "card_id": transaction['card_id'],
+                "details": {
+                    "last_country": other_country,
+                    "current_country": country,
+                    "time_difference": timestamp - other_timestamp
+                }
+            }
+    return None
+
+
+# Regras na ordem de avaliação (nome usado nas métricas, função)
+RULES = (
+    ("alta_frequencia", high_frequency_rule),
+    ("alto_valor", high_value_rule),
+    ("outro_pais", other_country_rule),
+)
+
+
+def evaluate_rules(state: Optional[UserState], transaction: dict, verbose: bool = True) -> Optional[dict]:
+    """
+    Aplica as regras de fraude à transação, comparando-a com os eventos da janela do
+    usuário vizinhos no tempo (e não com o último recebido), de modo que eventos fora de
+    ordem não geram diferenças de tempo negativas.
+
+    Retorna o alerta de fraude (a última regra disparada prevalece) ou None.
+    """
+    fraud_alert = None
+    if state is not None and len(state):
+        position = state.position(transaction['timestamp'])
+        for _, rule in RULES:
+            rule_alert = rule(state, transaction, position, verbose)
+            if rule_alert is not None:
+                fraud_alert = rule_alert
+    return fraud_alert
+
+
+def check_fraud(store: FraudStateStore, transaction: dict, verbose: bool = True) -> Optional[dict]:
+    """Avalia uma transação (modo streaming) e atualiza o estado do usuário"""
+    if store.is_late(transaction['timestamp']):
+        store.late_events += 1
+        return None
+    user_id = transaction['user_id']
+    fraud_alert = evaluate_rules(store.get(user_id), transaction, verbose)
+    # Atualiza o estado do usuário com a transação atual
+    store.update(user_id, transaction['timestamp'], transaction['value'], transaction['country'])
+    return fraud_alert
+
+
+def check_fraud_batch(store: FraudStateStore, transactions: list[dict],
+                      verbose: bool = True) -> list[Optional[dict]]:
+    """
+    Avalia um lote de transações agrupando-as por usuário.
+
+    As transações de cada usuário são avaliadas em ordem, contra o estado que o modo
+    streaming teria naquela posição: o relógio dos eventos é pré-calculado para cada
+    posição do lote, de modo que a expiração por TTL produz as mesmas decisões.
+    Retorna a lista de alertas (ou None) alinhada com `transactions`.
+
+    Com `max_users`, o descarte por capacidade depende da ordem exata das transações, que o
+    agrupamento por usuário não preserva: o lote é avaliado transação a transação, como no
+    modo streaming.
+    """
+    if not transactions:
+        return []
+    if store.max_users is not None:
+        return [check_fraud(store, transaction, verbose) for transaction in transactions]
+
+    # Relógio dos eventos antes e depois de cada posição do lote
+    clocks_before = []
+    clocks_after = []
+    clock = store.clock
+    by_user: dict[int, list[int]] = {}
+    for i, transaction in enumerate(transactions):
+        clocks_before.append(clock)
+        if transaction['timestamp'] > clock:
+            clock = transaction['timestamp']
+        clocks_after.append(clock)
+        by_user.setdefault(transaction['user_id'], []).append(i)
+
+    alerts: list[Optional[dict]] = [None] * len(transactions)
+    for user_id, positions in by_user.items():
+        for i in positions:
+            transaction = transactions[i]
+            if store.is_late(transaction['timestamp'], clock=clocks_before[i]):
+                store.late_events += 1
+                continue
+            state = store.get(user_id, as_of=clocks_before[i])
+            alerts[i] = evaluate_rules(state, transaction, verbose)
+            store.update(user_id, transaction['timestamp'], transaction['value'], transaction['country'],
+                         clock=clocks_after[i], evict=False)
+
+    # Usuários ordenados pela posição da sua última transação no lote
+    last_seen = sorted(by_user, key=lambda user: by_user[user][-1])
+    store.finish_batch(clock, last_seen)
+    return alerts
+
+
+def is_valid_transaction(transaction: dict) -> bool:
+    return 'user_id' in transaction and 'value' in transaction and 'country' in transaction
+
+
+def decode_transactions(values: list[bytes], serializer=None) -> list[dict]:
+    """Decodifica um lote de mensagens e descarta as que não são transações válidas"""
+    if serializer is None:
+        serializer = JsonSerializer()
+    decoded = serializer.decode_many(values)
+    return [tx for tx in decoded if isinstance(tx, dict) and is_valid_transaction(tx)]
@@ -0,0 +1,96 @@
+"""
+Supervisor do detector de fraudes com múltiplos processos.
+
+Inicia K processos worker no mesmo consumer group; o Kafka distribui as partições do
+tópico `transaction` entre eles e cada worker mantém o estado dos usuários das suas
+partições. O estado das partições é gravado periodicamente em `--checkpoint-dir`, de onde
+o novo dono (após um rebalanceamento ou reinício) continua de onde o anterior parou. Workers que terminam com erro são
+reiniciados.
+
+Uso: python fraud_supervisor.py --workers 4 --batch
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from confluent_kafka import Consumer, Producer
+
+from alert_publisher import AlertPublisher
+from consumer import (BATCH_SIZE, BATCH_TIMEOUT, CHECKPOINT_DIR, INPUT_TOPIC, OUTPUT_TOPIC, STATS_INTERVAL,
+                      consumer_config, metrics_config, producer_config, start_metrics)
+from fraud_detection import DEFAULT_ALLOWED_LATENESS
+from fraud_worker import DEFAULT_CHECKPOINT_INTERVAL, FraudWorker
+from pipeline_metrics import PipelineMetrics
+
+
+def run_worker(worker_id: int, args: argparse.Namespace, stop_event) -> None:
+    # Cada worker cria seus próprios clientes Kafka, dentro do processo filho
+    name = f"worker-{worker_id}"
+    metrics = PipelineMetrics(name)
+    consumer = Consumer({**consumer_config, **metrics_config(metrics), 'client.id': name})
+    producer = Producer({**producer_config, 'client.id': name})
+    alert_publisher = AlertPublisher(producer, OUTPUT_TOPIC, metrics=metrics).start()
+    # Cada worker expõe suas métricas na porta base + id do worker
+    start_metrics(metrics, args.metrics_port and args.metrics_port + worker_id, args.stats_interval)
+    worker = FraudWorker(consumer, alert_publisher, INPUT_TOPIC,
+                         checkpoint_dir=args.checkpoint_dir,
+                         checkpoint_interval=args.checkpoint_interval,
+                         batch_size=args.batch_size if args.batch else None,
+                         batch_timeout=args.batch_timeout,
+                         allowed_lateness=args.allowed_lateness,
+                         name=name,
+                         metrics=metrics)
+    try:
+        worker.run(stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+
+
+def start_worker(worker_id: int, args: argparse.Namespace, stop_event) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_worker, args=(worker_id, args, stop_event),
+                                      name=f"worker-{worker_id}")
+    process.start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Quantidade de processos worker (padrão: número de CPUs)")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR,
+                        help=f"Diretório dos checkpoints do estado (padrão: {CHECKPOINT_DIR})")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL)
+    parser.add_argument("--batch", action="store_true",
+                        help="Consome e avalia as mensagens em lotes em vez de uma a uma")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batch-timeout", type=float, default=BATCH_TIMEOUT)
+    parser.add_argument("--allowed-lateness", type=int, default=DEFAULT_ALLOWED_LATENESS)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Porta base das métricas: o worker N usa a porta base + N")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    args = parser.parse_args()
+
+    stop_event = multiprocessing.Event()
+    processes = {worker_id: start_worker(worker_id, args, stop_event) for worker_id in range(args.workers)}
+    print(f"Supervisor: {args.workers} workers iniciados")
+
+    try:
+        while True:
+            time.sleep(1)
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    print(f"Supervisor: worker-{worker_id} terminou com código {process.exitcode}; reiniciando")
+                    processes[worker_id] = start_worker(worker_id, args, stop_event)
+    except KeyboardInterrupt:
+        print("Encerrando workers...")
+    finally:
+        stop_event.set()
+        for process in processes.values():
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
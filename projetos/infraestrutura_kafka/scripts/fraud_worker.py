@@ -0,0 +1,291 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from confluent_kafka import Consumer
+from confluent_kafka.cimpl import TopicPartition
+
+from alert_publisher import AlertPublisher
+from fraud_checkpoint import checkpoint_path, read_checkpoint, write_checkpoint
+from fraud_detection import (DEFAULT_ALLOWED_LATENESS, DEFAULT_STATE_TTL, RULES, FraudStateStore, check_fraud, check_fraud_batch,
+                             decode_transactions)
+from pipeline_metrics import RULE_SAMPLE_RATE, PipelineMetrics
+from serializers import serializer_for_topic
+
+# Offset inválido do librdkafka (partição ainda sem commit)
+OFFSET_INVALID = -1001
+# Offset lógico do início da partição
+OFFSET_BEGINNING = -2
+
+# Intervalo (em segundos) entre checkpoints do estado seguidos de commit dos offsets
+DEFAULT_CHECKPOINT_INTERVAL = 5.0
+
+
+class FraudWorker:
+    """
+    Detector de fraudes com estado afinado às partições.
+
+    Como o producer usa o `user_id` como chave, todas as transações de um usuário caem na
+    mesma partição; por isso o worker mantém um `FraudStateStore` por partição atribuída.
+
+    A cada `checkpoint_interval` segundos, e sempre que partições são revogadas, o worker
+    entrega os alertas pendentes, grava o estado das partições em `checkpoint_dir` e só
+    então faz o commit dos offsets correspondentes (`enable.auto.commit=False`). Ao receber
+    uma partição (após um rebalanceamento ou reinício), restaura o checkpoint e retoma a
+    leitura do offset gravado nele, sem reprocessar o tópico desde o início e sem duplicar
+    nem perder alertas.
+
+    O consumidor pode ser o `Consumer` do confluent_kafka ou o `FakeConsumer` de
+    `fake_kafka.py`. Com `metrics`, registra as mensagens processadas por partição, o tempo
+    de processamento de cada lote e, em uma amostra das transações, o tempo de cada regra.
+    """
+
+    def __init__(self, consumer: Consumer, alert_publisher: AlertPublisher, topic: str,
+                 checkpoint_dir: Optional[str] = None,
+                 checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+                 batch_size: Optional[int] = None, batch_timeout: float = 1.0,
+                 state_ttl: int = DEFAULT_STATE_TTL, allowed_lateness: int = DEFAULT_ALLOWED_LATENESS,
+                 name: str = "worker", verbose: bool = True,
+                 metrics: Optional[PipelineMetrics] = None):
+        self._consumer = consumer
+        self._alert_publisher = alert_publisher
+        self._topic = topic
+        self._checkpoint_dir = checkpoint_dir
+        self._checkpoint_interval = checkpoint_interval
+        self._batch_size = batch_size
+        self._batch_timeout = batch_timeout
+        self._state_ttl = state_ttl
+        self._allowed_lateness = allowed_lateness
+        self._name = name
+        self._verbose = verbose
+        self._serializer = serializer_for_topic(topic)
+        self._metrics = metrics
+        if metrics is not None:
+            self._batch_histogram = metrics.histogram("process_batch_seconds")
+            self._rule_histograms = [(rule, metrics.histogram("rule_duration_seconds", rule=rule_name))
+                                     for rule_name, rule in RULES]
+        # Transações até a próxima medição do tempo das regras
+        self._rule_sample_countdown = RULE_SAMPLE_RATE
+        # Estado e próximo offset a processar, por partição atribuída
+        self.states: dict[int, FraudStateStore] = {}
+        self._next_offsets: dict[int, int] = {}
+        # Partições com mensagens processadas desde o último checkpoint
+        self._dirty: set[int] = set()
+        self._last_checkpoint = time.monotonic()
+        # Falhas de entrega de alertas já contabilizadas no último checkpoint bem-sucedido
+        self._failed_alerts = alert_publisher.stats()["failed"]
+        self.processed = 0
+
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def subscribe(self) -> None:
+        self._consumer.subscribe([self._topic], on_assign=self.on_assign, on_revoke=self.on_revoke)
+        print(f"[{self._name}] Consuming messages from {self._topic}")
+
+    def _restore_partition(self, tp: TopicPartition) -> bool:
+        """
+        Restaura o estado da partição a partir do checkpoint. Retorna True se a leitura
+        deve ser retomada do offset do checkpoint em vez do offset commitado.
+        """
+        partition = tp.partition
+        restored = None
+        if self._checkpoint_dir:
+            restored = read_checkpoint(checkpoint_path(self._checkpoint_dir, self._topic, partition),
+                                       ttl=self._state_ttl, allowed_lateness=self._allowed_lateness)
+        if restored is not None:
+            store, offset = restored
+            # O commit só acontece depois do checkpoint, então um checkpoint mais antigo que o
+            # offset commitado não reflete todas as mensagens confirmadas
+            if tp.offset == OFFSET_INVALID or offset >= tp.offset:
+                self.states[partition] = store
+                self._next_offsets[partition] = offset
+                if offset != OFFSET_INVALID:
+                    print(f"[{self._name}] Estado da partição {partition} restaurado: "
+                          f"{len(store):,} usuários, offset {offset}")
+                return offset != tp.offset
+            print(f"[{self._name}] Checkpoint da partição {partition} desatualizado "
+                  f"(offset {offset}, commit {tp.offset}); iniciando vazio")
+
+        self.states[partition] = FraudStateStore(ttl=self._state_ttl, allowed_lateness=self._allowed_lateness)
+        self._next_offsets[partition] = tp.offset
+        return False
+
+    def on_assign(self, consumer: Consumer, partitions: list[TopicPartition]) -> None:
+        committed = consumer.committed(partitions, timeout=10)
+        seek_needed = False
+        for tp in committed:
+            if tp.partition in self.states:
+                continue
+            if self._restore_partition(tp):
+                # Checkpoint gravado sem o commit correspondente (ex.: queda entre os dois):
+                # os alertas até ali já foram entregues, então retoma do offset do checkpoint
+                tp.offset = self._next_offsets[tp.partition]
+                seek_needed = True
+        if seek_needed:
+            consumer.assign(committed)
+        assigned = ", ".join(str(tp.partition) for tp in partitions)
+        print(f"[{self._name}] Partitions assignment: Topic {self._topic}, partitions: {assigned}")
+
+    def checkpoint(self, partitions: Optional[list[int]] = None) -> bool:
+        """
+        Entrega os alertas pendentes, grava o estado das partições e faz o commit dos
+        offsets processados, nessa ordem. Além de `partitions`, todas as partições com
+        mensagens processadas desde o último checkpoint são gravadas, pois o commit
+        confirma os offsets de todas elas.
+
+        Se algum alerta ainda estiver pendente após o flush, ou se houver novas falhas de
+        entrega, nem o estado nem os offsets são gravados. Com alertas pendentes, as
+        partições continuam pendentes até o próximo checkpoint; com falhas de entrega, são
+        reprocessadas a partir do último checkpoint (ver `_rewind_dirty`). Retorna True se o
+        checkpoint foi concluído.
+        """
+        remaining = self._alert_publisher.flush()
+        failed = self._alert_publisher.stats()["failed"]
+        self._last_checkpoint = time.monotonic()
+        if remaining or failed > self._failed_alerts:
+            print(f"[{self._name}] Checkpoint adiado: {remaining} alertas pendentes, "
+                  f"{failed - self._failed_alerts} falhas de entrega desde o último checkpoint")
+            if failed > self._failed_alerts and not remaining:
+                self._rewind_dirty(failed)
+            return False
+        if self._checkpoint_dir:
+            for partition in sorted(self._dirty.union(partitions or [])):
+                if partition in self.states:
+                    write_checkpoint(checkpoint_path(self._checkpoint_dir, self._topic, partition),
+                                     self.states[partition], self._next_offsets[partition])
+        self._failed_alerts = failed
+        if self._dirty:
+            try:
+                self._consumer.commit(asynchronous=False)
+            except Exception as e:
+                print(f"[{self._name}] Falha no commit dos offsets: {e}")
+        self._dirty.clear()
+        return True
+
+    def _rewind_dirty(self, failed: int) -> None:
+        """
+        Descarta o processamento das partições pendentes desde o último checkpoint: o estado
+        volta ao do checkpoint e a leitura, ao offset confirmado. Os alertas que falharam são
+        publicados novamente (os já entregues nesse intervalo podem se repetir).
+        """
+        partitions = [TopicPartition(self._topic, partition) for partition in sorted(self._dirty)
+                      if partition in self.states]
+        for tp in self._consumer.committed(partitions, timeout=10):
+            del self.states[tp.partition]
+            self._restore_partition(tp)
+            offset = self._next_offsets[tp.partition]
+            # Sem commit nem checkpoint, recomeça do início da partição (auto.offset.reset=earliest)
+            offset = offset if offset >= 0 else OFFSET_BEGINNING
+            self._consumer.seek(TopicPartition(self._topic, tp.partition, offset))
+            if offset >= 0:
+                # O offset armazenado em `process_messages` seria confirmado no próximo commit
+                self._consumer.store_offsets(offsets=[TopicPartition(self._topic, tp.partition, offset)])
+            print(f"[{self._name}] Partição {tp.partition} reprocessada a partir do offset {offset}")
+        self._dirty.clear()
+        self._failed_alerts = failed
+
+    def on_revoke(self, consumer: Consumer, partitions: list[TopicPartition]) -> None:
+        revoked = [tp.partition for tp in partitions if tp.partition in self.states]
+        if not self.checkpoint(revoked):
+            # Sem commit: o novo dono retoma do último offset confirmado e reprocessa as mensagens
+            print(f"[{self._name}] Partições revogadas sem commit, pois há alertas não entregues")
+            self._dirty.difference_update(revoked)
+        for partition in revoked:
+            del self.states[partition]
+            del self._next_offsets[partition]
+        print(f"[{self._name}] Partitions revoked: {', '.join(str(tp.partition) for tp in partitions)}")
+
+    def _time_rules(self, store: FraudStateStore, transactions: list[dict]) -> None:
+        """Mede o tempo de cada regra em uma a cada RULE_SAMPLE_RATE transações"""
+        countdown = self._rule_sample_countdown - len(transactions)
+        position = len(transactions) + countdown - 1
+        while countdown <= 0:
+            transaction = transactions[position]
+            state = store.get(transaction['user_id'])
+            if state is not None:
+                rule_position = state.position(transaction['timestamp'])
+                for rule, histogram in self._rule_histograms:
+                    start = time.perf_counter()
+                    rule(state, transaction, rule_position, False)
+                    histogram.observe(time.perf_counter() - start)
+            countdown += RULE_SAMPLE_RATE
+            position += RULE_SAMPLE_RATE
+        self._rule_sample_countdown = countdown
+
+    def process_messages(self, messages: list) -> int:
+        """Avalia as mensagens recebidas, publica os alertas e armazena os offsets processados"""
+        start = time.perf_counter()
+        by_partition: dict[int, list] = {}
+        for msg in messages:
+            if msg.error():
+                print(str(msg.error()))
+                continue
+            if msg.partition() not in self.states:
+                # Mensagem de uma partição que já foi revogada: o novo dono irá processá-la
+                continue
+            by_partition.setdefault(msg.partition(), []).append(msg)
+
+        processed = 0
+        for partition, partition_messages in by_partition.items():
+            store = self.states[partition]
+            if self._batch_size:
+                transactions = decode_transactions([msg.value() for msg in partition_messages],
+                                                   self._serializer)
+                if self._metrics is not None:
+                    self._time_rules(store, transactions)
+                fraud_alerts = check_fraud_batch(store, transactions, verbose=self._verbose)
+            else:
+                fraud_alerts = []
+                for msg in partition_messages:
+                    # Mesmo descarte do modo em lote: mensagens malformadas ou que não são transações
+                    for transaction in decode_transactions([msg.value()], self._serializer):
+                        if self._metrics is not None:
+                            self._time_rules(store, [transaction])
+                        fraud_alerts.append(check_fraud(store, transaction, verbose=self._verbose))
+
+            for fraud_alert in fraud_alerts:
+                # Se houver uma fraude, publicar no Kafka (com o card_id incluído)
+                if fraud_alert:
+                    self._alert_publisher.publish(fraud_alert)
+
+            last_msg = partition_messages[-1]
+            self._consumer.store_offsets(message=last_msg)
+            self._next_offsets[partition] = last_msg.offset() + 1
+            self._dirty.add(partition)
+            processed += len(partition_messages)
+            if self._metrics is not None:
+                self._metrics.inc("transactions_processed_total", len(partition_messages),
+                                  partition=str(partition))
+                self._metrics.set_gauge("late_events", store.late_events, partition=str(partition))
+
+        self.processed += processed
+        if self._metrics is not None and processed:
+            self._batch_histogram.observe(time.perf_counter() - start)
+        return processed
+
+    def poll_once(self) -> int:
+        if self._batch_size:
+            messages = self._consumer.consume(num_messages=self._batch_size, timeout=self._batch_timeout)
+        else:
+            msg = self._consumer.poll(1.0)
+            messages = [msg] if msg is not None else []
+        if not messages:
+            return 0
+        return self.process_messages(messages)
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        self.subscribe()
+        while stop_event is None or not stop_event.is_set():
+            self.poll_once()
+            if time.monotonic() - self._last_checkpoint >= self._checkpoint_interval:
+                self.checkpoint()
+
+    def close(self) -> dict:
+        """Encerra o consumidor (revogando as partições) e os alertas pendentes"""
+        self._consumer.close()
+        stats = self._alert_publisher.close()
+        print(f"[{self._name}] Alertas: {stats['enqueued']} enviados, {stats['delivered']} entregues, "
+              f"{stats['failed']} falhas")
+        return stats
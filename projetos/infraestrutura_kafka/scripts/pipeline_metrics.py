@@ -0,0 +1,209 @@
+"""
+Métricas do pipeline de transações (producer, workers e publicação de alertas).
+
+As métricas ficam em memória e podem ser expostas de duas formas, ambas opcionais:
+- endpoint HTTP local no formato texto do Prometheus (`serve`), em `/metrics`;
+- linha de resumo periódica no log (`start_reporter`), com taxas e percentis.
+
+O custo no caminho crítico é baixo: contadores são incrementados por lote, histogramas
+têm buckets fixos (uma busca binária por observação), o tempo de cada regra é medido
+apenas em uma amostra das transações e o lag por partição vem das estatísticas que o
+próprio librdkafka publica (`statistics.interval.ms`). Os histogramas são atualizados
+sem lock: em uma corrida rara entre threads, perder uma observação é aceitável.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Limites superiores dos buckets (em segundos) de cada histograma
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RULE_BUCKETS = (1e-7, 2.5e-7, 5e-7, 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 1e-4, 1e-3)
+EVENT_LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600, 7200)
+HISTOGRAM_BUCKETS = {
+    "produce_delivery_latency_seconds": LATENCY_BUCKETS,
+    "alert_delivery_latency_seconds": LATENCY_BUCKETS,
+    "process_batch_seconds": LATENCY_BUCKETS,
+    "rule_duration_seconds": RULE_BUCKETS,
+    "event_to_alert_latency_seconds": EVENT_LATENCY_BUCKETS,
+}
+
+# Uma a cada RULE_SAMPLE_RATE transações tem o tempo de cada regra medido
+RULE_SAMPLE_RATE = 100
+
+# Intervalo (em ms) das estatísticas do librdkafka, usadas para o lag por partição
+KAFKA_STATS_INTERVAL_MS = 5000
+
+
+class Histogram:
+    """Histograma de buckets fixos, no modelo do Prometheus"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # Um contador por bucket, mais o bucket +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float, counts: Optional[list] = None) -> float:
+        """Estimativa do quantil `q` (limite superior do bucket que o contém)"""
+        counts = counts if counts is not None else self.counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        accumulated = 0
+        for bound, count in zip(self.bounds, counts):
+            accumulated += count
+            if accumulated >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_seconds(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value < 1e-3:
+        return f"{value * 1e6:.1f}µs"
+    if value < 1:
+        return f"{value * 1e3:.1f}ms"
+    return f"{value:.1f}s"
+
+
+class PipelineMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._gauges: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        # Valores do último resumo, para calcular taxas e percentis do intervalo
+        self._last_summary = time.monotonic()
+        self._last_counters: dict[tuple[str, tuple], float] = {}
+        self._last_counts: dict[tuple[str, tuple], list] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        self._gauges[(name, _labels_key(labels))] = value
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Retorna o histograma (criando-o se necessário); no caminho crítico, guarde a referência"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(HISTOGRAM_BUCKETS.get(name, LATENCY_BUCKETS))
+            return histogram
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def on_kafka_stats(self, stats_json: str) -> None:
+        """`stats_cb` do librdkafka: lag por partição (consumidor) e fila local (producer)"""
+        stats = json.loads(stats_json)
+        self.set_gauge("kafka_queue_messages", stats.get("msg_cnt", 0))
+        for topic, topic_stats in stats.get("topics", {}).items():
+            for partition, partition_stats in topic_stats.get("partitions", {}).items():
+                lag = partition_stats.get("consumer_lag", -1)
+                # Partição -1 é interna do librdkafka; lag -1 indica partição não consumida aqui
+                if partition != "-1" and lag >= 0:
+                    self.set_gauge("consumer_lag", lag, topic=topic, partition=partition)
+
+    def render(self) -> str:
+        """Métricas no formato texto do Prometheus"""
+        lines = []
+        for (name, labels), value in sorted(list(self._counters.items())):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in sorted(list(self._gauges.items())):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(list(self._histograms.items())):
+            accumulated = 0
+            for bound, count in zip(histogram.bounds + (float("inf"),), list(histogram.counts)):
+                accumulated += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_label = f'le="{le}"'
+                lines.append(f"{name}_bucket{_format_labels(labels, bucket_label)} {accumulated}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Resumo do intervalo desde o último resumo: taxas dos contadores, gauges e p50/p99"""
+        now = time.monotonic()
+        elapsed = max(now - self._last_summary, 1e-9)
+        parts = []
+        for key, value in sorted(list(self._counters.items())):
+            rate = (value - self._last_counters.get(key, 0)) / elapsed
+            self._last_counters[key] = value
+            parts.append(f"{key[0]}{_format_labels(key[1])}={rate:,.0f}/s")
+        for (name, labels), value in sorted(list(self._gauges.items())):
+            parts.append(f"{name}{_format_labels(labels)}={value:,.0f}")
+        for key, histogram in sorted(list(self._histograms.items())):
+            counts = list(histogram.counts)
+            previous = self._last_counts.get(key, [0] * len(counts))
+            interval = [current - before for current, before in zip(counts, previous)]
+            self._last_counts[key] = counts
+            if any(interval):
+                parts.append(f"{key[0]}{_format_labels(key[1])} p50={_format_seconds(histogram.quantile(0.5, interval))}"
+                             f" p99={_format_seconds(histogram.quantile(0.99, interval))}")
+        self._last_summary = now
+        return f"[{self.name}] " + " | ".join(parts)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Expõe as métricas em http://host:port/metrics, em uma thread em segundo plano"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"[{self.name}] Métricas em http://{host}:{port}/metrics")
+        return server
+
+    def start_reporter(self, interval: float, stop_event: Optional[threading.Event] = None) -> threading.Thread:
+        """Imprime o resumo das métricas a cada `interval` segundos"""
+        stop_event = stop_event or threading.Event()
+
+        def report():
+            while not stop_event.wait(interval):
+                print(self.summary())
+
+        thread = threading.Thread(target=report, daemon=True)
+        thread.start()
+        return thread
@@ -1,15 +1,33 @@
+import argparse
 import queue
 import random
 import threading
 import time
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Optional
-import json
+import numpy as np
 from confluent_kafka import Producer, KafkaException, KafkaError
 
+from fraud_detection import FraudStateStore, check_fraud
+from pipeline_metrics import KAFKA_STATS_INTERVAL_MS, PipelineMetrics
+from serializers import serializer_for_topic
+
 BROKERS = "kafka-broker-1:9092,kafka-broker-2:9092,kafka-broker-3:9092"
 TOPIC = "transaction"
 
+# Rótulos do dataset: tipo de fraude que a transação deve disparar (0 = transação válida)
+LABEL_VALID, LABEL_HIGH_FREQUENCY, LABEL_HIGH_VALUE, LABEL_DIFFERENT_COUNTRY = range(4)
+FRAUD_LABELS = {
+    LABEL_HIGH_FREQUENCY: "Alta Frequência",
+    LABEL_HIGH_VALUE: "Alto Valor",
+    LABEL_DIFFERENT_COUNTRY: "Outro País",
+}
+
+# Relógio fixo dos datasets, para que a mesma semente gere sempre o mesmo arquivo
+DATASET_START_TIMESTAMP = 1_700_000_000
+DATASET_COLUMNS = ("timestamp", "transaction_id", "user_id", "card_id", "site_id", "value",
+                   "location_id", "country_idx", "label")
+
 @dataclass
 class Transaction:
     timestamp: int
@@ -129,6 +147,122 @@ class TransactionGenerator:
                 time.sleep(random.uniform(delay, delay * 3))
                 self._transactions_queue.put(tx)
 
+    def _high_frequency_columns(self, rng: np.random.Generator, n_patterns: int, now: int) -> dict:
+        # 2 a 4 transações do mesmo usuário/cartão com menos de 5 minutos de diferença
+        lengths = rng.integers(2, 5, n_patterns)
+        step = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return {
+            "lengths": lengths,
+            "timestamp": now - 600 + step * rng.integers(30, 101, lengths.sum()),
+            "user_id": np.repeat(rng.integers(21000, 30000, n_patterns), lengths),
+            "card_id": np.repeat(rng.integers(100000, 1000000, n_patterns), lengths),
+            "value": np.round(rng.uniform(1.0, 1000.0, lengths.sum()), 2),
+            # A partir da segunda transação, todas devem ser detectadas
+            "label": np.where(step > 0, LABEL_HIGH_FREQUENCY, LABEL_VALID),
+        }
+
+    def _high_value_columns(self, rng: np.random.Generator, n_patterns: int, now: int) -> dict:
+        # 1 a 10 transações com intervalos de 6 a 10 minutos, seguidas de uma acima do dobro do maior valor
+        previous = rng.integers(1, 11, n_patterns)
+        lengths = previous + 1
+        total = lengths.sum()
+        starts = np.cumsum(lengths) - lengths
+        step = np.arange(total) - np.repeat(starts, lengths)
+        is_last = step == np.repeat(previous, lengths)
+        value = np.round(rng.uniform(1.0, 1000.0, total), 2)
+        max_previous = np.maximum.reduceat(np.where(is_last, 0.0, value), starts)
+        value[is_last] = np.round(max_previous * rng.uniform(2.1, 5.0, n_patterns), 2)
+        timestamp = now - 3600 + step * rng.integers(360, 601, total)
+        # A última transação acontece 1 hora após o início do padrão
+        timestamp[is_last] = now
+        return {
+            "lengths": lengths,
+            "timestamp": timestamp,
+            "user_id": np.repeat(rng.integers(31000, 40000, n_patterns), lengths),
+            "card_id": np.repeat(rng.integers(100000, 1000000, n_patterns), lengths),
+            "value": value,
+            "label": np.where(is_last, LABEL_HIGH_VALUE, LABEL_VALID),
+        }
+
+    def _different_country_columns(self, rng: np.random.Generator, n_patterns: int, now: int) -> dict:
+        # 2 transações com 6 a 10 minutos de diferença, a segunda em outro país
+        lengths = np.full(n_patterns, 2)
+        user_id = rng.integers(41000, 50000, n_patterns)
+        first_ts = np.full(n_patterns, now - 600)
+        countries = len(self._COUNTRIES)
+        first_country = rng.integers(11000, 20000, n_patterns) % countries
+        # Deslocamento de 1 a countries - 1: o segundo país nunca é igual ao primeiro
+        second_country = (first_country + rng.integers(1, countries, n_patterns)) % countries
+        return {
+            "lengths": lengths,
+            "timestamp": np.column_stack([first_ts, first_ts + rng.integers(360, 601, n_patterns)]).ravel(),
+            "user_id": np.repeat(user_id, 2),
+            "card_id": np.repeat(rng.integers(100000, 1000000, n_patterns), 2),
+            "value": np.round(rng.uniform(1.0, 1000.0, 2 * n_patterns), 2),
+            "country_idx": np.column_stack([first_country, second_country]).ravel(),
+            "label": np.tile([LABEL_VALID, LABEL_DIFFERENT_COUNTRY], n_patterns),
+        }
+
+    def generate_columns(self, batch_size: int, rng: Optional[np.random.Generator] = None,
+                         now: Optional[int] = None, span: int = 0) -> dict[str, np.ndarray]:
+        """
+        Gera um lote de transações de forma vetorizada, com NumPy, em colunas.
+
+        Mantém a mesma proporção de fraudes do modo com threads: cada tipo de fraude gera,
+        em média, uma transação a cada `2 * fraudulent_transactions_freq` transações válidas.
+        As transações de um mesmo padrão de fraude aparecem em ordem dentro do lote, e a
+        coluna `label` indica o tipo de fraude que cada transação deve disparar.
+
+        Com `span` > 0, o lote cobre os `span` segundos anteriores a `now`, em ordem de
+        tempo, como se as transações tivessem sido geradas continuamente.
+        """
+        rng = rng or np.random.default_rng()
+        now = int(time.time()) if now is None else now
+        countries = len(self._COUNTRIES)
+        fraud_share = 1 / (2 * self._fraudulent_transactions_freq)
+        n_valid = max(1, int(batch_size / (1 + 3 * fraud_share)))
+        # Tamanho médio dos padrões: 3 (alta frequência), 6,5 (alto valor) e 2 (outro país)
+        patterns = [
+            self._high_frequency_columns(rng, rng.poisson(n_valid * fraud_share / 3), now),
+            self._high_value_columns(rng, rng.poisson(n_valid * fraud_share / 6.5), now),
+            self._different_country_columns(rng, rng.poisson(n_valid * fraud_share / 2), now),
+        ]
+
+        # Chave de ordenação: posição no intervalo do lote para as válidas e crescente
+        # dentro de cada padrão de fraude
+        valid_keys = np.sort(rng.random(n_valid))
+        valid_user_id = rng.integers(11000, 20000, n_valid)
+        columns = {
+            "timestamp": [now - 600 - span + (valid_keys * span).astype(np.int64)],
+            "user_id": [valid_user_id],
+            "card_id": [rng.integers(100000, 1000000, n_valid)],
+            "value": [np.round(rng.uniform(1.0, 1000.0, n_valid), 2)],
+            "country_idx": [valid_user_id % countries],
+            "label": [np.full(n_valid, LABEL_VALID)],
+        }
+        sort_keys = [valid_keys]
+        for pattern in patterns:
+            lengths = pattern.pop("lengths")
+            pattern.setdefault("country_idx", pattern["user_id"] % countries)
+            pattern_keys = np.repeat(rng.random(len(lengths)), lengths)
+            pattern["timestamp"] = pattern["timestamp"] + ((pattern_keys - 1) * span).astype(np.int64)
+            for name, values in pattern.items():
+                columns[name].append(values)
+            step = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            sort_keys.append(pattern_keys + step * 1e-9)
+
+        order = np.argsort(np.concatenate(sort_keys), kind="stable")
+        merged = {name: np.concatenate(values)[order] for name, values in columns.items()}
+        total = len(order)
+        merged["transaction_id"] = rng.integers(100000, 1000000, total)
+        merged["site_id"] = rng.integers(1000, 10000, total)
+        merged["location_id"] = rng.integers(1, 101, total)
+        return merged
+
+    def generate_batch(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> list[dict]:
+        """Gera um lote de transações de forma vetorizada (ver `generate_columns`)"""
+        return columns_to_transactions(self.generate_columns(batch_size, rng), self._COUNTRIES)
+
     def generate_transactions(self):
         # Transação válidas
         threading.Thread(target=self.valid_transactions_thread,
@@ -155,6 +289,31 @@ class TransactionGenerator:
             yield transaction
             self._transactions_queue.task_done()
 
+def columns_to_transactions(columns: dict[str, np.ndarray], countries: list[str]) -> list[dict]:
+    """Converte as colunas de um lote em transações no formato enviado ao Kafka"""
+    return [
+        {
+            "timestamp": timestamp,
+            "transaction_id": transaction_id,
+            "user_id": user_id,
+            "card_id": card_id,
+            "site_id": site_id,
+            "value": value,
+            "location_id": location_id,
+            "country": countries[country_idx],
+        }
+        for timestamp, transaction_id, user_id, card_id, site_id, value, location_id, country_idx in zip(
+            columns["timestamp"].tolist(),
+            columns["transaction_id"].tolist(),
+            columns["user_id"].tolist(),
+            columns["card_id"].tolist(),
+            columns["site_id"].tolist(),
+            columns["value"].tolist(),
+            columns["location_id"].tolist(),
+            columns["country_idx"].tolist(),
+        )
+    ]
+
 producer_config = {
     'bootstrap.servers': BROKERS,
     'acks': 'all',
@@ -164,18 +323,47 @@ producer_config = {
     'compression.type': 'gzip',
 }
 
-producer = Producer(producer_config)
+# Ajustes para o modo de teste de carga: lotes maiores, compressão mais leve e fila local ampla
+load_test_producer_config = {
+    **producer_config,
+    'batch.size': 1_000_000,
+    'linger.ms': 20,
+    'compression.type': 'lz4',
+    'queue.buffering.max.messages': 1_000_000,
+}
+
+# Métricas do producer: taxa de envio, latência de entrega (callbacks do librdkafka) e fila local
+metrics = PipelineMetrics("producer")
+delivery_latency = metrics.histogram("produce_delivery_latency_seconds")
+stats_config = {
+    'statistics.interval.ms': KAFKA_STATS_INTERVAL_MS,
+    'stats_cb': metrics.on_kafka_stats,
+}
+
+producer = Producer({**producer_config, **stats_config})
+
+# Serializador definido para o tópico em serializers.TOPIC_FORMATS (JSON ou binário)
+serializer = serializer_for_topic(TOPIC)
+
+def on_delivery(err, msg):
+    if err is not None:
+        metrics.inc("produce_failures_total")
+        return
+    latency = msg.latency()
+    if latency is not None:
+        delivery_latency.observe(latency)
 
 def send_transaction_to_kafka(transaction: Transaction):
-    tx_dict = asdict(transaction)
-    tx_json = json.dumps(tx_dict)
+    tx_value = serializer.encode(transaction)
 
     try:
         producer.produce(
             TOPIC,
             key=str(transaction.user_id),  # Envia o user_id como chave para garantir ordenação dentro da mesma partição do tópico
-            value=tx_json
+            value=tx_value,
+            on_delivery=on_delivery
         )
+        metrics.inc("transactions_produced_total")
         producer.flush()
 
     except KafkaException as e:
@@ -187,13 +375,203 @@ def send_transaction_to_kafka(transaction: Transaction):
     except Exception as e:
         print(f"Unexpected error occurred: {e}")
 
-if __name__ == "__main__":
-    transaction_generator = TransactionGenerator(trans_per_sec=10)
-    count = 0
+class TokenBucket:
+    """
+    Controla a taxa de envio: `acquire(n)` bloqueia até haver `n` tokens disponíveis.
+    Pedidos maiores que a capacidade são atendidos quando o balde enche e deixam saldo negativo.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self._rate = rate
+        self._capacity = capacity or rate
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+
+    def acquire(self, n: int) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            needed = min(n, self._capacity)
+            if self._tokens >= needed:
+                self._tokens -= n
+                return
+            time.sleep((needed - self._tokens) / self._rate)
+
+def send_batches(batches, rate: int, batch_size: int, duration: Optional[float] = None) -> None:
+    """Envia lotes de transações sem flush por mensagem, na taxa `rate` msgs/s"""
+    load_producer = Producer({**load_test_producer_config, **stats_config})
+    bucket = TokenBucket(rate, capacity=batch_size)
+    failures = 0
+
+    def on_batch_delivery(err, msg):
+        nonlocal failures
+        if err is not None:
+            failures += 1
+        on_delivery(err, msg)
+
+    sent = 0
+    start = last_report = time.monotonic()
+    last_sent = 0
     try:
-        for tx in transaction_generator.generate_transactions():
-            count += 1
-            send_transaction_to_kafka(tx)
-            print(f"Transaction {tx} sent to Kafka.")
+        for batch in batches:
+            if duration is not None and time.monotonic() - start >= duration:
+                break
+            bucket.acquire(len(batch))
+            for tx in batch:
+                value = serializer.encode(tx)
+                while True:
+                    try:
+                        load_producer.produce(TOPIC, key=str(tx["user_id"]), value=value,
+                                              on_delivery=on_batch_delivery)
+                        break
+                    except BufferError:
+                        # Fila local cheia: aguarda entregas antes de continuar
+                        load_producer.poll(0.05)
+            sent += len(batch)
+            metrics.inc("transactions_produced_total", len(batch))
+            load_producer.poll(0)
+
+            now = time.monotonic()
+            if now - last_report >= 1:
+                print(f"{(sent - last_sent) / (now - last_report):,.0f} msgs/s | total: {sent:,} | "
+                      f"na fila: {len(load_producer):,} | falhas: {failures:,}")
+                last_report, last_sent = now, sent
     except KeyboardInterrupt:
-        print(f"{count} messages generated.")
\ No newline at end of file
+        pass
+    finally:
+        elapsed = time.monotonic() - start
+        remaining = load_producer.flush(30)
+        print(f"{sent:,} mensagens em {elapsed:.1f}s ({sent / elapsed:,.0f} msgs/s) | "
+              f"falhas: {failures:,} | não entregues: {remaining:,}")
+
+def run_load_test(rate: int, batch_size: int, duration: Optional[float],
+                  fraudulent_transactions_freq: int = 10) -> None:
+    """Gera transações em lotes vetorizados e as envia sem flush por mensagem, na taxa `rate` msgs/s"""
+    generator = TransactionGenerator(fraudulent_transactions_freq=fraudulent_transactions_freq)
+    rng = np.random.default_rng()
+
+    def batches():
+        while True:
+            yield generator.generate_batch(batch_size, rng)
+
+    send_batches(batches(), rate, batch_size, duration)
+
+def write_dataset(path: str, size: int, seed: int, batch_size: int = 10_000, trans_per_sec: int = 10,
+                  fraudulent_transactions_freq: int = 10) -> None:
+    """
+    Grava um dataset reprodutível: `size` transações geradas a partir de `seed`, com o
+    rótulo de fraude esperado de cada uma, em um arquivo NumPy compactado (.npz).
+
+    O relógio dos eventos começa em `DATASET_START_TIMESTAMP` e avança `trans_per_sec`
+    transações por segundo, então a mesma semente gera sempre o mesmo arquivo.
+    """
+    generator = TransactionGenerator(trans_per_sec=trans_per_sec,
+                                     fraudulent_transactions_freq=fraudulent_transactions_freq)
+    rng = np.random.default_rng(seed)
+    span = max(1, round(batch_size / trans_per_sec))
+    now = DATASET_START_TIMESTAMP
+    chunks = []
+    total = 0
+    while total < size:
+        now += span
+        columns = generator.generate_columns(batch_size, rng, now=now, span=span)
+        chunks.append(columns)
+        total += len(columns["timestamp"])
+
+    dataset = {name: np.concatenate([chunk[name] for chunk in chunks])[:size] for name in DATASET_COLUMNS}
+    dataset["country_idx"] = dataset["country_idx"].astype(np.uint8)
+    dataset["label"] = dataset["label"].astype(np.uint8)
+    np.savez_compressed(path, countries=np.array(TransactionGenerator._COUNTRIES), seed=seed, **dataset)
+
+    labels = dataset["label"]
+    frauds = ", ".join(f"{name}: {np.count_nonzero(labels == label):,}" for label, name in FRAUD_LABELS.items())
+    print(f"Dataset {path} gravado: {size:,} transações (seed {seed}) | fraudes esperadas: {frauds}")
+
+def read_dataset(path: str) -> tuple[dict[str, np.ndarray], list[str]]:
+    with np.load(path) as data:
+        return {name: data[name] for name in DATASET_COLUMNS}, data["countries"].tolist()
+
+def dataset_batches(columns: dict[str, np.ndarray], countries: list[str], batch_size: int):
+    for begin in range(0, len(columns["timestamp"]), batch_size):
+        chunk = {name: values[begin:begin + batch_size] for name, values in columns.items()}
+        yield columns_to_transactions(chunk, countries)
+
+def replay_to_detector(columns: dict[str, np.ndarray], countries: list[str], rate: int, batch_size: int) -> None:
+    """
+    Reproduz o dataset diretamente no `check_fraud` (sem Kafka) e compara os alertas com
+    os rótulos esperados, reportando a vazão, a precisão e o recall do detector.
+    """
+    store = FraudStateStore()
+    bucket = TokenBucket(rate, capacity=batch_size) if rate else None
+    flagged = np.zeros(len(columns["label"]), dtype=bool)
+    position = 0
+    start = time.perf_counter()
+    for batch in dataset_batches(columns, countries, batch_size):
+        if bucket:
+            bucket.acquire(len(batch))
+        for tx in batch:
+            flagged[position] = check_fraud(store, tx, verbose=False) is not None
+            position += 1
+    elapsed = time.perf_counter() - start
+
+    expected = columns["label"] != LABEL_VALID
+    true_positives = np.count_nonzero(flagged & expected)
+    precision = true_positives / max(1, np.count_nonzero(flagged))
+    recall = true_positives / max(1, np.count_nonzero(expected))
+    print(f"{position:,} transações em {elapsed:.2f}s ({position / elapsed:,.0f} msgs/s)")
+    print(f"Alertas: {np.count_nonzero(flagged):,} | precisão: {precision:.2%} | recall: {recall:.2%}")
+    for label, name in FRAUD_LABELS.items():
+        of_type = columns["label"] == label
+        print(f"  {name}: {np.count_nonzero(flagged & of_type):,} de {np.count_nonzero(of_type):,} detectadas")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerador de transações para o tópico transaction")
+    parser.add_argument("--load-test", action="store_true",
+                        help="Modo de teste de carga: lotes vetorizados, sem flush por mensagem")
+    parser.add_argument("--rate", type=int, default=100_000,
+                        help="Taxa alvo do teste de carga e do replay (msgs/s; 0 = sem limite no replay para o detector)")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Transações geradas por lote")
+    parser.add_argument("--duration", type=float, default=None, help="Duração do teste de carga (s)")
+    parser.add_argument("--write-dataset", metavar="ARQUIVO",
+                        help="Grava um dataset reprodutível (.npz) com os rótulos de fraude esperados")
+    parser.add_argument("--size", type=int, default=1_000_000, help="Transações do dataset")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do dataset")
+    parser.add_argument("--replay", metavar="ARQUIVO", help="Reproduz um dataset gravado com --write-dataset")
+    parser.add_argument("--target", choices=["kafka", "detector"], default="kafka",
+                        help="Destino do replay: o tópico transaction ou o check_fraud local")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Expõe as métricas em http://127.0.0.1:PORTA/metrics (formato Prometheus)")
+    parser.add_argument("--stats-interval", type=float, default=60.0,
+                        help="Intervalo, em segundos, do resumo das métricas no log; 0 desativa")
+    args = parser.parse_args()
+    # O TokenBucket precisa de uma taxa positiva; só o replay para o detector aceita 0 (sem limite)
+    unlimited_allowed = args.replay and args.target == "detector"
+    if args.rate < 0 or (args.rate == 0 and not unlimited_allowed and (args.load_test or args.replay)):
+        parser.error("--rate deve ser positivo (0 só é aceito com --replay --target detector)")
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.stats_interval > 0:
+        metrics.start_reporter(args.stats_interval)
+
+    if args.write_dataset:
+        write_dataset(args.write_dataset, args.size, args.seed, args.batch_size)
+    elif args.replay:
+        columns, countries = read_dataset(args.replay)
+        if args.target == "detector":
+            replay_to_detector(columns, countries, args.rate, args.batch_size)
+        else:
+            send_batches(dataset_batches(columns, countries, args.batch_size), args.rate, args.batch_size)
+    elif args.load_test:
+        run_load_test(args.rate, args.batch_size, args.duration)
+    else:
+        transaction_generator = TransactionGenerator(trans_per_sec=10)
+        count = 0
+        try:
+            for tx in transaction_generator.generate_transactions():
+                count += 1
+                send_transaction_to_kafka(tx)
+                print(f"Transaction {tx} sent to Kafka.")
+        except KeyboardInterrupt:
+            print(f"{count} messages generated.")
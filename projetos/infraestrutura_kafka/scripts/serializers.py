@@ -0,0 +1,159 @@
+"""
+Camada de serialização das mensagens de transação e de alerta.
+
+Formatos disponíveis:
+- `json`: usa o orjson quando instalado e a biblioteca padrão `json` como alternativa;
+- `binary`: registro de largura fixa (struct) para o schema de `Transaction`, bem mais
+  compacto e rápido que JSON. Registros que não se encaixam no schema (ex.: campos
+  inteiros com valores não inteiros) são gravados em JSON, e a decodificação identifica
+  o formato de cada mensagem pelo primeiro byte.
+
+O formato de cada tópico é definido em `TOPIC_FORMATS`; producer e consumer usam a mesma
+configuração. Os alertas continuam em JSON, pois são lidos pelo Kafka Connect.
+"""
+import json
+import struct
+from dataclasses import asdict, is_dataclass
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Formato de serialização por tópico ("json" ou "binary")
+TOPIC_FORMATS = {
+    "transaction": "json",
+    "fraudulent-transaction": "json",
+}
+
+TRANSACTION_FIELDS = ("timestamp", "transaction_id", "user_id", "card_id", "site_id", "value",
+                      "location_id", "country")
+# magic, timestamp, transaction_id, user_id, card_id, site_id, value, location_id, tamanho do país
+BINARY_MAGIC = 0xB1
+BINARY_RECORD = struct.Struct("<BqqqqqdqB")
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _as_dict(record) -> dict:
+    if isinstance(record, dict):
+        return record
+    if is_dataclass(record):
+        # Para dataclasses planas, vars() equivale a asdict() sem a cópia profunda
+        return vars(record) if hasattr(record, "__dict__") else asdict(record)
+    raise TypeError(f"Registro não serializável: {type(record).__name__}")
+
+
+class JsonSerializer:
+    name = "json"
+
+    def __init__(self, use_orjson: bool = True):
+        self.backend = "orjson" if (use_orjson and orjson is not None) else "json"
+        if self.backend == "orjson":
+            self._dumps = orjson.dumps
+            self._loads = orjson.loads
+        else:
+            self._dumps = lambda record: json.dumps(record).encode("utf-8")
+            self._loads = json.loads
+
+    def encode(self, record) -> bytes:
+        if self.backend == "orjson":
+            # O orjson serializa dataclasses diretamente
+            return self._dumps(record)
+        return self._dumps(_as_dict(record))
+
+    def decode(self, value: bytes):
+        return self._loads(value)
+
+    def decode_many(self, values: list[bytes]) -> list:
+        """
+        Decodifica um lote com uma única chamada ao parser; se alguma mensagem estiver
+        malformada, decodifica uma a uma e descarta as inválidas. Tombstones (valor None)
+        são ignorados.
+        """
+        values = [value for value in values if value is not None]
+        if not values:
+            return []
+        try:
+            result = self._loads(b"[" + b",".join(values) + b"]")
+            # Uma mensagem como b'{"a":1},{"b":2}' viraria dois itens: a contagem não bateria
+            if len(result) == len(values):
+                return result
+        except ValueError:
+            pass
+        decoded = []
+        for value in values:
+            try:
+                decoded.append(self._loads(value))
+            except ValueError:
+                print(f"Mensagem inválida descartada: {value[:100]!r}")
+        return decoded
+
+
+class BinaryTransactionSerializer:
+    """Registro de largura fixa para `Transaction`, com JSON como alternativa por mensagem"""
+    name = "binary"
+
+    def __init__(self, fallback: Optional[JsonSerializer] = None):
+        self._fallback = fallback or JsonSerializer()
+        self.backend = f"struct+{self._fallback.backend}"
+
+    def encode(self, record) -> bytes:
+        tx = _as_dict(record)
+        try:
+            ints = (tx["timestamp"], tx["transaction_id"], tx["user_id"], tx["card_id"], tx["site_id"],
+                    tx["location_id"])
+            country = tx["country"].encode("utf-8")
+            if (len(tx) == len(TRANSACTION_FIELDS) and len(country) <= 255
+                    and all(type(v) is int and INT64_MIN <= v <= INT64_MAX for v in ints)
+                    and type(tx["value"]) is float):
+                return BINARY_RECORD.pack(BINARY_MAGIC, ints[0], ints[1], ints[2], ints[3], ints[4],
+                                          tx["value"], ints[5], len(country)) + country
+        except (KeyError, AttributeError):
+            pass
+        return self._fallback.encode(tx)
+
+    def decode(self, value: bytes):
+        if not value or value[0] != BINARY_MAGIC:
+            return self._fallback.decode(value)
+        (_, timestamp, transaction_id, user_id, card_id, site_id, tx_value, location_id,
+         country_len) = BINARY_RECORD.unpack_from(value)
+        return {
+            "timestamp": timestamp,
+            "transaction_id": transaction_id,
+            "user_id": user_id,
+            "card_id": card_id,
+            "site_id": site_id,
+            "value": tx_value,
+            "location_id": location_id,
+            "country": value[BINARY_RECORD.size:BINARY_RECORD.size + country_len].decode("utf-8"),
+        }
+
+    def decode_many(self, values: list[bytes]) -> list:
+        decoded = []
+        for value in values:
+            if value is None:
+                continue
+            try:
+                decoded.append(self.decode(value))
+            except (ValueError, struct.error):
+                print(f"Mensagem inválida descartada: {value[:100]!r}")
+        return decoded
+
+
+_SERIALIZERS = {
+    "json": JsonSerializer,
+    "binary": BinaryTransactionSerializer,
+}
+
+
+def get_serializer(format_name: str):
+    try:
+        return _SERIALIZERS[format_name]()
+    except KeyError:
+        raise ValueError(f"Formato de serialização desconhecido: {format_name}") from None
+
+
+def serializer_for_topic(topic: str):
+    """Serializador configurado para o tópico em `TOPIC_FORMATS` (JSON por padrão)"""
+    return get_serializer(TOPIC_FORMATS.get(topic, "json"))
@@ -0,0 +1,114 @@
+"""
+Simulação local dos workers do detector de fraudes com rebalanceamentos.
+
+Publica transações sintéticas em um broker em memória (`fake_kafka.py`), executa
+FraudWorkers em threads no mesmo consumer group e força rebalanceamentos (entrada e
+saída de workers) e um reinício completo, que restaura o estado dos checkpoints, durante
+o processamento. Ao final, compara os alertas publicados com os de uma execução de
+referência sem rebalanceamento: não pode haver alertas duplicados nem perdidos.
+
+Uso: python simulate_rebalance.py --transactions 200000 --workers 3
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from alert_publisher import AlertPublisher
+from benchmark_fraud_state import synthetic_transactions
+from fake_kafka import FakeBroker, FakeConsumer, FakeProducer
+from fraud_detection import FraudStateStore, check_fraud
+from fraud_worker import FraudWorker
+
+INPUT_TOPIC = "transaction"
+OUTPUT_TOPIC = "fraudulent-transaction"
+GROUP_CONFIG = {'group.id': 'consumers', 'enable.auto.commit': False}
+
+
+def expected_alerts(broker):
+    """Referência: cada partição processada do início ao fim por um único store"""
+    alerts = Counter()
+    for partition in broker.topics[INPUT_TOPIC]:
+        store = FraudStateStore()
+        for msg in partition:
+            fraud_alert = check_fraud(store, json.loads(msg.value()), verbose=False)
+            if fraud_alert:
+                alerts[json.dumps(fraud_alert, sort_keys=True)] += 1
+    return alerts
+
+
+class WorkerThread:
+    def __init__(self, broker, name, checkpoint_dir, batch_size, checkpoint_interval=0.2):
+        self.stop_event = threading.Event()
+        publisher = AlertPublisher(FakeProducer(broker), OUTPUT_TOPIC).start()
+        self.worker = FraudWorker(FakeConsumer(broker, GROUP_CONFIG), publisher, INPUT_TOPIC,
+                                  checkpoint_dir=checkpoint_dir, checkpoint_interval=checkpoint_interval,
+                                  batch_size=batch_size, name=name, verbose=False)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.worker.run(self.stop_event)
+        finally:
+            self.worker.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def all_committed(broker):
+    with broker.lock:
+        return all(broker.committed.get((GROUP_CONFIG['group.id'], INPUT_TOPIC, p), 0) == len(partition)
+                   for p, partition in enumerate(broker.topics[INPUT_TOPIC]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    broker = FakeBroker(num_partitions=args.partitions)
+    for tx in synthetic_transactions(args.transactions):
+        broker.append(INPUT_TOPIC, key=str(tx["user_id"]), value=json.dumps(tx))
+    expected = expected_alerts(broker)
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        start = time.perf_counter()
+        workers = [WorkerThread(broker, f"worker-{i}", checkpoint_dir, args.batch_size)
+                   for i in range(args.workers)]
+        # Força rebalanceamentos: um worker entra e, em seguida, o primeiro sai
+        time.sleep(0.5)
+        workers.append(WorkerThread(broker, f"worker-{args.workers}", checkpoint_dir, args.batch_size))
+        time.sleep(0.5)
+        workers.pop(0).stop()
+        time.sleep(0.5)
+
+        # Reinício: todos os workers param e novos workers retomam a partir dos checkpoints
+        for worker in workers:
+            worker.stop()
+        workers = [WorkerThread(broker, f"worker-{i}-restart", checkpoint_dir, args.batch_size)
+                   for i in range(args.workers)]
+
+        while not all_committed(broker):
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        for worker in workers:
+            worker.stop()
+
+    published = Counter(json.dumps(json.loads(msg.value()), sort_keys=True)
+                        for msg in broker.messages(OUTPUT_TOPIC))
+    duplicated = sum((published - expected).values())
+    lost = sum((expected - published).values())
+    print(f"{args.transactions:,} transações em {elapsed:.2f}s | alertas esperados: {sum(expected.values()):,} | "
+          f"publicados: {sum(published.values()):,} | duplicados: {duplicated} | perdidos: {lost}")
+
+
+if __name__ == "__main__":
+    main()